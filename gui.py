@@ -52,7 +52,8 @@ DEFAULT_SETTINGS = {
     "typo_merge_lines": True,
     "typo_keep_leading_dashes": False,
     "typo_remove_all_empty": False,
-    "typo_deyo": False
+    "typo_deyo": False,
+    "yorz_jobs": 1
 }
 
 def load_settings():
@@ -528,6 +529,28 @@ class App(ctk.CTk):
             self.typo_checkboxes.append(cb)
             self.tooltips.append(ToolTip(cb, tooltip_text))
 
+        # Настройки Ёфикатора
+        yorz_settings_row = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
+        yorz_settings_row.pack(anchor="w", pady=(0, 20))
+
+        ctk.CTkLabel(yorz_settings_row, text="Процессов для ёфикации:", font=self.bold_font).pack(side="left", padx=(0, 20))
+
+        self.jobs_map = {"1": 1, "2": 2, "4": 4, "8": 8, "По числу ядер": 0}
+        self.reverse_jobs_map = {v: k for k, v in self.jobs_map.items()}
+
+        self.jobs_optionmenu = ctk.CTkOptionMenu(
+            yorz_settings_row,
+            values=list(self.jobs_map.keys()),
+            font=self.bold_font,
+            dropdown_font=self.bold_font,
+            command=self.change_jobs
+        )
+        self.jobs_optionmenu.set(self.reverse_jobs_map.get(SETTINGS.get("yorz_jobs", 1), str(SETTINGS.get("yorz_jobs", 1))))
+        self.jobs_optionmenu.pack(side="left")
+        self.tooltips.append(ToolTip(self.jobs_optionmenu, "Синий, зелёный и жёлтый словари применяются к абзацам параллельно в нескольких процессах; "
+                                                           "вопросы об омографах задаются по-прежнему по ходу текста.\nРезультат не зависит от числа процессов, "
+                                                           "ускорение заметно на больших книгах и многоядерных процессорах."))
+
         # Выбор темы
         theme_settings_row = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
         theme_settings_row.pack(anchor="w", pady=10)
@@ -722,6 +745,8 @@ class App(ctk.CTk):
         # Обновляем выпадающие списки (OptionMenus)
         if hasattr(self, "theme_optionmenu"):
             self.theme_optionmenu.configure(fg_color=colors["primary"], button_color=colors["button_color"], button_hover_color=colors["button_hover"], text_color=colors["text"])
+        if hasattr(self, "jobs_optionmenu"):
+            self.jobs_optionmenu.configure(fg_color=colors["primary"], button_color=colors["button_color"], button_hover_color=colors["button_hover"], text_color=colors["text"])
         if hasattr(self, "font_family_dropdown"):
             self.font_family_dropdown.configure(fg_color=colors["primary"], button_color=colors["button_color"], button_hover_color=colors["button_hover"], text_color=colors["text"])
         if hasattr(self, "font_style_dropdown"):
@@ -881,6 +906,10 @@ class App(ctk.CTk):
         else:
             self.alpha_frame.pack_forget()
 
+    def change_jobs(self, choice):
+        SETTINGS["yorz_jobs"] = self.jobs_map[choice]
+        save_settings(SETTINGS)
+
     def save_typo_settings(self):
         for key, var in self.typo_vars.items():
             SETTINGS[key] = var.get()
@@ -1195,7 +1224,7 @@ class App(ctk.CTk):
             f = filepath if filepath not in ("Файл не выбран", "Выбор файла не требуется") else ""
 
             if tool_id == "yorz":
-                yorz.run(input_file=f if f else "book.txt", app_version=APP_VERSION)
+                yorz.run(input_file=f if f else "book.txt", app_version=APP_VERSION, jobs=SETTINGS.get("yorz_jobs", 1))
             elif tool_id == "typographer":
                 options = {
                     'zwnbsp': SETTINGS.get('typo_zwnbsp', True),
@@ -1305,5 +1334,8 @@ class App(ctk.CTk):
         self.input_event.set()
 
 if __name__ == "__main__":
+    # Нужно для пула процессов (параллельная ёфикация) в собранном exe
+    import multiprocessing
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
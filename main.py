@@ -78,7 +78,11 @@ def main():
             print(f"\n{Fore.CYAN}--- Запуск Ёфикации ---{Style.RESET_ALL}")
             filename = input("Введите имя файла (по умолчанию book.txt): ").strip()
             if not filename: filename = "book.txt"
-            yorz.run(input_file=filename)
+            mode = input("Омографы: 1 - по ходу текста (по умолчанию), 2 - группами после сбора всех вхождений, "
+                         "3 - отложить для проверки, 4 - проверить отложенные: ").strip()
+            jobs = input("Число процессов (по умолчанию 1, 0 - по числу ядер): ").strip()
+            jobs = int(jobs) if jobs.isdigit() else 1
+            yorz.run(input_file=filename, orange_mode={'2': "grouped", '3': "defer", '4': "review"}.get(mode, "interactive"), jobs=jobs)
             print(f"{Fore.YELLOW}Результат сохранён в {os.path.splitext(filename)[0]}_yo.html{Style.RESET_ALL}")
             
         elif choice == '7':
@@ -106,6 +110,13 @@ def main():
             print(f"{Fore.RED}Неверный выбор. Пожалуйста, введите число от 0 до 7.{Style.RESET_ALL}")
 
 if __name__ == "__main__":
+    # Нужно для пула процессов (параллельная ёфикация) в собранном exe
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # С аргументами (python main.py yorz книги/ --jobs 4) работает пакетный режим без меню
+    if len(sys.argv) > 1:
+        from modules import cli
+        sys.exit(cli.main())
     try:
         main()
     except KeyboardInterrupt:
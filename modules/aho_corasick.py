@@ -0,0 +1,64 @@
+class AhoCorasick:
+    """
+    Автомат Ахо-Корасик для одновременного поиска множества подстрок.
+    Каждой добавленной подстроке сопоставляется произвольное значение;
+    find_all() за один проход по тексту возвращает значения всех найденных подстрок.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, needle, value):
+        """Добавляет подстроку needle со значением value (до вызова build)."""
+        node = 0
+        for ch in needle:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+        self._built = False
+
+    def build(self):
+        """Строит ссылки неудач (обход в ширину) и сливает выходы по цепочкам ссылок."""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = candidate if candidate != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def find_all(self, text):
+        """Возвращает множество значений всех подстрок, встречающихся в text."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def __bool__(self):
+        return len(self._goto) > 1
@@ -0,0 +1,419 @@
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import datetime
+import platform
+from colorama import Fore, Style
+from . import paths
+
+# Этапы, время которых измеряется по отдельности
+STAGES = ('load', 'blue', 'green', 'orange', 'yellow', 'output')
+FORMATS = ('txt', 'fb2', 'epub')
+# Политики для омографов при замерах и соответствующие им ответы (для замера по этапам)
+ORANGE_POLICIES = {'keep': '1', 'yo': '2'}
+RESULTS_VERSION = 1
+
+# Частые короткие слова, разбавляющие словарные
+FILLER_WORDS = ('и', 'в', 'не', 'на', 'он', 'она', 'что', 'как', 'это', 'его', 'так', 'уже', 'тем',
+                'где', 'если', 'была', 'было', 'но', 'да', 'бы', 'же', 'мы', 'вы', 'они', 'только',
+                'теперь', 'себя', 'когда', 'потом', 'очень', 'там', 'тут', 'ему', 'нам', 'сказал')
+LITERAL_RE = re.compile(r'[^\W\d_]+(?:[ -][^\W\d_]+)*')
+
+def _read_rules(file_path):
+    """Левые части правил словаря, записанные без регулярных выражений."""
+    if not os.path.exists(file_path): return []
+    result = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '|' not in line: continue
+            original = line.split('(', 1)[0].split('|', 1)[0].strip()
+            if LITERAL_RE.fullmatch(original): result.append(original.lower())
+    return result
+
+def load_vocabulary(base_file=None, green_file=None, orange_file=None):
+    """Слова yellow_base.txt, фразы зелёного словаря и омографы оранжевого."""
+    if base_file is None: base_file = paths.get_path("dictionaries/yellow_base.txt")
+    if green_file is None: green_file = paths.get_path("dictionaries/green.dic")
+    if orange_file is None: orange_file = paths.get_path("dictionaries/orange.dic")
+    with open(base_file, 'r', encoding='utf-8') as f:
+        words = [w for w in (line.strip() for line in f) if w and not w.startswith('#') and LITERAL_RE.fullmatch(w)]
+    return words, _read_rules(green_file), _read_rules(orange_file)
+
+def generate_paragraphs(words=100000, seed=1, vocabulary=None):
+    """
+    Воспроизводимый (при том же seed и тех же словарях) текст из абзацев:
+    слова базы (большей частью с «е» вместо «ё»), частые служебные слова,
+    фразы зелёного словаря и омографы.
+    """
+    base, phrases, homographs = vocabulary or load_vocabulary()
+    rnd = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < words:
+        size = rnd.randint(5, 60)
+        out = []
+        for _ in range(size):
+            r = rnd.random()
+            if r < 0.55 and base:
+                w = rnd.choice(base)
+                if rnd.random() < 0.8: w = w.replace('ё', 'е').replace('Ё', 'Е')
+            elif r < 0.85 or not (phrases or homographs):
+                w = rnd.choice(FILLER_WORDS)
+            elif r < 0.93 and phrases:
+                w = rnd.choice(phrases)
+            else:
+                w = rnd.choice(homographs or phrases)
+            if rnd.random() < 0.1: w += rnd.choice((',', '.', '!', '?', ' —', ':'))
+            out.append(w)
+        total += size
+        text = ' '.join(out)
+        paragraphs.append(text[0].upper() + text[1:] + ('' if text[-1] in '.!?' else '.'))
+    return paragraphs
+
+def _image_data(rnd, size):
+    return rnd.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+def write_txt(file_path, paragraphs):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(paragraphs) + '\n')
+
+def write_fb2(file_path, paragraphs, seed=1, image_size=256 * 1024):
+    """FB2 с главами, стихами, подзаголовками и картинкой в <binary>."""
+    rnd = random.Random(seed)
+    body = []
+    for i, text in enumerate(paragraphs):
+        if i % 40 == 0:
+            if i: body.append('</section>')
+            body.append(f'<section>\n<title><p>Глава {i // 40 + 1}</p></title>')
+        r = rnd.random()
+        if r < 0.03: body.append(f'<subtitle>{text}</subtitle>')
+        elif r < 0.08: body.append(f'<poem><stanza><v>{text}</v></stanza></poem>')
+        elif r < 0.1: body.append('<empty-line/>')
+        body.append(f'<p>{text}</p>')
+    body.append('</section>')
+    image = base64.encodebytes(_image_data(rnd, image_size)).decode('ascii')
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                '<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0" xmlns:l="http://www.w3.org/1999/xlink">\n'
+                '<description>\n<title-info><book-title>Тестовая книга</book-title>'
+                f'<annotation><p>{paragraphs[0] if paragraphs else ""}</p></annotation>'
+                '<coverpage><image l:href="#cover.jpg"/></coverpage></title-info>\n'
+                '<document-info><history><p>Создано для замеров</p></history></document-info>\n</description>\n<body>\n')
+        f.write('\n'.join(body))
+        f.write(f'\n</body>\n<binary id="cover.jpg" content-type="image/jpeg">{image}</binary>\n</FictionBook>\n')
+
+def write_epub(file_path, paragraphs, seed=1, image_size=256 * 1024, chapter_size=200):
+    """EPUB из глав по chapter_size абзацев и одной картинки."""
+    rnd = random.Random(seed)
+    chapters = [paragraphs[i:i + chapter_size] for i in range(0, len(paragraphs), chapter_size)] or [[]]
+    with zipfile.ZipFile(file_path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml', '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                   '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>', compress_type=zipfile.ZIP_DEFLATED)
+        manifest = ''.join(f'<item id="c{i}" href="ch{i}.xhtml" media-type="application/xhtml+xml"/>' for i in range(len(chapters)))
+        spine = ''.join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+        z.writestr('OEBPS/content.opf', '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf"><metadata><title>Тестовая книга</title></metadata>'
+                   f'<manifest>{manifest}<item id="img" href="cover.jpg" media-type="image/jpeg"/></manifest><spine>{spine}</spine></package>', compress_type=zipfile.ZIP_DEFLATED)
+        for i, chapter in enumerate(chapters):
+            body = ''.join(f'<p>{text}</p>\n' for text in chapter)
+            z.writestr(f'OEBPS/ch{i}.xhtml', '<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">'
+                       f'<head><title>Глава {i + 1}</title></head><body>\n<h1>Глава {i + 1}</h1>\n{body}</body></html>', compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('OEBPS/cover.jpg', _image_data(rnd, image_size), compress_type=zipfile.ZIP_DEFLATED)
+
+def make_corpus(out_dir, words=100000, seed=1, formats=FORMATS, image_size=256 * 1024):
+    """Создаёт в out_dir книгу bench.{txt,fb2,epub} с одним и тем же текстом; возвращает {формат: путь}."""
+    os.makedirs(out_dir, exist_ok=True)
+    paragraphs = generate_paragraphs(words, seed)
+    files = {}
+    for fmt in formats:
+        file_path = os.path.join(out_dir, f'bench.{fmt}')
+        if fmt == 'txt': write_txt(file_path, paragraphs)
+        elif fmt == 'fb2': write_fb2(file_path, paragraphs, seed, image_size)
+        elif fmt == 'epub': write_epub(file_path, paragraphs, seed, image_size)
+        else: raise ValueError(f"Неизвестный формат: {fmt}")
+        files[fmt] = file_path
+    return files
+
+def read_units(file_path):
+    """Тексты, которые ёфикатор обрабатывает по одному: строки, элементы FB2 или документы EPUB."""
+    from .yorz import FB2_ELEMENT_RE
+    lower = file_path.lower()
+    if lower.endswith('.epub'):
+        from .epub_utils import get_ordered_infolist
+        with zipfile.ZipFile(file_path) as z:
+            return [z.read(item.filename).decode('utf-8') for item in get_ordered_infolist(z)
+                    if item.filename.lower().endswith(('.html', '.xhtml', '.htm'))]
+    if lower.endswith('.fb2'):
+        from .fb2_utils import Fb2Source
+        units = []
+        with Fb2Source(file_path) as source:
+            for i, part in enumerate(source.parts()):
+                match = FB2_ELEMENT_RE.match(part) if i % 2 else None
+                if match and match.group(3).strip(): units.append(match.group(3))
+        return units
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [line for line in f.read().split('\n') if line.strip()]
+
+def peak_rss(children=False):
+    """
+    Пиковый объём памяти текущего процесса в МБ (None, если узнать нельзя).
+    С children=True — самого большого из завершённых дочерних процессов
+    (рабочих процессов пула); известен только там, где есть модуль resource.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        if children: return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                       [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                                                             'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1 << 20)
+    except Exception:
+        pass
+    return None
+
+def measure_stages(units, dictionaries, answer, out_dir):
+    """
+    Прогоняет тексты через словари по одному этапу за раз (как process_paragraph)
+    и возвращает время каждого этапа и число замен по цветам. Омографы решаются
+    без вопросов ответом answer; «вывод» — сборка чистого текста и HTML и их запись.
+    """
+    from .paragraph import Paragraph
+    from .yorz import apply_replacements, process_yo_variants, replace_yo_in_text
+    yo_dict, yo_variants, yo_no_regular_dict, regex_dict = dictionaries
+    timings = dict.fromkeys(STAGES[1:], 0.0)
+    clock = time.perf_counter
+    t = clock()
+    yo_dict.prepare(units)
+    timings['yellow'] += clock() - t
+    paragraphs = []
+    decide = lambda candidate: candidate.apply(answer)
+    for text in units:
+        t0 = clock()
+        paragraph = Paragraph(text)
+        apply_replacements(paragraph, yo_no_regular_dict, "highlight-blue")
+        t1 = clock()
+        apply_replacements(paragraph, regex_dict, "highlight-green")
+        t2 = clock()
+        process_yo_variants(paragraph, yo_variants, {}, collect=decide)
+        t3 = clock()
+        replace_yo_in_text(paragraph, yo_dict)
+        t4 = clock()
+        timings['blue'] += t1 - t0
+        timings['green'] += t2 - t1
+        timings['orange'] += t3 - t2
+        timings['yellow'] += t4 - t3
+        paragraphs.append(paragraph)
+    t = clock()
+    with open(os.path.join(out_dir, 'stages_clean.txt'), 'w', encoding='utf-8') as clean, \
+         open(os.path.join(out_dir, 'stages.html'), 'w', encoding='utf-8') as html:
+        for paragraph in paragraphs:
+            clean.write(paragraph.render_clean() + '\n')
+            html.write(paragraph.render_html() + '\n')
+    timings['output'] = clock() - t
+    replacements = dict.fromkeys(('blue', 'green', 'orange', 'yellow'), 0)
+    for paragraph in paragraphs:
+        for node in paragraph.iter_nodes():
+            for span in node.spans:
+                if span.stage in replacements: replacements[span.stage] += 1
+    return timings, replacements
+
+def measure_end_to_end(file_path, orange, jobs, work_dir):
+    """
+    Время полной ёфикации файла через replace_expressions. Омографы решаются
+    политикой orange (keep или yo) без вопросов, так что в замер не входят
+    ни ввод ответов, ни контрольные точки после каждого из них.
+    """
+    import contextlib
+    from . import yorz
+    work_file = os.path.join(work_dir, os.path.basename(file_path))
+    shutil.copyfile(file_path, work_file)
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        t = time.perf_counter()
+        yorz.replace_expressions(input_file=work_file, jobs=jobs, orange_mode=orange, resume=False)
+        return time.perf_counter() - t
+
+def bench_file(file_path, repeat=1, jobs=1, orange='yo'):
+    """
+    Замеры одной книги: загрузка словарей, этапы по отдельности и полный прогон.
+    Из повторов берётся лучшее время. Выполняется в отдельном процессе, чтобы
+    пиковая память относилась только к этой книге. При jobs > 1 память рабочих
+    процессов пула записывается отдельно: пик одного процесса, умноженный на jobs,
+    и пик основного дают оценку сверху для всего прогона.
+    """
+    from .paragraph import WORD_RE, TAG_RE
+    from .yorz import load_dictionaries
+    answer = ORANGE_POLICIES[orange]
+    units = read_units(file_path)
+    words = sum(len(WORD_RE.findall(TAG_RE.sub(' ', text) if '<' in text else text)) for text in units)
+    best = dict.fromkeys(STAGES + ('total',), None)
+    replacements = None
+    work_dir = tempfile.mkdtemp(prefix='yorz_bench_')
+    try:
+        load_dictionaries()  # Кэш словарей для полного прогона
+        for _ in range(repeat):
+            t = time.perf_counter()
+            dictionaries = load_dictionaries(use_cache=False)
+            timings = {'load': time.perf_counter() - t}
+            stage_timings, replacements = measure_stages(units, dictionaries, answer, work_dir)
+            timings.update(stage_timings)
+            timings['total'] = measure_end_to_end(file_path, orange, jobs, work_dir)
+            for key, value in timings.items():
+                if best[key] is None or value < best[key]: best[key] = value
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    rss = peak_rss()
+    workers_rss = peak_rss(children=True) if jobs > 1 else None
+    return {
+        'words': words,
+        'units': len(units),
+        'seconds': {key: round(value, 4) for key, value in best.items()},
+        'words_per_second': {key: round(words / value) if value else None for key, value in best.items() if key != 'load'},
+        'peak_rss_mb': round(rss, 1) if rss is not None else None,
+        'workers_peak_rss_mb': round(workers_rss, 1) if workers_rss is not None else None,
+        'replacements': replacements,
+    }
+
+def _dictionary_hashes():
+    result = {}
+    for name in ('blue.dic', 'green.dic', 'orange.dic', 'yellow.dic', 'yellow_base.txt'):
+        file_path = paths.get_path(f"dictionaries/{name}")
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                result[name] = hashlib.sha1(f.read()).hexdigest()
+    return result
+
+def run_benchmark(words=100000, seed=1, formats=FORMATS, repeat=1, jobs=1, orange='yo', corpus_dir=None):
+    """Создаёт корпус и замеряет каждую книгу в отдельном процессе; возвращает результаты (для JSON)."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    temp_dir = None
+    if corpus_dir is None: corpus_dir = temp_dir = tempfile.mkdtemp(prefix='yorz_corpus_')
+    try:
+        files = make_corpus(corpus_dir, words, seed, formats)
+        results = {}
+        context = multiprocessing.get_context('spawn')
+        for fmt, file_path in files.items():
+            print(f"{Fore.CYAN}Замер {os.path.basename(file_path)}...{Style.RESET_ALL}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results[fmt] = pool.submit(bench_file, file_path, repeat, jobs, orange).result()
+    finally:
+        if temp_dir: shutil.rmtree(temp_dir, ignore_errors=True)
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'words': words, 'seed': seed, 'repeat': repeat, 'jobs': jobs, 'orange': orange},
+        'dictionaries': _dictionary_hashes(),
+        'results': results,
+    }
+
+def print_report(data):
+    header = f"{'формат':<6}" + ''.join(f"{name:>9}" for name in STAGES + ('total',)) + f"{'слов/с':>10}{'RSS, МБ':>9}{'пул, МБ':>9}"
+    print(f"\n{Fore.CYAN}Время этапов, с ({data['settings']['words']} слов, jobs={data['settings']['jobs']}){Style.RESET_ALL}")
+    print(header)
+    for fmt, result in data['results'].items():
+        seconds = result['seconds']
+        memory = ''.join(f"{rss:>9.1f}" if rss is not None else f"{'—':>9}" for rss in (result['peak_rss_mb'], result.get('workers_peak_rss_mb')))
+        print(f"{fmt:<6}" + ''.join(f"{seconds[name]:>9.3f}" for name in STAGES + ('total',))
+              + f"{result['words_per_second']['total'] or 0:>10}" + memory)
+
+def compare(data, baseline, threshold=10.0, min_seconds=0.05):
+    """
+    Сравнивает результаты с сохранёнными. Возвращает список регрессий: время этапа
+    или память выросли больше чем на threshold процентов (для времени — и больше
+    чем на min_seconds). Различия в числе замен и в словарях выводятся отдельно.
+    """
+    regressions = []
+    if baseline.get('settings') != data.get('settings'):
+        print(f"{Fore.YELLOW}Параметры замера отличаются от базовых: {baseline.get('settings')}{Style.RESET_ALL}")
+    if baseline.get('dictionaries') != data.get('dictionaries'):
+        print(f"{Fore.YELLOW}Словари отличаются от тех, с которыми сделан базовый замер.{Style.RESET_ALL}")
+    print(f"\n{Fore.CYAN}Сравнение с базовым замером (изменение, %){Style.RESET_ALL}")
+    for fmt, result in data['results'].items():
+        base = baseline.get('results', {}).get(fmt)
+        if not base:
+            print(f"{fmt:<6} нет в базовом замере")
+            continue
+        cells = []
+        metrics = [(name, result['seconds'].get(name), base['seconds'].get(name), min_seconds) for name in STAGES + ('total',)]
+        metrics.append(('rss', result.get('peak_rss_mb'), base.get('peak_rss_mb'), 1.0))
+        metrics.append(('rss_pool', result.get('workers_peak_rss_mb'), base.get('workers_peak_rss_mb'), 1.0))
+        for name, new, old, min_delta in metrics:
+            if new is None or not old:
+                cells.append(f"{name} —")
+                continue
+            change = (new - old) / old * 100
+            color = ''
+            if change > threshold and new - old > min_delta:
+                regressions.append((fmt, name, old, new))
+                color = Fore.RED
+            elif change < -threshold and old - new > min_delta:
+                color = Fore.GREEN
+            cells.append(f"{color}{name} {change:+.1f}{Style.RESET_ALL if color else ''}")
+        print(f"{fmt:<6} " + '  '.join(cells))
+        if result.get('replacements') != base.get('replacements'):
+            print(f"{Fore.YELLOW}{fmt}: число замен изменилось: {base.get('replacements')} -> {result.get('replacements')}{Style.RESET_ALL}")
+    return regressions
+
+def run(words=100000, seed=1, formats=FORMATS, repeat=1, jobs=1, orange='yo', out_file='benchmark.json', baseline_file=None, threshold=10.0, corpus_dir=None):
+    """Замер, отчёт, сохранение в out_file и сравнение с baseline_file. Возвращает True, если регрессий нет."""
+    paths.ensure_user_data_exists()
+    data = run_benchmark(words, seed, formats, repeat, jobs, orange, corpus_dir)
+    print_report(data)
+    if out_file:
+        with open(out_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"{Fore.GREEN}Результаты сохранены в {out_file}{Style.RESET_ALL}")
+    if baseline_file:
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(data, baseline, threshold)
+        if regressions:
+            print(f"{Fore.RED}Регрессии: " + ', '.join(f"{fmt}/{name} {old:g} -> {new:g}" for fmt, name, old, new in regressions) + Style.RESET_ALL)
+            return False
+    return True
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m modules.benchmark', description="Замеры скорости ёфикации на синтетических книгах.")
+    parser.add_argument('--words', type=int, default=100000, help="размер книги в словах (по умолчанию 100000)")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора текста")
+    parser.add_argument('--formats', default=','.join(FORMATS), help="форматы через запятую: txt,fb2,epub")
+    parser.add_argument('--repeat', type=int, default=1, help="число повторов (берётся лучшее время)")
+    parser.add_argument('--jobs', type=int, default=1, help="число процессов для полного прогона")
+    parser.add_argument('--orange', choices=sorted(ORANGE_POLICIES), default='yo', help="ответ на все вопросы по омографам")
+    parser.add_argument('--out', default='benchmark.json', help="файл для результатов (JSON)")
+    parser.add_argument('--baseline', help="JSON прежнего замера для сравнения")
+    parser.add_argument('--threshold', type=float, default=10.0, help="допустимое ухудшение, %% (по умолчанию 10)")
+    parser.add_argument('--corpus-dir', help="сохранить созданные книги в этой папке")
+    args = parser.parse_args(argv)
+    formats = tuple(f.strip() for f in args.formats.split(',') if f.strip())
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown: parser.error(f"неизвестные форматы: {', '.join(unknown)}")
+    ok = run(args.words, args.seed, formats, args.repeat, args.jobs, args.orange, args.out, args.baseline, args.threshold, args.corpus_dir)
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import os
+import sys
+import glob
+from colorama import Fore, Style
+from . import paths
+
+# Форматы книг, которые обрабатывают типограф, ёфикатор и извлечение слов
+BOOK_EXTENSIONS = ('.txt', '.md', '.fb2', '.epub')
+# Результаты команд: при обходе папок и масок они не считаются исходными книгами
+OUTPUT_SUFFIXES = {'typographer': '_fixed', 'yorz': '_yo', 'extract': '_extraction'}
+SKIPPED_NAMES = ('for_blacklist.txt',)
+FILE_COMMANDS = ('typographer', 'yorz', 'extract')
+
+def is_book(file_name, command):
+    """Подходит ли файл, найденный в папке или по маске, как исходная книга для команды."""
+    name, ext = os.path.splitext(os.path.basename(file_name))
+    if ext.lower() not in BOOK_EXTENSIONS or name.startswith('.'): return False
+    if os.path.basename(file_name).lower() in SKIPPED_NAMES: return False
+    return not name.endswith(OUTPUT_SUFFIXES[command])
+
+def collect_files(inputs, command):
+    """
+    Файлы из списка путей, масок и папок (папки обходятся рекурсивно) по порядку,
+    без повторов. Явно указанный файл берётся всегда. Возвращает (файлы, входы,
+    по которым ничего не найдено).
+    """
+    files, missing = [], []
+    for item in inputs:
+        if os.path.isfile(item):
+            found = [item]
+        elif os.path.isdir(item):
+            found = []
+            for root, dirs, names in os.walk(item):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(names) if is_book(name, command))
+        else:
+            found = sorted(f for f in glob.glob(item, recursive=True) if os.path.isfile(f) and is_book(f, command))
+        if not found: missing.append(item)
+        files.extend(found)
+    return list(dict.fromkeys(os.path.abspath(f) for f in files)), missing
+
+_worker_context = None
+
+def prepare(command, options):
+    """
+    Подготовка процесса к обработке файлов команды: для ёфикации словари
+    загружаются здесь один раз и используются для всех файлов процесса. Ctrl+C, как кнопка остановки
+    в GUI, выставляет yorz.SHOULD_STOP: обработка останавливается между абзацами,
+    и выходные файлы совпадают с сохранённой сессией. Повторное нажатие прерывает сразу.
+    """
+    if command != 'yorz': return {}
+    import signal
+    from . import yorz
+
+    def stop(signum, frame):
+        yorz.SHOULD_STOP = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, stop)
+    return {'dictionaries': yorz.load_dictionaries()}
+
+def _init_worker(command, options):
+    global _worker_context
+    paths.ensure_user_data_exists()
+    _worker_context = prepare(command, options)
+
+def process_file(command, file_path, options, context, jobs=1):
+    """Обрабатывает один файл; возвращает True при успехе."""
+    if command == 'typographer':
+        from . import typographer
+        return typographer.run(input_file=file_path, remove_all_empty=options['remove_all_empty'], keep_leading_dashes=options['keep_leading_dashes'],
+                               options={'deyo': options['deyo']}, app_version=paths.get_app_version())
+    if command == 'yorz':
+        from . import yorz
+        # Остановка, запрошенная между файлами (replace_expressions сбрасывает флаг)
+        if yorz.SHOULD_STOP: raise KeyboardInterrupt()
+        return yorz.run(input_file=file_path, app_version=paths.get_app_version(), jobs=jobs, preview=options['preview'],
+                        resume=not options['restart'], dictionaries=context['dictionaries'], orange_mode=options['orange'],
+                        orange_table=options['orange_table'])
+    from . import extraction
+    return extraction.run(input_filename=file_path)
+
+def _capture(command, file_path, options, context, jobs=1):
+    """process_file с перехваченным выводом: (успех, текст вывода)."""
+    import io
+    import contextlib
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            try:
+                ok = bool(process_file(command, file_path, options, context, jobs))
+            except Exception as e:
+                print(f"{Fore.RED}Ошибка: {e}{Style.RESET_ALL}")
+                ok = False
+    except KeyboardInterrupt:
+        print(f"{Fore.YELLOW}Прервано: {file_path}{Style.RESET_ALL}")
+        raise
+    return ok, log.getvalue()
+
+def _worker_file(command, file_path, options):
+    return _capture(command, file_path, options, _worker_context)
+
+def review_note(command, file_path):
+    """Пометка для книги, у которой остались отложенные омографы (см. orange_review)."""
+    if command != 'yorz': return ''
+    from . import orange_review
+    review_file = orange_review.review_file_path(file_path)
+    if not os.path.exists(review_file): return ''
+    return f" {Fore.YELLOW}(отложены омографы: {os.path.basename(review_file)}){Style.RESET_ALL}"
+
+def run_files(command, files, options, jobs=1, verbose=False):
+    """
+    Обрабатывает файлы по одному в этом процессе (jobs=1 или один файл — тогда
+    jobs передаётся ёфикатору для пула внутри книги) или параллельно в jobs
+    процессах, по файлу на процесс. Возвращает число неудачных файлов.
+    """
+    failed = 0
+
+    def report(file_path, ok, log):
+        nonlocal failed
+        if not ok: failed += 1
+        if verbose or not ok: sys.stdout.write(log)
+        status = f"{Fore.GREEN}готово" if ok else f"{Fore.RED}ошибка"
+        print(f"{status}{Style.RESET_ALL}: {file_path}{review_note(command, file_path) if ok else ''}")
+
+    if jobs <= 1 or len(files) == 1:
+        import signal
+        original_handler = signal.getsignal(signal.SIGINT)
+        try:
+            context = prepare(command, options)
+            for file_path in files:
+                report(file_path, *_capture(command, file_path, options, context, jobs))
+        finally:
+            signal.signal(signal.SIGINT, original_handler)
+        return failed
+
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=min(jobs, len(files)), initializer=_init_worker, initargs=(command, options))
+    try:
+        futures = [(file_path, pool.submit(_worker_file, command, file_path, options)) for file_path in files]
+        for file_path, future in futures:
+            try:
+                ok, log = future.result()
+            except Exception as e:
+                ok, log = False, f"{Fore.RED}Ошибка рабочего процесса: {e}{Style.RESET_ALL}\n"
+            report(file_path, ok, log)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return failed
+
+def run_tool(command, options):
+    """Инструменты словарей: сортировка базы, поиск омографов, сборка yellow.dic."""
+    if command == 'sort':
+        from . import sorting
+        return sorting.run(input_filename=options['base_file'])
+    if command == 'twin':
+        from . import twin
+        return twin.run()
+    from . import yellow_dic_forming
+    return yellow_dic_forming.run()
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog='python main.py', description="Пакетная обработка книг без интерактивного меню.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='команда')
+
+    def add_file_command(name, help_text):
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.add_argument('inputs', nargs='+', metavar='путь', help="файлы, маски (*.fb2, **/*.txt) или папки (обходятся рекурсивно)")
+        command.add_argument('-j', '--jobs', type=int, default=1, help="число процессов (0 — по числу ядер)")
+        command.add_argument('-v', '--verbose', action='store_true', help="выводить полный отчёт по каждому файлу")
+        return command
+
+    command = add_file_command('typographer', "типограф: подготовка текста (результат — *_fixed)")
+    command.add_argument('--remove-all-empty', action='store_true', help="удалять все пустые строки")
+    command.add_argument('--keep-leading-dashes', action='store_true', help="не трогать дефисы в начале строк")
+    command.add_argument('--deyo', action='store_true', help="заменить «ё» на «е»")
+
+    command = add_file_command('yorz', "ёфикация (результат — *_yo и HTML с подсветкой)")
+    command.add_argument('--orange', choices=('keep', 'yo', 'table', 'defer'), default='defer',
+                         help="омографы: keep — оставить «е», yo — поставить «ё», table — по таблице --orange-table, "
+                              "defer — оставить «е» и записать в *_yo_review.json для проверки (по умолчанию)")
+    command.add_argument('--orange-table', metavar='файл', help="таблица ответов по правилам orange.dic: строки «правило|ё» или «правило|е»; "
+                                                               "правила не из таблицы откладываются, как в defer")
+    command.add_argument('--restart', action='store_true', help="начинать незаконченную обработку заново, а не продолжать")
+    command.add_argument('--no-preview', dest='preview', action='store_false', help="не создавать HTML с подсветкой")
+    command.add_argument('--rule-stats', metavar='файл', help="записать учёт правил словарей (файлы обрабатываются по одному)")
+
+    add_file_command('extract', "извлечение слов, которых нет в базе (результат — *_extraction.txt)")
+
+    command = commands.add_parser('sort', help="сортировка базы yellow_base.txt")
+    command.add_argument('base_file', nargs='?', metavar='файл', help="файл базы (по умолчанию yellow_base.txt пользователя)")
+    commands.add_parser('twin', help="поиск омографов в базе (пополняет orange.dic)")
+    commands.add_parser('yellow', help="сборка yellow.dic из yellow_root, yellow_base и yellow_add")
+
+    from .server import DEFAULT_PORT
+    command = commands.add_parser('serve', help="сервер ёфикации на 127.0.0.1 со словарями в памяти",
+                                  description="Сервер ёфикации: словари загружаются один раз и перезагружаются при их изменении. "
+                                              "Проверочный клиент: python -m modules.client.")
+    command.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"порт (по умолчанию {DEFAULT_PORT})")
+    command.add_argument('-j', '--jobs', type=int, default=0, help="число рабочих процессов (0 — по числу ядер, по умолчанию)")
+    command.add_argument('-v', '--verbose', action='store_true', help="выводить журнал запросов")
+    return parser
+
+def main(argv=None):
+    """Точка входа: возвращает код завершения (0 — всё обработано, 1 — были ошибки)."""
+    args = build_parser().parse_args(argv)
+    options = vars(args)
+    paths.ensure_user_data_exists()
+    if args.command == 'serve':
+        from . import server
+        return server.serve(args.port, args.jobs or os.cpu_count() or 1, args.verbose)
+    try:
+        if args.command not in FILE_COMMANDS:
+            return 0 if run_tool(args.command, options) else 1
+
+        files, missing = collect_files(args.inputs, args.command)
+        for item in missing:
+            print(f"{Fore.RED}Не найдено файлов: {item}{Style.RESET_ALL}")
+        jobs = args.jobs or os.cpu_count() or 1
+        if options.get('orange') == 'table' and not args.orange_table:
+            print(f"{Fore.RED}Для --orange table нужна таблица: --orange-table файл{Style.RESET_ALL}")
+            return 1
+        if options.get('rule_stats'):
+            from . import rule_stats
+            with rule_stats.collect(args.rule_stats):
+                failed = run_files(args.command, files, options, 1, args.verbose)
+        else:
+            failed = run_files(args.command, files, options, jobs, args.verbose)
+        print(f"{Fore.CYAN}Обработано файлов: {len(files) - failed} из {len(files)}{Style.RESET_ALL}")
+        return 1 if failed or missing else 0
+    except KeyboardInterrupt:
+        print(f"\n{Fore.RED}Программа прервана пользователем.{Style.RESET_ALL}")
+        return 130
+
+if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
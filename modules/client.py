@@ -0,0 +1,71 @@
+import sys
+import json
+from urllib import request as urllib_request
+from urllib.error import HTTPError, URLError
+from colorama import Fore, Style
+from .server import HOST, DEFAULT_PORT
+
+def call(path, data=None, port=DEFAULT_PORT, timeout=None):
+    """
+    Запрос к серверу ёфикации на этой машине (см. server.RequestHandler): GET без
+    data, POST с data (в JSON). Возвращает разобранный ответ; ошибка сервера —
+    RuntimeError с его сообщением.
+    """
+    body = None if data is None else json.dumps(data, ensure_ascii=False).encode('utf-8')
+    req = urllib_request.Request(f"http://{HOST}:{port}{path}", data=body, headers={'Content-Type': 'application/json; charset=utf-8'})
+    # Без прокси из окружения: запрос не уходит дальше петлевого интерфейса
+    opener = urllib_request.build_opener(urllib_request.ProxyHandler({}))
+    try:
+        with opener.open(req, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8'))['error']
+        except Exception:
+            message = str(e)
+        raise RuntimeError(message) from None
+
+def yofy(text=None, file=None, orange='defer', orange_table=None, html=False, preview=True, port=DEFAULT_PORT):
+    """Ёфикация текста или книги сервером (см. server.YofyService.handle)."""
+    request = {'orange': orange, 'orange_table': orange_table}
+    if file is not None: request.update(file=file, preview=preview)
+    else: request.update(text=text, html=html)
+    return call('/yofy', request, port)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m modules.client', description="Проверочный клиент сервера ёфикации (python main.py serve).")
+    parser.add_argument('text', nargs='?', help="текст (без него и без --file текст читается из стандартного ввода)")
+    parser.add_argument('--file', help="книга на этой машине: результат записывается рядом с ней, как при обычной ёфикации")
+    parser.add_argument('--orange', choices=('keep', 'yo', 'table', 'defer'), default='defer', help="политика для омографов (по умолчанию defer)")
+    parser.add_argument('--orange-table', metavar='файл', help="таблица ответов для --orange table")
+    parser.add_argument('--json', action='store_true', help="вывести ответ сервера целиком (с заменами и отложенными омографами)")
+    parser.add_argument('--status', action='store_true', help="состояние сервера")
+    parser.add_argument('--reload', action='store_true', help="загрузить словари заново")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"порт сервера (по умолчанию {DEFAULT_PORT})")
+    args = parser.parse_args(argv)
+    try:
+        if args.status or args.reload:
+            result = call('/reload', {}, args.port) if args.reload else call('/status', port=args.port)
+            print(json.dumps(result, ensure_ascii=False, indent=1))
+            return 0
+        text = None if args.file else (args.text if args.text is not None else sys.stdin.read())
+        result = yofy(text, args.file, args.orange, args.orange_table, port=args.port)
+    except (RuntimeError, URLError, OSError) as e:
+        print(f"{Fore.RED}Ошибка запроса: {getattr(e, 'reason', e)}{Style.RESET_ALL}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=1))
+    elif args.file:
+        if not result['ok']:
+            sys.stdout.write(result['log'])
+            return 1
+        print(result['output'])
+    else:
+        sys.stdout.write(result['text'])
+        if result['deferred']:
+            print(f"\n{Fore.YELLOW}Отложено омографов: {len(result['deferred'])}{Style.RESET_ALL}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
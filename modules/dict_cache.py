@@ -0,0 +1,98 @@
+import os
+import pickle
+import hashlib
+from . import paths
+
+# Увеличивается при любом изменении структуры загружаемых таблиц правил
+CACHE_VERSION = 7
+CACHE_DIR = os.path.join(paths.USER_DATA_DIR, 'cache')
+
+def _cache_file(source_path, kind):
+    return os.path.join(CACHE_DIR, f"{os.path.basename(source_path)}.{kind}.pickle")
+
+def _content_hash(source_path):
+    digest = hashlib.sha1()
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_header(cache_file):
+    """Читает только заголовок кэша (без таблиц правил)."""
+    with open(cache_file, 'rb') as f:
+        return pickle.load(f)
+
+def _write(cache_file, header, data):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+def load(source_path, kind, loader):
+    """
+    Возвращает разобранный словарь source_path из кэша в USER_DATA_DIR/cache.
+    Кэш действителен, пока совпадают размер и mtime файла, а при их изменении —
+    пока совпадает SHA-1 содержимого. Иначе словарь заново разбирается
+    функцией loader(source_path) и кэш перезаписывается.
+    При любой ошибке кэша словарь просто загружается напрямую.
+    """
+    try:
+        st = os.stat(source_path)
+        cache_file = _cache_file(source_path, kind)
+        header = None
+        if os.path.exists(cache_file):
+            header = _read_header(cache_file)
+            if header.get('version') != CACHE_VERSION or header.get('source') != os.path.abspath(source_path):
+                header = None
+        if header is not None:
+            if header['size'] == st.st_size and header['mtime_ns'] == st.st_mtime_ns:
+                return _load_payload(cache_file)
+            content_hash = _content_hash(source_path)
+            if header['sha1'] == content_hash:
+                data = _load_payload(cache_file)
+                header.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                _write(cache_file, header, data)
+                return data
+        else:
+            content_hash = _content_hash(source_path)
+    except Exception:
+        return loader(source_path)
+
+    data = loader(source_path)
+    try:
+        header = {
+            'version': CACHE_VERSION,
+            'source': os.path.abspath(source_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha1': content_hash,
+        }
+        _write(cache_file, header, data)
+    except Exception:
+        pass
+    return data
+
+def _load_payload(cache_file):
+    with open(cache_file, 'rb') as f:
+        pickle.load(f)
+        return pickle.load(f)
+
+def invalidate():
+    """Удаляет все файлы кэша словарей."""
+    if not os.path.isdir(CACHE_DIR): return
+    for filename in os.listdir(CACHE_DIR):
+        if filename.endswith(('.pickle', '.pickle.tmp')):
+            try: os.remove(os.path.join(CACHE_DIR, filename))
+            except OSError: pass
+
+def rebuild(verbose=False):
+    """Сбрасывает и сразу заново собирает кэш (после изменения словарей)."""
+    invalidate()
+    try:
+        from . import yorz
+        yorz.load_dictionaries()
+        if verbose: print("[CACHE] Кэш словарей пересобран.")
+    except Exception as e:
+        print(f"[CACHE] Не удалось пересобрать кэш словарей: {e}")
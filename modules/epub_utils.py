@@ -1,3 +1,8 @@
+import os
+import copy
+import struct
+import zipfile
+import zlib
 import xml.etree.ElementTree as ET
 import posixpath
 import urllib.parse
@@ -86,3 +91,126 @@ def get_ordered_infolist(zin):
     except Exception as e:
         # Silently fallback to original infolist on any error
         return infolist
+
+def zip_directory_state(path, sync=False):
+    """
+    Returns (offset, tail) for a closed zip file: where its central directory
+    starts and the raw bytes from there to the end of the file. Saved together
+    with a session checkpoint, it lets restore_zip_directory() bring the file back
+    to that state if a later append is cut short (crash, power loss).
+    With `sync`, the file is flushed to disk first.
+    """
+    with zipfile.ZipFile(path, 'r') as zf:
+        offset = zf.start_dir
+    with open(path, 'r+b') as f:
+        if sync: os.fsync(f.fileno())
+        f.seek(offset)
+        return offset, f.read()
+
+def restore_zip_directory(path, offset, tail):
+    """Truncates `path` to `offset` and writes back a central directory saved by zip_directory_state()."""
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(tail)
+        f.truncate()
+
+# Raw entry copy uses zipfile internals (CPython, not a public API). If any of them is
+# missing, or a raw copy fails, entries are copied through read() and writestr().
+_RAW_MODULE_NAMES = ('_strip_extra', 'structFileHeader', 'sizeFileHeader', 'stringFileHeader',
+                     '_FH_SIGNATURE', '_FH_FILENAME_LENGTH', '_FH_EXTRA_FIELD_LENGTH')
+_RAW_WRITER_NAMES = ('fp', 'start_dir', 'filelist', 'NameToInfo', '_writing', '_lock', '_writecheck', '_didModify')
+
+def raw_copy_supported(zin, zout):
+    """Whether this zipfile implementation has everything EpubWriter's raw copy relies on."""
+    return (all(hasattr(zipfile, name) for name in _RAW_MODULE_NAMES)
+            and all(hasattr(zout, name) for name in _RAW_WRITER_NAMES)
+            and hasattr(zin, 'fp') and hasattr(zin, '_lock'))
+
+class EpubWriter:
+    """
+    Writes an EPUB rebuilt from the source archive `zin`.
+    Entries that are not re-encoded (images, fonts, CSS...) are copied with
+    copy(): their compressed bytes go to the output as they are, without being
+    inflated and deflated again. write() stores new content for an entry; if the
+    content turns out to be identical to the source entry, it is copied too.
+    `mode` is passed to ZipFile ('a' continues an interrupted archive).
+    Set `raw_copy` to False to always copy through read() and writestr().
+    """
+
+    def __init__(self, path, zin, mode='w'):
+        self.zin = zin
+        self.zout = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED)
+        self.raw_copy = raw_copy_supported(zin, self.zout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.zout.close()
+
+    def write(self, item, data):
+        """Stores `data` (bytes or str) under the name and attributes of the source entry `item`."""
+        if isinstance(data, str): data = data.encode('utf-8')
+        if len(data) == item.file_size and zlib.crc32(data) == item.CRC and self._same_as_source(item, data):
+            self.copy(item)
+            return
+        # The source ZipInfo is left untouched: writestr() overwrites sizes and offsets
+        self.zout.writestr(copy.copy(item), data)
+
+    def _same_as_source(self, item, data):
+        try:
+            return self.zin.read(item.filename) == data
+        except Exception:
+            return False
+
+    def copy(self, item):
+        """Copies the source entry `item` without recompression (if raw copy is available)."""
+        if self.raw_copy:
+            try:
+                raw = self._read_raw(item)
+                if raw is not None:
+                    self._write_raw(item, raw)
+                    return
+            except Exception:
+                # Nothing is registered in the archive until the raw write completes, and
+                # writestr() starts again from start_dir, so a failed attempt leaves no trace
+                pass
+        # Encrypted, unreadable as raw data or no raw copy: a regular copy
+        self.zout.writestr(copy.copy(item), self.zin.read(item.filename))
+
+    def _write_raw(self, item, raw):
+        zout = self.zout
+        if zout._writing:
+            raise ValueError("Can't write to the ZIP file while there is another write handle open on it.")
+        zinfo = copy.copy(item)
+        # Sizes and CRC are known up front, so no data descriptor follows the data
+        zinfo.flag_bits &= ~0x08
+        zinfo.extra = zipfile._strip_extra(zinfo.extra, (1,))
+        with zout._lock:
+            zout.fp.seek(zout.start_dir)
+            zinfo.header_offset = zout.fp.tell()
+            zout._writecheck(zinfo)
+            zout._didModify = True
+            zout.fp.write(zinfo.FileHeader())
+            zout.fp.write(raw)
+            zout.start_dir = zout.fp.tell()
+            zout.filelist.append(zinfo)
+            zout.NameToInfo[zinfo.filename] = zinfo
+
+    def _read_raw(self, item):
+        """Compressed bytes of `item` as stored in the source archive (None if encrypted)."""
+        if item.flag_bits & 0x01: return None
+        zin = self.zin
+        with zin._lock:
+            zin.fp.seek(item.header_offset)
+            header = struct.unpack(zipfile.structFileHeader, zin.fp.read(zipfile.sizeFileHeader))
+            if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+                raise zipfile.BadZipFile(f"Bad magic number for file header: {item.filename}")
+            zin.fp.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+            raw = zin.fp.read(item.compress_size)
+        if len(raw) != item.compress_size:
+            raise zipfile.BadZipFile(f"Truncated file data: {item.filename}")
+        return raw
@@ -1,30 +1,8 @@
 import os
 import re
-import unicodedata
 from colorama import Fore, Style
 from . import paths
-
-def remove_diacritics(text):
-    nfd_text = unicodedata.normalize("NFD", text)
-    result_chars = []
-    i = 0
-    while i < len(nfd_text):
-        ch = nfd_text[i]
-        if unicodedata.category(ch) != "Mn":
-            cluster = [ch]
-            i += 1
-            while i < len(nfd_text) and unicodedata.category(nfd_text[i]) == "Mn":
-                cluster.append(nfd_text[i])
-                i += 1
-            if ch.lower() == "е" and "\u0308" in cluster[1:]:
-                result_chars.extend(cluster)
-            elif ch.lower() == "и" and "\u0306" in cluster[1:]:
-                result_chars.extend(cluster)
-            else:
-                result_chars.append(ch)
-        else:
-            i += 1
-    return unicodedata.normalize("NFC", "".join(result_chars))
+from .text_utils import remove_diacritics
 
 def load_lines(filename):
     if not os.path.exists(filename): return []
@@ -181,6 +159,7 @@ def run(input_filename="book.txt"):
         print(f"{Fore.CYAN}Слова для blacklist сохранены в: {for_blacklist_filename}{Style.RESET_ALL}")
 
     print(f"{Fore.GREEN}Извлечение слов завершено. Результат сохранён в: {output_filename}{Style.RESET_ALL}")
+    return True
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
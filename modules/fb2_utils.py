@@ -0,0 +1,99 @@
+import os
+import re
+import mmap
+
+# Начало обрабатываемого элемента (как в прежнем re.split всего текста) или <binary>
+START_RE = re.compile(rb'<(p|v|text-author|subtitle|title|empty-line|binary)(?=[\s>/])', re.IGNORECASE)
+CLOSE_RES = {name: re.compile(b'</' + name + b'>', re.IGNORECASE)
+             for name in (b'p', b'v', b'text-author', b'subtitle', b'title', b'empty-line')}
+# Размер куска при копировании содержимого <binary>
+COPY_CHUNK = 1 << 20
+
+def _newlines(data):
+    """Переводы строк приводятся к \\n, как при чтении файла в текстовом режиме."""
+    return data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+class Fb2Source:
+    """
+    FB2-файл, разбираемый потоково. parts() выдаёт те же части, что прежний
+    re.split по обрабатываемым элементам (p, v, text-author, subtitle, title,
+    empty-line): промежутки на чётных местах, сами элементы на нечётных.
+    Файл отображается в память, и в нём ищутся только теги; содержимое <binary>
+    (картинки в base64) не декодируется и не просматривается регулярными
+    выражениями, а в выходной файл копируется диапазоном байтов (copy_to).
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'rb')
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap): self.data.close()
+        self.file.close()
+
+    def text(self, start, end):
+        return _newlines(self.data[start:end]).decode('utf-8')
+
+    def copy_to(self, out, start, end, linesep='\n'):
+        """Пишет байты [start, end) в двоичный файл out, переводы строк — как в тексте."""
+        while start < end:
+            stop = min(start + COPY_CHUNK, end)
+            # \r\n не разрывается между кусками
+            if stop < end and self.data[stop - 1] == 13: stop += 1
+            chunk = _newlines(self.data[start:stop])
+            if linesep != '\n': chunk = chunk.replace(b'\n', linesep.encode())
+            out.write(chunk)
+            start = stop
+
+    def parts(self):
+        """
+        Части по порядку. Элемент — его текст (str); промежуток — список кусков:
+        str для текста и (start, end) для содержимого <binary>.
+        """
+        data = self.data
+        pos = gap_start = 0
+        segments = []
+        while True:
+            m = START_RE.search(data, pos)
+            if not m: break
+            name = m.group(1).lower()
+            tag_end = data.find(b'>', m.end())
+            # Без «>» дальше не может начаться ни один элемент
+            if tag_end < 0: break
+            if name == b'binary':
+                close = data.find(b'</binary>', tag_end + 1)
+                # Содержимое без «<» не может содержать элементов и пропускается целиком
+                if close >= 0 and data.find(b'<', tag_end + 1, close) < 0:
+                    segments.append(self.text(gap_start, tag_end + 1))
+                    segments.append((tag_end + 1, close))
+                    gap_start = close
+                    pos = close + len(b'</binary>')
+                else:
+                    pos = m.start() + 1
+                continue
+            close = CLOSE_RES[name].search(data, tag_end + 1)
+            if close:
+                end = close.end()
+            elif name == b'empty-line' and tag_end > m.end() and data[tag_end - 1] == ord('/'):
+                end = tag_end + 1
+            else:
+                pos = m.start() + 1
+                continue
+            segments.append(self.text(gap_start, m.start()))
+            yield segments
+            yield self.text(m.start(), end)
+            segments = []
+            gap_start = pos = end
+        segments.append(self.text(gap_start, len(data)))
+        yield segments
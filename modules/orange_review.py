@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+from colorama import Fore, Style
+from .yorz import ORANGE_POLICIES as POLICIES, orange_context_parts, review_orange_groups
+
+REVIEW_VERSION = 1
+# Ответы в таблице: «е» (или 1) — оставить слово как в тексте, «ё» (или 2) — вариант с «ё»
+TABLE_CHOICES = {'1': '1', 'е': '1', '2': '2', 'ё': '2'}
+# Сколько символов контекста сохраняется по обе стороны от отложенного слова
+CONTEXT_RADIUS = 150
+
+def review_file_path(input_file):
+    """Файл проверки отложенных омографов рядом с книгой: book.txt -> book_yo_review.json."""
+    base_dir = os.path.dirname(os.path.abspath(input_file))
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(base_dir, base_name + '_yo_review.json')
+
+def _file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_orange_table(file_path):
+    """
+    Таблица ответов по правилам оранжевого словаря: строки «правило|ё» или
+    «правило|е» (правило — левая часть строки orange.dic, например все|ё).
+    Пустые строки и строки с # пропускаются.
+    """
+    table = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#') or '|' not in line: continue
+            rule, choice = (part.strip() for part in line.rsplit('|', 1))
+            if choice.lower() not in TABLE_CHOICES:
+                print(f"{Fore.YELLOW}{os.path.basename(file_path)}, строка {line_num}: ожидается «е» или «ё» после «|».{Style.RESET_ALL}")
+                continue
+            table[rule] = TABLE_CHOICES[choice.lower()]
+    return table
+
+def _trim(text, radius, from_end):
+    if len(text) <= radius: return text
+    return "... " + text[-radius:] if from_end else text[:radius] + " ..."
+
+class OrangePolicy:
+    """
+    Ответы на вопросы оранжевого словаря без участия пользователя (вызывается как
+    policy(index, candidate)): keep — слово остаётся как в тексте, yo — вариант
+    с «ё», table — ответ из таблицы по правилу, а правила не из таблицы
+    откладываются, defer — слово остаётся как есть, а вхождение с контекстом
+    записывается в deferred ({ключ вхождения: запись}) для последующей проверки.
+    """
+
+    def __init__(self, mode, yo_variants, table=None, deferred=None):
+        if mode not in POLICIES: raise ValueError(f"Неизвестный режим омографов: {mode}")
+        self.mode = mode
+        self.table = table or {}
+        self.originals = {pattern.pattern: data.get('original', pattern.pattern) for pattern, data in yo_variants.items()}
+        self.choices = {}
+        if mode == 'table':
+            self.choices = {rule: self.table[original] for rule, original in self.originals.items() if original in self.table}
+        self.deferred = {} if deferred is None else deferred
+
+    def __call__(self, index, candidate):
+        if self.mode == 'keep': return '1'
+        if self.mode == 'yo': return '2'
+        choice = self.choices.get(candidate.rule)
+        if choice is not None: return choice
+        candidate.index = index
+        before, word, after = orange_context_parts(candidate.paragraph, candidate.start, candidate.end)
+        self.deferred[candidate.key] = {
+            'index': index, 'start': candidate.start, 'line': candidate.line_number,
+            'rule': candidate.rule, 'original': self.originals.get(candidate.rule, candidate.rule),
+            'base_word': candidate.base_word, 'yo_word': candidate.yo_word,
+            'before': _trim(before, CONTEXT_RADIUS, True), 'word': word, 'after': _trim(after, CONTEXT_RADIUS, False),
+        }
+        return ''
+
+class DeferredCandidate:
+    """Отложенное вхождение из файла проверки для группового просмотра (как OrangeCandidate)."""
+
+    def __init__(self, record, answers):
+        self.record = record
+        self.answers = answers
+        self.index = record['index']
+        self.start = record['start']
+        self.rule = record['rule']
+        self.base_word = record['base_word']
+        self.yo_word = record['yo_word']
+        self.line_number = record['line']
+
+    @property
+    def key(self):
+        return f"{self.index}:{self.start}"
+
+    def context(self):
+        return self.record['before'] + Fore.YELLOW + self.record['word'] + Style.RESET_ALL + self.record['after']
+
+    def apply(self, choice):
+        """Решение становится ответом для повторной обработки книги ({абзац: {позиция: ответ}})."""
+        self.answers.setdefault(str(self.index), {})[str(self.start)] = choice
+
+def write_review(file_path, input_file, deferred, table=None, decisions=None):
+    """
+    Записывает отложенные вхождения (атомарно: через временный файл) вместе
+    с таблицей, по которой решались остальные омографы, — при повторной
+    обработке после проверки она применяется снова.
+    """
+    data = {
+        'version': REVIEW_VERSION,
+        'source': os.path.basename(input_file),
+        'source_sha1': _file_hash(input_file),
+        'table': table or {},
+        'decisions': decisions or {},
+        'occurrences': sorted(deferred.values(), key=lambda r: (r['index'], r['start'])),
+    }
+    _save(file_path, data)
+
+def _save(file_path, data):
+    tmp_file = file_path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_file, file_path)
+
+def review_deferred(file_path, input_file):
+    """
+    Групповой просмотр отложенных вхождений книги. Решения сохраняются в файле
+    проверки по мере ввода, так что прерванный просмотр продолжается с того же
+    места. Возвращает ответы {str(абзац): {str(позиция): ответ}} для повторной
+    обработки и таблицу ответов по правилам или None, если файл проверки не
+    подходит к книге.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}Не удалось прочитать файл проверки {file_path}: {e}{Style.RESET_ALL}")
+        return None
+    if data.get('version') != REVIEW_VERSION or data.get('source_sha1') != _file_hash(input_file):
+        print(f"{Fore.RED}Файл проверки {file_path} составлен для другой версии книги.{Style.RESET_ALL}")
+        return None
+    answers = {}
+    candidates = [DeferredCandidate(record, answers) for record in data['occurrences']]
+    review_orange_groups(candidates, data['decisions'], lambda: _save(file_path, data))
+    _save(file_path, data)
+    return answers, data.get('table', {})
@@ -0,0 +1,108 @@
+import re
+import bisect
+
+TAG_RE = re.compile(r'<[^>]+>')
+WORD_RE = re.compile(r'[\w\u0300-\u036F]+')
+
+class Span:
+    """
+    Замена фрагмента [start, end) родительского текста, сделанная одним из словарей.
+    cls — класс подсветки (highlight-blue, highlight-green, ...), rule — правило-источник.
+    Текст замены хранится в inner: жёлтый словарь может размечать его дальше.
+    """
+    __slots__ = ('start', 'end', 'cls', 'rule', 'inner')
+
+    def __init__(self, start, end, text, cls, rule=None):
+        self.start = start
+        self.end = end
+        self.cls = cls
+        self.rule = rule
+        self.inner = TextNode(text)
+
+    @property
+    def stage(self):
+        return self.cls[len('highlight-'):] if self.cls.startswith('highlight-') else self.cls
+
+class TextNode:
+    """
+    Текст со списком теговых диапазонов (вычисляются один раз) и упорядоченным
+    списком непересекающихся замен. Из этого представления в конце собираются
+    чистый текст и HTML с подсветкой.
+    """
+    __slots__ = ('text', 'tags', 'spans', '_regions')
+
+    def __init__(self, text):
+        self.text = text
+        self.tags = [m.span() for m in TAG_RE.finditer(text)] if '<' in text else []
+        self.spans = []
+        self._regions = None
+
+    def add_span(self, span):
+        keys = [(s.start, s.end) for s in self.spans]
+        self.spans.insert(bisect.bisect_right(keys, (span.start, span.end)), span)
+        self._regions = None
+        return span
+
+    def free_regions(self):
+        """Участки текста вне тегов и вне уже сделанных замен, в порядке следования."""
+        if self._regions is None:
+            blockers = sorted(self.tags + [(s.start, s.end) for s in self.spans])
+            regions = []
+            pos = 0
+            for start, end in blockers:
+                if start > pos: regions.append((pos, start))
+                pos = max(pos, end)
+            if pos < len(self.text): regions.append((pos, len(self.text)))
+            self._regions = regions
+        return list(self._regions)
+
+    def iter_nodes(self):
+        """Сам узел и все вложенные тексты замен (обход в глубину)."""
+        nodes = [self]
+        for span in self.spans:
+            nodes.extend(span.inner.iter_nodes())
+        return nodes
+
+    def render(self, tag=None, start=0, end=None):
+        """
+        Собирает текст с применёнными заменами. Если tag задан (например, 'span'),
+        каждая замена оборачивается в <tag class="...">, иначе получается чистый текст.
+        """
+        if end is None: end = len(self.text)
+        out = []
+        pos = start
+        for span in self.spans:
+            if span.start < start or span.start > end or (span.start == end and span.end > end): continue
+            out.append(self.text[pos:span.start])
+            if tag: out.append(f'<{tag} class="{span.cls}">')
+            out.append(span.inner.render(tag))
+            if tag: out.append(f'</{tag}>')
+            pos = span.end
+        if pos < end: out.append(self.text[pos:end])
+        return ''.join(out)
+
+class Paragraph(TextNode):
+    """Абзац (или целый документ EPUB), проходящий через все четыре словаря."""
+    __slots__ = ('_newlines',)
+
+    def __init__(self, text):
+        super().__init__(text)
+        self._newlines = None
+
+    def line_index(self, pos):
+        """Номер строки (с нуля) для позиции pos исходного текста."""
+        if self._newlines is None:
+            self._newlines = [i for i, ch in enumerate(self.text) if ch == '\n'] if '\n' in self.text else []
+        return bisect.bisect_left(self._newlines, pos)
+
+    def line_bounds(self, pos):
+        line = self.line_index(pos)
+        start = self._newlines[line - 1] + 1 if line > 0 else 0
+        end = self._newlines[line] if line < len(self._newlines) else len(self.text)
+        return start, end
+
+    def render_clean(self):
+        return self.render()
+
+    def render_html(self):
+        return self.render('span')
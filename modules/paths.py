@@ -180,6 +180,8 @@ def initialize_user_data(verbose=True):
                 dest_file = os.path.join(USER_DICTS_DIR, filename)
                 if filename.endswith('.txt'): merge_text_files(src_file, dest_file, verbose=verbose)
                 elif filename.endswith('.dic'): merge_dic_files(src_file, dest_file, verbose=verbose)
+        from . import dict_cache
+        dict_cache.rebuild()
         return True
     except Exception as e:
         print(f"Ошибка синхронизации: {e}")
@@ -314,6 +316,8 @@ def sync_dictionaries_from_github(progress_callback=None):
                 
         if success_count > 0:
             verify_orange_dic_in_base()
+            from . import dict_cache
+            dict_cache.rebuild()
             if progress_callback:
                 progress_callback("Синхронизация успешно завершена!")
             return True
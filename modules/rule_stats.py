@@ -0,0 +1,121 @@
+import os
+from time import perf_counter
+from contextlib import contextmanager
+from colorama import Fore, Style
+
+# Учёт включается на время collect(); пока он выключен (None), правила выполняются без замеров
+ACTIVE = None
+STAGES = ('blue', 'green', 'orange', 'yellow')
+# Сколько правил выводится в разделах отчёта о самых затратных правилах и об исключениях
+REPORT_TOP = 50
+# Исключения «перевешивают», если на их проверку уходит не меньше этой доли времени правила
+EXCEPTION_SHARE = 0.5
+
+class RuleCounter:
+    """
+    Счётчики одного правила: tried — запуски правила (на абзаце для синего,
+    зелёного и жёлтых правил с пробелами и знаками, на слове для оранжевого
+    и жёлтых правил-слов), matches — совпадения, принятые после исключений,
+    vetoes — совпадения, отброшенные исключениями, seconds — всё время правила,
+    exception_seconds — из него время проверки исключений (в seconds входит
+    и компиляция шаблона при первом запуске правила). Жёлтые правила-слова
+    запускаются по одному разу на форму слова (дальше решение берётся из
+    таблицы), поэтому их запуски и замены — это число различных форм.
+    """
+    __slots__ = ('tried', 'matches', 'vetoes', 'seconds', 'exception_seconds')
+
+    def __init__(self):
+        self.tried = self.matches = self.vetoes = 0
+        self.seconds = self.exception_seconds = 0.0
+
+    def veto(self, exceptions):
+        """Замена exceptions.matches, считающая отказы и время проверки исключений."""
+        def check(text):
+            started = perf_counter()
+            vetoed = exceptions.matches(text)
+            self.exception_seconds += perf_counter() - started
+            if vetoed: self.vetoes += 1
+            return vetoed
+        return check
+
+class RuleStats:
+    """Счётчики правил всех четырёх словарей по ключу (этап, строка правила из словаря)."""
+
+    def __init__(self):
+        self.rules = {}
+
+    def counter(self, stage, rule):
+        key = (stage, rule)
+        counter = self.rules.get(key)
+        if counter is None: counter = self.rules[key] = RuleCounter()
+        return counter
+
+    def register(self, dictionaries):
+        """Заводит счётчики для всех правил словарей, чтобы в отчёт попали и несработавшие."""
+        yo_dict, yo_variants, yo_no_regular_dict, regex_dict = dictionaries
+        for rule in yo_no_regular_dict: self.counter('blue', getattr(rule, 'original', rule))
+        for rule in regex_dict: self.counter('green', getattr(rule, 'original', rule))
+        for pattern, data in yo_variants.items(): self.counter('orange', data.get('original', pattern.pattern))
+        for data in yo_dict.rules: self.counter('yellow', data['original'])
+
+    def fullmatch(self, stage, rule, pattern, exceptions, word):
+        """Совпадение правила со словом целиком с учётом исключений (или None) и его учёт."""
+        counter = self.counter(stage, rule)
+        counter.tried += 1
+        started = perf_counter()
+        match = pattern.fullmatch(word)
+        if match:
+            if counter.veto(exceptions)(match.group()): match = None
+            else: counter.matches += 1
+        counter.seconds += perf_counter() - started
+        return match
+
+    def report(self, top=REPORT_TOP):
+        """Текст отчёта: итоги по словарям, самые затратные правила, несработавшие и с тяжёлыми исключениями."""
+        total = sum(c.seconds for c in self.rules.values()) or 1e-9
+
+        def row(key, c):
+            return (f"{key[0]:<7}{c.seconds * 1000:>10.1f}{c.seconds / total * 100:>7.1f}%{c.tried:>10}{c.matches:>9}"
+                    f"{c.vetoes:>8}{c.exception_seconds * 1000:>10.1f}  {key[1]}")
+
+        header = f"{'этап':<7}{'мс':>10}{'доля':>8}{'запуски':>10}{'замены':>9}{'отказы':>8}{'искл. мс':>10}  правило"
+        lines = ["Учёт правил словарей", "", f"{'этап':<7}{'правил':>8}{'мс':>10}{'запуски':>10}{'замены':>9}{'отказы':>8}{'без замен':>11}"]
+        for stage in STAGES:
+            counters = [c for key, c in self.rules.items() if key[0] == stage]
+            if not counters: continue
+            lines.append(f"{stage:<7}{len(counters):>8}{sum(c.seconds for c in counters) * 1000:>10.1f}{sum(c.tried for c in counters):>10}"
+                         f"{sum(c.matches for c in counters):>9}{sum(c.vetoes for c in counters):>8}{sum(1 for c in counters if not c.matches):>11}")
+
+        ranked = sorted(self.rules.items(), key=lambda item: -item[1].seconds)
+        lines += ["", f"Самые затратные правила (первые {top}):", header]
+        lines += [row(key, c) for key, c in ranked[:top] if c.seconds]
+
+        dead = [(key, c) for key, c in ranked if not c.matches]
+        lines += ["", f"Правила без замен ({len(dead)}); запуски=0 — правило не дошло до проверки:", header]
+        lines += [row(key, c) for key, c in sorted(dead, key=lambda item: (STAGES.index(item[0][0]), -item[1].seconds))]
+
+        heavy = [(key, c) for key, c in self.rules.items() if c.seconds and c.exception_seconds >= c.seconds * EXCEPTION_SHARE]
+        heavy.sort(key=lambda item: -item[1].exception_seconds)
+        lines += ["", f"Правила, где больше {EXCEPTION_SHARE:.0%} времени уходит на исключения (первые {top}):", header]
+        lines += [row(key, c) for key, c in heavy[:top]]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+
+@contextmanager
+def collect(report_file=None):
+    """
+    Включает учёт правил на время блока. По выходе из блока (в том числе по
+    прерыванию) отчёт записывается в report_file, если он задан.
+    """
+    global ACTIVE
+    stats = ACTIVE = RuleStats()
+    try:
+        yield stats
+    finally:
+        ACTIVE = None
+        if report_file:
+            stats.write(report_file)
+            print(f"{Fore.GREEN}Учёт правил: {os.path.abspath(report_file)}{Style.RESET_ALL}")
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from colorama import Fore, Style
+from . import paths
+
+# Сервер слушает только петлевой интерфейс: запросы принимаются лишь с этой машины
+HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Как часто (в секундах) проверяются файлы словарей
+WATCH_INTERVAL = 2.0
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# Порядок аргументов yorz.load_dictionaries
+DICTIONARY_NAMES = ('green', 'blue', 'yellow', 'orange')
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+def dictionary_files():
+    return tuple(paths.get_path(f"dictionaries/{name}.dic") for name in DICTIONARY_NAMES)
+
+def files_signature(files):
+    """Размер и mtime каждого файла (None — файла нет): по ним замечаются правки словарей."""
+    result = []
+    for file_path in files:
+        try:
+            st = os.stat(file_path)
+            result.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+def output_paths(file_path):
+    """Чистая версия и HTML с подсветкой, которые ёфикатор создаёт рядом с книгой."""
+    base, ext = os.path.splitext(os.path.abspath(file_path))
+    ext = ext.lower() if ext.lower() in ('.fb2', '.epub', '.md') else '.txt'
+    return base + '_yo' + ext, base + '_yo.html'
+
+def yofy_text(text, dictionaries, orange='defer', orange_table=None, html=False):
+    """
+    Ёфикация строки без файлов и сессии: текст обрабатывается по строкам, как
+    книга .txt. Омографы решаются политикой orange (см. orange_review.OrangePolicy).
+    Возвращает {'text': чистый текст, 'spans': замены, 'deferred': отложенные
+    омографы} и 'html' — текст с подсветкой, если html. Замены — см. collect_changes.
+    """
+    from .yorz import process_paragraph
+    from .orange_review import OrangePolicy, load_orange_table
+    table = load_orange_table(orange_table) if orange == 'table' else None
+    # Таблица решений жёлтого словаря — только по словам этого запроса (иначе в рабочем процессе
+    # сервера она росла бы со всеми запросами)
+    dictionaries[0].reset_vocabulary()
+    deferred = {}
+    policy = OrangePolicy(orange, dictionaries[1], table, deferred)
+    clean, marked, spans, line_starts = [], [], [], []
+    offset = out_offset = 0
+    for index, line in enumerate(text.split('\n')):
+        line_starts.append(offset)
+        out_line = marked_line = line
+        if line.strip():
+            paragraph = process_paragraph(line, dictionaries, {}, index, policy=partial(policy, index))
+            out_line = paragraph.render_clean()
+            if html: marked_line = paragraph.render_html()
+            collect_changes(paragraph, offset, out_offset, spans)
+        clean.append(out_line)
+        marked.append(marked_line)
+        offset += len(line) + 1
+        out_offset += len(out_line) + 1
+
+    result = {'text': '\n'.join(clean), 'spans': spans, 'deferred': []}
+    for record in sorted(deferred.values(), key=lambda r: (r['index'], r['start'])):
+        start = line_starts[record['index']] + record['start']
+        result['deferred'].append({'start': start, 'end': start + len(record['word']), 'line': record['line'], 'rule': record['original'],
+                                   'base_word': record['base_word'], 'yo_word': record['yo_word']})
+    if html: result['html'] = '\n'.join(marked)
+    return result
+
+def collect_changes(node, start, out_start, changes, chain=()):
+    """
+    Дописывает в changes изменения текста узла (абзаца или текста вложенной замены)
+    по порядку и возвращает длину собранного текста узла. Изменение — позиции
+    start/end в исходном тексте и out_start/out_end в чистом, исходный и новый
+    фрагменты, этап (blue, green, orange, yellow) и правило последней замены,
+    изменившей фрагмент. Если фрагмент меняли и объемлющие замены (жёлтый словарь
+    внутри замены зелёного или несколько правил жёлтого), их этапы и правила
+    перечислены в 'outer' (от внешней к внутренней). Замена, меняющая длину текста,
+    описывается одним изменением вместе со всеми вложенными: позиции внутри неё
+    не соответствуют исходным.
+    chain — замены, в текст которых вложен узел: (замена, заменённый текст, её текст),
+    тексты обрезаны до узла.
+    """
+    text = node.text
+    source = chain[0][1] if chain else text
+    if any(len(replaced) != len(own) for _, replaced, own in chain):
+        rendered = node.render()
+        if rendered != source: changes.append(_change([span for span, _, _ in chain], start, source, out_start, rendered))
+        return len(rendered)
+
+    def segment(a, b):
+        # Участок узла вне вложенных замен: его меняли те замены цепочки, что изменили эти символы
+        if text[a:b] != source[a:b]:
+            changed = [span for span, replaced, own in chain if replaced[a:b] != own[a:b]]
+            changes.append(_change(changed, start + a, source[a:b], out_start + out, text[a:b]))
+
+    pos = out = 0
+    for span in node.spans:
+        segment(pos, span.start)
+        out += span.start - pos
+        inner = tuple((outer, replaced[span.start:span.end], own[span.start:span.end]) for outer, replaced, own in chain)
+        inner += ((span, text[span.start:span.end], span.inner.text),)
+        out += collect_changes(span.inner, start + span.start, out_start + out, changes, inner)
+        pos = span.end
+    segment(pos, len(text))
+    return out + len(text) - pos
+
+def _change(spans, start, original, out_start, replacement):
+    change = {'start': start, 'end': start + len(original), 'out_start': out_start, 'out_end': out_start + len(replacement),
+              'original': original, 'replacement': replacement, 'stage': spans[-1].stage, 'rule': spans[-1].rule}
+    if len(spans) > 1: change['outer'] = [{'stage': span.stage, 'rule': span.rule} for span in spans[:-1]]
+    return change
+
+_worker_dictionaries = None
+
+def _init_worker(dict_files):
+    """Инициализация рабочего процесса: словари загружаются один раз (из кэша)."""
+    import signal
+    from . import yorz
+    global _worker_dictionaries
+    # Ctrl+C обрабатывает процесс сервера
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_dictionaries = yorz.load_dictionaries(*dict_files)
+
+def _worker_ready():
+    return os.getpid()
+
+def _worker_text(text, options):
+    return yofy_text(text, _worker_dictionaries, **options)
+
+def _worker_file(file_path, options):
+    """Ёфикация книги с нуля (незаконченная обработка не продолжается); вывод ёфикатора — в 'log'."""
+    import io
+    import contextlib
+    from . import yorz
+    from .orange_review import review_file_path
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            ok = bool(yorz.replace_expressions(input_file=file_path, app_version=paths.get_app_version(), orange_mode=options['orange'],
+                                               preview=options['preview'], resume=False, dictionaries=_worker_dictionaries,
+                                               orange_table=options['orange_table']))
+        except Exception as e:
+            print(f"Ошибка: {e}")
+            ok = False
+    result = {'ok': ok, 'log': ANSI_RE.sub('', log.getvalue())}
+    if ok:
+        output_clean, output_html = output_paths(file_path)
+        review_file = review_file_path(file_path)
+        result.update(output=output_clean, html=output_html if options['preview'] else None,
+                      review=review_file if os.path.exists(review_file) else None)
+    return result
+
+class YofyService:
+    """
+    Пул рабочих процессов с загруженными словарями. Когда файлы словарей
+    меняются, запускается новый пул, а запросы, начатые на старом, дорабатываются
+    на нём.
+    """
+
+    def __init__(self, jobs=1, dict_files=None):
+        self.jobs = jobs
+        self.dict_files = dict_files or dictionary_files()
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.pool = None
+        self.signature = None
+        self.loaded_at = None
+        self.generation = 0
+        self.requests = 0
+        self.file_locks = {}
+        self.reload()
+
+    def reload(self):
+        """Загружает словари заново и заменяет ими пул. При ошибке остаётся прежний пул."""
+        from concurrent.futures import ProcessPoolExecutor
+        from . import yorz
+        with self.reload_lock:
+            signature = files_signature(self.dict_files)
+            started = time.perf_counter()
+            # Загрузка здесь проверяет словари и перестраивает их кэш один раз, а не в каждом процессе
+            yorz.load_dictionaries(*self.dict_files)
+            pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(self.dict_files,))
+            for future in [pool.submit(_worker_ready) for _ in range(self.jobs)]:
+                future.result()
+            with self.lock:
+                old_pool, self.pool = self.pool, pool
+                self.signature, self.loaded_at = signature, time.time()
+                self.generation += 1
+            if old_pool is not None: old_pool.shutdown(wait=False)
+            print(f"{Fore.GREEN}Словари загружены за {time.perf_counter() - started:.1f} с (процессов: {self.jobs}).{Style.RESET_ALL}")
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Следит за файлами словарей и перезагружает их, когда запись закончена (размер и mtime не меняются)."""
+        pending = self.signature
+        while not self.stopped.wait(interval):
+            current = files_signature(self.dict_files)
+            if current != self.signature and current == pending:
+                print(f"{Fore.YELLOW}Словари изменились, загружаю заново...{Style.RESET_ALL}")
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Исправленный словарь снова изменит подпись и вызовет перезагрузку
+                    self.signature = current
+                    print(f"{Fore.RED}Не удалось загрузить словари, работают прежние: {e}{Style.RESET_ALL}")
+            pending = current
+
+    def run(self, fn, *args):
+        from concurrent.futures.process import BrokenProcessPool
+        with self.lock:
+            self.requests += 1
+            future = self.pool.submit(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # Рабочий процесс аварийно завершился: пул заменяется, запрос можно повторить
+            self.reload()
+            raise
+
+    def file_lock(self, file_path):
+        with self.lock:
+            return self.file_locks.setdefault(file_path, threading.Lock())
+
+    def handle(self, request):
+        """
+        Запрос {'text': строка} или {'file': путь к книге} с необязательными 'orange'
+        (keep, yo, table, defer; по умолчанию defer), 'orange_table' (таблица для
+        table), 'html' (для текста) и 'preview' (для книги). Ответ для текста —
+        см. yofy_text, для книги — {'ok', 'output', 'html', 'review', 'log'}.
+        Ошибка в запросе — ValueError.
+        """
+        from .yorz import ORANGE_POLICIES
+        if not isinstance(request, dict): raise ValueError("ожидается объект JSON")
+        orange = request.get('orange', 'defer')
+        if orange not in ORANGE_POLICIES: raise ValueError(f"orange: одно из {', '.join(ORANGE_POLICIES)}")
+        orange_table = request.get('orange_table')
+        if orange == 'table':
+            if not orange_table or not os.path.isfile(orange_table): raise ValueError("для orange=table нужен файл orange_table")
+            orange_table = os.path.abspath(orange_table)
+
+        if 'text' in request:
+            if not isinstance(request['text'], str): raise ValueError("text должен быть строкой")
+            return self.run(_worker_text, request['text'], {'orange': orange, 'orange_table': orange_table, 'html': bool(request.get('html'))})
+        if 'file' in request:
+            file_path = os.path.abspath(str(request['file']))
+            if not os.path.isfile(file_path): raise ValueError(f"файл не найден: {file_path}")
+            # Одна книга одновременно обрабатывается одним запросом: у неё общие сессия и выходные файлы
+            with self.file_lock(file_path):
+                return self.run(_worker_file, file_path, {'orange': orange, 'orange_table': orange_table, 'preview': bool(request.get('preview', True))})
+        raise ValueError("нужно поле text или file")
+
+    def status(self):
+        return {'version': paths.get_app_version(), 'jobs': self.jobs, 'generation': self.generation, 'requests': self.requests,
+                'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.loaded_at)),
+                'dictionaries': dict(zip(DICTIONARY_NAMES, self.dict_files))}
+
+    def close(self):
+        self.stopped.set()
+        if self.pool is not None: self.pool.shutdown(wait=True)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """GET /status, POST /yofy (запрос JSON, см. YofyService.handle), POST /reload."""
+    server_version = 'YoRZ'
+
+    def log_message(self, format, *args):
+        if self.server.verbose: super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status': self.send_json(200, self.server.service.status())
+        else: self.send_json(404, {'error': f"неизвестный адрес: {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_REQUEST_BYTES: raise ValueError(f"запрос больше {MAX_REQUEST_BYTES} байт")
+            body = self.rfile.read(length)
+            if self.path == '/reload':
+                service.reload()
+                return self.send_json(200, service.status())
+            if self.path != '/yofy': return self.send_json(404, {'error': f"неизвестный адрес: {self.path}"})
+            self.send_json(200, service.handle(json.loads(body.decode('utf-8'))))
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+def serve(port=DEFAULT_PORT, jobs=1, verbose=False):
+    """Сервер ёфикации на 127.0.0.1:port до Ctrl+C. Возвращает код завершения."""
+    paths.ensure_user_data_exists()
+    try:
+        service = YofyService(jobs)
+    except Exception as e:
+        print(f"{Fore.RED}Не удалось загрузить словари: {e}{Style.RESET_ALL}")
+        return 1
+    try:
+        httpd = ThreadingHTTPServer((HOST, port), RequestHandler)
+    except OSError as e:
+        print(f"{Fore.RED}Не удалось открыть порт {port}: {e}{Style.RESET_ALL}")
+        service.close()
+        return 1
+    httpd.daemon_threads = True
+    httpd.service = service
+    httpd.verbose = verbose
+    threading.Thread(target=service.watch, daemon=True).start()
+    print(f"{Fore.CYAN}Сервер ёфикации: http://{HOST}:{port} (остановка — Ctrl+C){Style.RESET_ALL}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{Fore.YELLOW}Сервер остановлен.{Style.RESET_ALL}")
+    finally:
+        httpd.server_close()
+        service.close()
+    return 0
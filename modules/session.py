@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import time
+
+# Как часто (в секундах) сохраняется контрольная точка во время обработки (со сбросом на диск)
+CHECKPOINT_INTERVAL = 30
+
+class Session:
+    """
+    Незаконченная ёфикация файла: небольшой заголовок .{имя}.yorz_session (JSON:
+    processed_index, replace_all_choices, решения по омографам и т. п.) и журнал
+    .{имя}.yorz_journal, куда по мере обработки дописываются готовые фрагменты
+    (по строке JSON [html, clean] на фрагмент). Сохранение пишет только заголовок
+    с текущим размером журнала, поэтому стоит столько же, сколько новые фрагменты;
+    при продолжении журнал обрезается до этого размера и читается потоково.
+    Заголовок заменяется атомарно (запись во временный файл и переименование),
+    так что после сбоя на диске остаётся последняя целая контрольная точка.
+    """
+
+    def __init__(self, input_file):
+        base_dir = os.path.dirname(os.path.abspath(input_file))
+        base_name = os.path.basename(input_file)
+        self.file = os.path.join(base_dir, f".{base_name}.yorz_session")
+        self.journal_file = os.path.join(base_dir, f".{base_name}.yorz_journal")
+        self.data = self._empty()
+        self._journal = None
+        self._synced_at = time.monotonic()
+
+    @staticmethod
+    def _empty():
+        return {'processed_index': 0, 'replace_all_choices': {}, 'journal_size': 0}
+
+    def due(self):
+        """Пора ли сохранить очередную контрольную точку со сбросом на диск."""
+        return time.monotonic() - self._synced_at >= CHECKPOINT_INTERVAL
+
+    def exists(self):
+        return os.path.exists(self.file)
+
+    def load(self):
+        """Читает заголовок; сессии старого формата (фрагменты внутри JSON) переносятся в журнал."""
+        try:
+            with open(self.file, 'r', encoding='utf-8') as sf:
+                data = json.load(sf)
+            html_contents = data.pop('html_contents', None) or []
+            clean_contents = data.pop('clean_contents', None)
+            if clean_contents is None:
+                # Самый старый формат: абзацы сохранены с временной разметкой <yorz>
+                clean_contents = [re.sub(r'</?yorz[^>]*>', '', c) for c in html_contents]
+                html_contents = [re.sub(r'<(/?)yorz', r'<\1span', c) for c in html_contents]
+            if html_contents:
+                self.data = data
+                self.reset_journal()
+                for i, html in enumerate(html_contents):
+                    self.append(html, clean_contents[i] if i < len(clean_contents) else None)
+                self.data['journal_size'] = self._flush()
+            else:
+                size = data.setdefault('journal_size', 0)
+                if size:
+                    if os.path.getsize(self.journal_file) < size:
+                        raise ValueError("журнал сессии повреждён или неполон")
+                    with open(self.journal_file, 'r+b') as jf:
+                        jf.truncate(size)
+                self.data = data
+        except Exception:
+            self.data = self._empty()
+            self.reset_journal()
+            raise
+        return self.data
+
+    def append(self, html, clean=None):
+        """Дописывает в журнал готовый фрагмент."""
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8', newline='')
+        self._journal.write(json.dumps([html, clean], ensure_ascii=False) + '\n')
+
+    def records(self):
+        """Фрагменты журнала по порядку, пары (html, clean); файл читается потоково."""
+        self._flush()
+        if not os.path.exists(self.journal_file): return
+        with open(self.journal_file, 'r', encoding='utf-8', newline='') as jf:
+            for line in jf:
+                html, clean = json.loads(line)
+                yield html, clean
+
+    def _flush(self):
+        if self._journal is None:
+            return os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+        self._journal.flush()
+        return self._journal.tell()
+
+    def save(self, sync=False):
+        """
+        Сохраняет заголовок; все дописанные фрагменты к этому моменту уже в журнале.
+        С sync журнал и заголовок сбрасываются на диск (os.fsync) до переименования.
+        """
+        self.data['journal_size'] = self._flush()
+        if sync and self._journal is not None: os.fsync(self._journal.fileno())
+        tmp_file = self.file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as sf:
+            json.dump(self.data, sf, ensure_ascii=False)
+            if sync:
+                sf.flush()
+                os.fsync(sf.fileno())
+        os.replace(tmp_file, self.file)
+        if sync: self._synced_at = time.monotonic()
+
+    def reset_journal(self):
+        self.close()
+        if os.path.exists(self.journal_file): os.remove(self.journal_file)
+        self.data['journal_size'] = 0
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def discard(self):
+        """Удаляет заголовок и журнал (обработка завершена или начата заново)."""
+        self.reset_journal()
+        for file_path in (self.file, self.file + '.tmp'):
+            if os.path.exists(file_path): os.remove(file_path)
@@ -65,6 +65,7 @@ def run(input_filename=None):
             for word in sorted_words:
                 f.write(word + "\n")
         print(f"{Fore.GREEN}Сортировка и фильтрация завершены. Файл {os.path.basename(input_filename)} успешно перезаписан.{Style.RESET_ALL}")
+        return True
     except Exception as e:
         print(f"{Fore.RED}Ошибка при записи файла {input_filename}: {e}{Style.RESET_ALL}")
 
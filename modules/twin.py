@@ -2,6 +2,7 @@ import os
 import re
 from colorama import Fore, Style
 from . import paths
+from . import dict_cache
 
 def find_word_pairs(input_file=None, orange_file=None):
     if input_file is None: input_file = paths.get_path('dictionaries/yellow_base.txt')
@@ -26,7 +27,7 @@ def find_word_pairs(input_file=None, orange_file=None):
 
     if not pairs:
         print(f"{Fore.YELLOW}Новых пар омографов не найдено.{Style.RESET_ALL}")
-        return
+        return True
 
     # Загружаем существующие правила из orange.dic, чтобы не дублировать
     existing_regexes = []
@@ -60,11 +61,13 @@ def find_word_pairs(input_file=None, orange_file=None):
                 f.write("\n# --- Добавлено автоматически ---\n")
             f.writelines(new_pairs)
         print(f"{Fore.GREEN}Найдено и добавлено новых пар в orange.dic: {len(new_pairs)}{Style.RESET_ALL}")
+        dict_cache.rebuild()
     else:
         print(f"{Fore.YELLOW}Все найденные пары уже есть в orange.dic.{Style.RESET_ALL}")
+    return True
 
 def run(input_file=None, orange_file=None):
-    find_word_pairs(input_file, orange_file)
+    return find_word_pairs(input_file, orange_file)
 
 if __name__ == '__main__':
     run()
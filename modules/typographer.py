@@ -413,19 +413,23 @@ def run(input_file="book.txt", output_file=None, remove_all_empty=False, keep_le
 
     if is_epub:
         import zipfile
-        from modules.epub_utils import get_ordered_infolist
+        from modules.epub_utils import get_ordered_infolist, EpubWriter
         try:
             with zipfile.ZipFile(input_file, 'r') as zin:
-                with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
+                with EpubWriter(output_file, zin) as zout:
                     for item in get_ordered_infolist(zin):
+                        if not item.filename.lower().endswith(('.html', '.xhtml', '.htm', '.opf')):
+                            # Картинки, шрифты и прочее копируются без перепаковки
+                            zout.copy(item)
+                            continue
                         content = zin.read(item.filename)
                         if item.filename.lower().endswith(('.html', '.xhtml', '.htm')):
                             try:
                                 text = content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
                                 processed = process_content_with_tags(text, options, total_stats)
-                                zout.writestr(item, processed.encode('utf-8'))
+                                zout.write(item, processed.encode('utf-8'))
                             except Exception as e:
-                                zout.writestr(item, content)
+                                zout.copy(item)
                         elif item.filename.lower().endswith('.opf'):
                             try:
                                 text_content = content.decode('utf-8')
@@ -443,11 +447,9 @@ def run(input_file="book.txt", output_file=None, remove_all_empty=False, keep_le
                                     meta_tag = f'\n    <meta name="{today_str}:" content="{new_meta_str}"/>\n'
                                     text_content = text_content.replace('</metadata>', meta_tag + '</metadata>')
                                 
-                                zout.writestr(item, text_content.encode('utf-8'))
+                                zout.write(item, text_content.encode('utf-8'))
                             except Exception as e:
-                                zout.writestr(item, content)
-                        else:
-                            zout.writestr(item, content)
+                                zout.copy(item)
         except Exception as e:
             print(f"{Fore.RED}Ошибка при работе с EPUB архивом: {e}{Style.RESET_ALL}")
             return
@@ -542,6 +544,7 @@ def run(input_file="book.txt", output_file=None, remove_all_empty=False, keep_le
             if total_stats.deyo_replaced > 0: print(f"  - Проведена деёфикация (Ё -> Е): {total_stats.deyo_replaced}")
 
     print(f"{Fore.GREEN}{'#'*78}{Style.RESET_ALL}\n")
+    return True
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
@@ -45,6 +45,7 @@ def expand_parentheses(match):
     return "(" + ":".join(new_tokens) + ")"
 
 from . import paths
+from . import dict_cache
 
 def run():
     missing_files = []
@@ -100,6 +101,8 @@ def run():
             f.write(line + "\n")
 
     print(f"{Fore.GREEN}Словарь {files['dic']} для ёфикатора YoRZ сформирован.{Style.RESET_ALL}")
+    dict_cache.rebuild()
+    return True
 
 if __name__ == "__main__":
     run()
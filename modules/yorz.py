@@ -2,30 +2,97 @@ import re
 import os
 import zipfile
 import sys
-import unicodedata
+from functools import lru_cache, partial
+from time import perf_counter
+from dataclasses import dataclass
 from colorama import Fore, Style
+from .aho_corasick import AhoCorasick
+from .paragraph import Paragraph, Span, TAG_RE, WORD_RE
+from .text_utils import remove_diacritics
+from . import rule_stats
 
-def remove_diacritics(text):
-    nfd_text = unicodedata.normalize("NFD", text)
-    result_chars = []
-    i = 0
-    while i < len(nfd_text):
-        ch = nfd_text[i]
-        if unicodedata.category(ch) != "Mn":
-            cluster = [ch]
-            i += 1
-            while i < len(nfd_text) and unicodedata.category(nfd_text[i]) == "Mn":
-                cluster.append(nfd_text[i])
-                i += 1
-            if ch.lower() == "е" and "\u0308" in cluster[1:]:
-                result_chars.extend(cluster)
-            elif ch.lower() == "и" and "\u0306" in cluster[1:]:
-                result_chars.extend(cluster)
-            else:
-                result_chars.append(ch)
-        else:
-            i += 1
-    return unicodedata.normalize("NFC", "".join(result_chars))
+REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+EXC_WORD_RE = re.compile(r'\w+')
+
+class ExceptionMatcher:
+    """
+    Исключения одного правила. Обычные слова и фразы хранятся в frozenset
+    и проверяются поиском в множестве; регулярными выражениями (\\b...\\b)
+    остаются только исключения с шаблонами вроде \\w* и \\w+.
+    """
+    __slots__ = ('literals', 'max_words', 'patterns')
+
+    def __init__(self, exceptions):
+        literals = set()
+        patterns = []
+        for exc in exceptions:
+            exc = re.sub(r'\\(w[\*\+])', r'\\\1', exc.strip())
+            if exc and not REGEX_SPECIAL_CHARS.intersection(exc) and EXC_WORD_RE.match(exc[0]) and EXC_WORD_RE.match(exc[-1]):
+                literals.add(exc.lower())
+                continue
+            try: patterns.append(re.compile(fr'\b{exc}\b', re.I))
+            except re.error: pass
+        self.literals = frozenset(literals)
+        self.max_words = max((len(EXC_WORD_RE.findall(exc)) for exc in literals), default=0)
+        self.patterns = tuple(patterns)
+
+    def __bool__(self):
+        return bool(self.literals or self.patterns)
+
+    def matches(self, text):
+        """Истина, если в тексте совпадения встречается одно из исключений (как отдельное слово/фраза)."""
+        if not self.literals and not self.patterns: return False
+        clean = remove_diacritics(text)
+        if self.literals:
+            lowered = clean.lower()
+            if lowered in self.literals: return True
+            # Кандидаты — фрагменты от начала одного слова до конца другого (не длиннее max_words слов)
+            spans = [m.span() for m in EXC_WORD_RE.finditer(lowered)]
+            for i, (start, _) in enumerate(spans):
+                for j in range(i, min(len(spans), i + self.max_words)):
+                    if lowered[start:spans[j][1]] in self.literals: return True
+        return any(exc.search(clean) for exc in self.patterns)
+
+class LazyPattern:
+    """
+    Регулярное выражение, которое компилируется при первом использовании.
+    Словари содержат сотни правил, а в конкретном тексте срабатывает лишь часть
+    из них, поэтому загрузка (в том числе из кэша) не тратит время на компиляцию.
+    """
+    __slots__ = ('pattern', 'flags', '_compiled')
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled = None
+
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        return self._compiled
+
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        return getattr(self.compiled(), name)
+
+    def __getstate__(self):
+        return (self.pattern, self.flags)
+
+    def __setstate__(self, state):
+        self.pattern, self.flags = state
+        self._compiled = None
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPattern): return (self.pattern, self.flags) == (other.pattern, other.flags)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.pattern, self.flags))
+
+    def __repr__(self):
+        # Повторяет repr(re.compile(...)): по нему сортируются правила жёлтого словаря
+        flags = ', re.IGNORECASE' if self.flags & re.I else ''
+        return f"re.compile({repr(self.pattern)[:200]}{flags})"
 
 def load_yo_dict(file_path):
     yo_dict = {}
@@ -58,84 +125,286 @@ def load_yo_dict(file_path):
                     except IndexError: break
             replacement = ''.join(parts_repl)
 
-            try: pattern = re.compile(pattern_str, re.I)
-            except re.error: continue
+            pattern = LazyPattern(pattern_str, re.I)
 
-            exc_patterns = []
-            if rest:
-                exc_part = rest[0].split(')', 1)[0].strip()
-                for exc in exc_part.split(':'):
-                    exc = re.sub(r'\\(w[\*\+])', r'\\\1', exc.strip())
-                    try: exc_patterns.append(re.compile(fr'\b{exc}\b', re.I))
-                    except re.error: pass
+            exc_patterns = ExceptionMatcher(rest[0].split(')', 1)[0].strip().split(':') if rest else ())
 
             yo_dict[key] = {
+                'original': key,
                 'replace': replacement,
+                'literals': [seg for seg in re.split(r'\\w[\*\+]', key) if seg],
                 'exceptions_compiled': exc_patterns,
                 'pattern': pattern,
                 'priority': len(key.replace(r'\w', ''))
             }
     return yo_dict
 
+CASE_TOKEN_RE = re.compile(r'\w+|\W+')
+FIRST_LETTER_RE = re.compile(r'[a-zA-Zа-яА-ЯёЁ]')
+# Регистр токена: без букв, строчный, с заглавной, прописной
+CASE_NONE, CASE_LOWER, CASE_TITLE, CASE_UPPER = range(4)
+
+@lru_cache(maxsize=4096)
+def case_pattern(text):
+    """
+    Разбирает регистр текста совпадения один раз: кортеж классов его токенов
+    (слова и промежутки между ними) и признак «весь текст прописными».
+    """
+    classes = []
+    for token in CASE_TOKEN_RE.findall(text):
+        if not any(c.isalpha() for c in token): classes.append(CASE_NONE)
+        elif token.isupper(): classes.append(CASE_UPPER)
+        elif token.istitle(): classes.append(CASE_TITLE)
+        else: classes.append(CASE_LOWER)
+    return tuple(classes), text.isupper()
+
+def _apply_token_case(case, token):
+    if case == CASE_NONE or not any(c.isalpha() for c in token): return token
+    if case == CASE_UPPER: return token.upper()
+    if case == CASE_TITLE: return token.title()
+    return token.lower()
+
+@lru_cache(maxsize=16384)
+def transfer_case(original_text, replacement):
+    """Переносит регистр original_text на replacement (результаты запоминаются)."""
+    classes, whole_upper = case_pattern(original_text)
+    replacement_words = CASE_TOKEN_RE.findall(replacement)
+
+    if len(classes) == len(replacement_words):
+        return ''.join(_apply_token_case(case, word) for case, word in zip(classes, replacement_words))
+
+    # Число токенов изменилось (например, "яркозеленой" -> "ярко-зелёной")
+    alpha_classes = [case for case in classes if case != CASE_NONE]
+    if not alpha_classes:
+        return replacement
+    if whole_upper:
+        return replacement.upper()
+    if alpha_classes[0] in (CASE_TITLE, CASE_UPPER):
+        if replacement:
+            # Заглавной делается первая буква, ведущие небуквенные символы сохраняются
+            match_alpha = FIRST_LETTER_RE.search(replacement)
+            if match_alpha:
+                idx = match_alpha.start()
+                return replacement[:idx] + replacement[idx].upper() + replacement[idx+1:].lower()
+            else:
+                return replacement[0].upper() + replacement[1:].lower()
+        return replacement
+    return replacement.lower()
+
 def preserve_case(match, replacement):
-    original_text = match.group()
-    original_words = re.findall(r'\w+|\W+', original_text)
-    replacement_words = re.findall(r'\w+|\W+', replacement)
-    
-    if len(original_words) == len(replacement_words):
-        result = []
-        for orig_word, repl_word in zip(original_words, replacement_words):
-            if not any(c.isalpha() for c in orig_word) or not any(c.isalpha() for c in repl_word):
-                result.append(repl_word)
-            elif orig_word.isupper() and any(c.isalpha() for c in orig_word):
-                result.append(repl_word.upper())
-            elif orig_word.istitle() and any(c.isalpha() for c in orig_word):
-                result.append(repl_word.title())
+    return transfer_case(match.group(), replacement)
+
+WORD_CHARS_RE = re.compile(r'[\w\u0300-\u036F]*')
+
+def has_e(text):
+    """Есть ли в тексте «е»/«Е»: без неё не срабатывает ни одно правило, ставящее «ё»."""
+    return 'е' in text or 'Е' in text
+
+def literals_need_e(literals):
+    """Правило с такими литеральными фрагментами может совпасть только с текстом, где есть «е»."""
+    return any('е' in lit.casefold() for lit in literals)
+
+class YellowMatcher:
+    """
+    Движок жёлтого словаря: правила сортируются и индексируются один раз.
+    Правила, совпадающие ровно с одним словом, ищутся через автомат Ахо-Корасик
+    по литеральным фрагментам корней, поэтому каждое слово абзаца проверяется
+    только на правилах-кандидатах. Прочие правила (с пробелами и знаками внутри)
+    выполняются прежним способом — отдельным проходом регулярного выражения.
+    """
+
+    def __init__(self, yo_dict):
+        sorted_data = sorted(yo_dict.values(), key=lambda x: (-x['priority'], str(x['pattern'])))
+        # Последовательность блоков: ('words', [индексы правил]) или ('regex', правило)
+        self.rules = sorted_data
+        self.blocks = []
+        for idx, data in enumerate(sorted_data):
+            literals = data.get('literals', [])
+            if all(WORD_CHARS_RE.fullmatch(lit) for lit in literals):
+                if not self.blocks or self.blocks[-1][0] != 'words':
+                    self.blocks.append(('words', []))
+                self.blocks[-1][1].append(idx)
             else:
-                result.append(repl_word.lower())
-        return ''.join(result)
-    else:
-        # Handling cases where number of tokens changed (e.g. "яркозеленой" -> "ярко-зелёной")
-        if not any(c.isalpha() for c in original_text):
-            return replacement
-            
-        alpha_orig = [w for w in original_words if any(c.isalpha() for c in w)]
-        if not alpha_orig:
-            return replacement
-            
-        first_word = alpha_orig[0]
-        
-        if original_text.isupper():
-            return replacement.upper()
-        
-        if first_word.istitle() or first_word.isupper():
-            if replacement:
-                # Need to find the first letter to capitalize, preserving potential leading non-alpha
-                match_alpha = re.search(r'[a-zA-Zа-яА-ЯёЁ]', replacement)
-                if match_alpha:
-                    idx = match_alpha.start()
-                    return replacement[:idx] + replacement[idx].upper() + replacement[idx+1:].lower()
-                else:
-                    return replacement[0].upper() + replacement[1:].lower()
-            return replacement
-            
-        return replacement.lower()
-
-def replace_yo_in_text(text, yo_dict):
-    tag_pattern = re.compile(r'(<[^>]+>)')
-    sorted_data = sorted(yo_dict.values(), key=lambda x: (-x['priority'], str(x['pattern'])))
-    for data in sorted_data:
-        parts = tag_pattern.split(text)
-        for i in range(0, len(parts), 2):
-            if not parts[i].strip(): continue
-            parts[i] = data['pattern'].sub(
-                lambda m: (
-                    m.group() if any(exc.search(remove_diacritics(m.group())) for exc in data['exceptions_compiled'])
-                    else f'<yorz class="highlight-yellow">{preserve_case(m, m.expand(data["replace"]))}</yorz>'
-                ), parts[i]
-            )
-        text = ''.join(parts)
-    return text
+                self.blocks.append(('regex', data))
+
+        self.automata = []
+        for kind, payload in self.blocks:
+            if kind != 'words':
+                self.automata.append(None)
+                continue
+            automaton = AhoCorasick()
+            always = []
+            for idx in payload:
+                anchor = max(self.rules[idx].get('literals', []), key=len, default='').lower()
+                if anchor: automaton.add(anchor, idx)
+                else: always.append(idx)
+            automaton.build()
+            self.automata.append((automaton, always))
+        # Если «е» нужна всем правилам, узлы и слова без неё пропускаются
+        self.needs_e = all(literals_need_e(data.get('literals', [])) for data in self.rules)
+        self.reset_vocabulary()
+
+    def reset_vocabulary(self):
+        """Очищает таблицы решений по словам (для каждого блока слов своя)."""
+        self.vocabulary = [{} if kind == 'words' else None for kind, _ in self.blocks]
+
+    def prepare(self, texts):
+        """
+        Проход по словарю книги перед обработкой: каждое различное слово
+        разрешается один раз, дальше абзацы обрабатываются поиском в таблице.
+        Слова, появившиеся после замен других словарей, досчитываются по ходу.
+        """
+        self.reset_vocabulary()
+        words = set()
+        for text in texts:
+            if '<' in text: text = TAG_RE.sub(' ', text)
+            words.update(WORD_RE.findall(text))
+        for block_idx, table in enumerate(self.vocabulary):
+            if table is None: continue
+            for word in words:
+                self.decide(word, block_idx)
+
+    def _candidates(self, word, block_idx, after=-1):
+        automaton, always = self.automata[block_idx]
+        found = automaton.find_all(word.lower())
+        found.update(always)
+        return sorted(idx for idx in found if idx > after)
+
+    def resolve_word(self, word, block_idx):
+        """Применяет к слову правила блока в порядке приоритета. Возвращает (слово, сработавшие правила)."""
+        applied = []
+        stats = rule_stats.ACTIVE
+        candidates = self._candidates(word, block_idx)
+        pos = 0
+        while pos < len(candidates):
+            idx = candidates[pos]
+            pos += 1
+            data = self.rules[idx]
+            if stats is not None:
+                m = stats.fullmatch('yellow', data['original'], data['pattern'], data['exceptions_compiled'], word)
+                if not m: continue
+            else:
+                m = data['pattern'].fullmatch(word)
+                if not m: continue
+                if data['exceptions_compiled'].matches(m.group()): continue
+            word = preserve_case(m, m.expand(data['replace']))
+            applied.append(data['pattern'].pattern)
+            # Слово изменилось — пересчитываем кандидатов среди оставшихся правил
+            candidates = self._candidates(word, block_idx, after=idx)
+            pos = 0
+        return word, applied
+
+    def decide(self, word, block_idx):
+        """
+        Решение для слова из таблицы блока. Таблица ведётся по словам в нижнем
+        регистре: если к слову не подходит ни одно правило, это верно для любого
+        его написания. Для изменяемых слов результат хранится по точной форме,
+        так как от неё зависит регистр замены.
+        """
+        folded = word.lower()
+        if len(folded) != len(word):
+            return self.resolve_word(word, block_idx)
+        table = self.vocabulary[block_idx]
+        forms = table.get(folded, False)
+        if forms is False:
+            forms = table[folded] = {} if self.resolve_word(folded, block_idx)[1] else None
+        if forms is None:
+            return word, ()
+        result = forms.get(word)
+        if result is None:
+            result = forms[word] = self.resolve_word(word, block_idx)
+        return result
+
+    def apply(self, paragraph):
+        stats = rule_stats.ACTIVE
+        for block_idx, (kind, payload) in enumerate(self.blocks):
+            # Жёлтый словарь видит весь текст, включая замены предыдущих словарей
+            for node in paragraph.iter_nodes():
+                if self.needs_e and not has_e(node.text): continue
+                for start, end in node.free_regions():
+                    region = node.text[start:end]
+                    if not region.strip(): continue
+                    if kind == 'regex':
+                        data = payload
+                        vetoed = data['exceptions_compiled'].matches
+                        if stats is not None:
+                            counter = stats.counter('yellow', data['original'])
+                            counter.tried += 1
+                            vetoed = counter.veto(data['exceptions_compiled'])
+                            started = perf_counter()
+                        for m in data['pattern'].finditer(region):
+                            if vetoed(m.group()): continue
+                            node.add_span(Span(start + m.start(), start + m.end(), preserve_case(m, m.expand(data['replace'])), 'highlight-yellow', data['pattern'].pattern))
+                            if stats is not None: counter.matches += 1
+                        if stats is not None: counter.seconds += perf_counter() - started
+                    else:
+                        for m in WORD_RE.finditer(region):
+                            if self.needs_e and not has_e(m.group()): continue
+                            word, applied = self.decide(m.group(), block_idx)
+                            if not applied: continue
+                            # Каждое сработавшее правило — отдельная вложенная замена
+                            span = node.add_span(Span(start + m.start(), start + m.end(), word, 'highlight-yellow', applied[0]))
+                            for rule in applied[1:]:
+                                span = span.inner.add_span(Span(0, len(word), word, 'highlight-yellow', rule))
+        return paragraph
+
+def replace_yo_in_text(paragraph, yo_dict):
+    matcher = yo_dict if isinstance(yo_dict, YellowMatcher) else YellowMatcher(yo_dict)
+    return matcher.apply(paragraph)
+
+class OrangeVariants(dict):
+    """
+    Правила оранжевого словаря (pattern -> данные) в порядке файла с индексом
+    для поиска кандидатов по слову. Правила без \\w*/\\w+ ищутся по слову в нижнем
+    регистре, остальные — по литеральному началу (или концу, если начало — шаблон).
+    Кандидаты затем проверяются самим регулярным выражением в исходном порядке.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.build_index()
+
+    def build_index(self):
+        self._order = list(self)
+        self._exact = {}
+        self._prefixes = {}
+        self._suffixes = {}
+        self._always = []
+        for idx, (pattern, data) in enumerate(self.items()):
+            segments = re.split(r'\\w[\*\+]', data.get('original', ''))
+            if 'original' not in data:
+                self._always.append(idx)
+            elif len(segments) == 1:
+                self._exact.setdefault(segments[0].lower(), []).append(idx)
+            elif segments[0]:
+                self._prefixes.setdefault(segments[0].lower(), []).append(idx)
+            elif segments[-1]:
+                self._suffixes.setdefault(segments[-1].lower(), []).append(idx)
+            else:
+                self._always.append(idx)
+        self._max_prefix = max(map(len, self._prefixes), default=0)
+        self._max_suffix = max(map(len, self._suffixes), default=0)
+        # Правила, способные совпасть с одним словом; если всем им нужна «е», слова без неё пропускаются
+        word_rules = [re.split(r'\\w[\*\+]', data.get('original', '')) for data in self.values()]
+        self.needs_e = all(literals_need_e(segments) for segments in word_rules
+                           if all(WORD_CHARS_RE.fullmatch(seg) for seg in segments))
+
+    def candidates(self, word):
+        """Правила, которые могут совпасть со словом целиком, в порядке словаря."""
+        if len(self._order) != len(self): self.build_index()
+        folded = word.lower()
+        if len(folded) != len(word): return self._order
+        found = list(self._exact.get(folded, ()))
+        for length in range(1, min(len(folded), self._max_prefix) + 1):
+            found.extend(self._prefixes.get(folded[:length], ()))
+        for length in range(1, min(len(folded), self._max_suffix) + 1):
+            found.extend(self._suffixes.get(folded[-length:], ()))
+        found.extend(self._always)
+        if not found: return ()
+        return [self._order[idx] for idx in sorted(found)]
+
+def orange_candidates(yo_variants, word):
+    return yo_variants.candidates(word) if isinstance(yo_variants, OrangeVariants) else list(yo_variants)
 
 def load_yo_variants(file_path):
     yo_variants = {}
@@ -168,114 +437,396 @@ def load_yo_variants(file_path):
                     except IndexError: break
             final_repl = ''.join(parts_repl)
 
-            try: pattern = re.compile(pattern_str, re.I)
-            except re.error: continue
-
-            exc_patterns = []
-            if rest:
-                exc_part = rest[0].split(')', 1)[0].strip()
-                for exc in exc_part.split(':'):
-                    exc = re.sub(r'\\(w[\*\+])', r'\\\1', exc.strip())
-                    try: exc_patterns.append(re.compile(fr'\b{exc}\b', re.I))
-                    except re.error: pass
-
-            yo_variants[pattern] = {'replacement': final_repl, 'exceptions': exc_patterns}
-    return yo_variants
-
-def process_yo_variants(text, yo_variants, replace_all_choices, global_line_offset=0):
-    lines = text.split('\n')
-    tag_pattern = re.compile(r'(<yorz[^>]*>.*?</yorz>|<[^>]+>)', re.IGNORECASE | re.DOTALL)
-
-    for line_num, line in enumerate(lines):
-        parts = tag_pattern.split(line)
-        new_parts = parts.copy()
-        for part_idx in range(0, len(parts), 2):
-            part = parts[part_idx]
-            if not part.strip(): continue
-            words = re.split(r'([^\w\u0300-\u036F]+)', part)
-            for word_idx in range(len(words)):
-                word = words[word_idx]
-                if not word or not re.match(r'[\w\u0300-\u036F]+', word): continue
-                replaced = False
-                for pattern in yo_variants:
-                    if pattern in replace_all_choices:
-                        match = pattern.fullmatch(word)
-                        if match and not any(exc.search(remove_diacritics(word)) for exc in yo_variants[pattern]['exceptions']):
-                            new_word = preserve_case(match, replace_all_choices[pattern])
-                            words[word_idx] = f'<yorz class="highlight-orange">{new_word}</yorz>'
-                            new_parts[part_idx] = ''.join(words)
-                            replaced = True
-                            break
-                if replaced: continue
-
-                for pattern, data in yo_variants.items():
-                    match = pattern.fullmatch(word)
-                    if not match: continue
-                    if any(exc.search(remove_diacritics(word)) for exc in data['exceptions']): continue
-
-                    base_word = match.group()
-                    yo_word = match.expand(data['replacement'])
-                    if base_word.lower() == yo_word.lower(): break
-
-                    temp_words = words.copy()
-                    temp_words[word_idx] = Fore.YELLOW + word + Style.RESET_ALL
-                    temp_parts = parts.copy()
-                    temp_parts[part_idx] = ''.join(temp_words)
-                    highlighted_line = re.sub(r'<[^>]*>', '', ''.join(temp_parts))
-
-                    import builtins
-                    is_gui = hasattr(builtins, 'gui_custom_input')
-
-                    if is_gui:
-                        yellow_idx = highlighted_line.find(Fore.YELLOW)
-                        if yellow_idx != -1:
-                            start = max(0, yellow_idx - 150)
-                            end = highlighted_line.find(Style.RESET_ALL, yellow_idx)
-                            if end != -1:
-                                end = min(len(highlighted_line), end + len(Style.RESET_ALL) + 150)
-                            else:
-                                end = min(len(highlighted_line), yellow_idx + 150)
-                            
-                            prefix = "... " if start > 0 else ""
-                            suffix = " ..." if end < len(highlighted_line) else ""
-                            highlighted_line = prefix + highlighted_line[start:end] + suffix
-
-                    print(f"\n{Fore.CYAN}Строка {global_line_offset + line_num + 1}:{Style.RESET_ALL}")
-                    print(highlighted_line)
-                    
-                    if not is_gui:
-                        print(f"{Fore.GREEN}Варианты: 1 или 3 >>> {base_word.lower()} | {yo_word.lower()} <<< 2 или 4")
+            pattern = LazyPattern(pattern_str, re.I)
 
-                    try:
-                        if is_gui:
-                            labels = [f"1 ({base_word.lower()})", f"2 ({yo_word.lower()})", f"3 ({base_word.lower()} везде)", f"4 ({yo_word.lower()} везде)", "Пропустить (Enter)"]
-                            choice_input = builtins.gui_custom_input("", labels).strip()
-                            if globals().get('SHOULD_STOP', False):
-                                raise KeyboardInterrupt()
-                        else:
-                            choice_input = input("Выберите [1/2/3,4-везде/Enter-пропустить]: ").strip()
-                    except KeyboardInterrupt:
-                        raise KeyboardInterrupt()
-
-                    new_word = word
-                    if choice_input:
-                        choice = choice_input[0]
-                        if choice == '1': new_word = base_word
-                        elif choice == '2': new_word = yo_word
-                        elif choice == '3':
-                            replace_all_choices[pattern] = base_word
-                            new_word = base_word
-                        elif choice == '4':
-                            replace_all_choices[pattern] = yo_word
-                            new_word = yo_word
-                        else:
-                            print(f"{Fore.RED}Неверный ввод. Пропускаем.{Style.RESET_ALL}")
-                    new_word = preserve_case(match, new_word)
-                    words[word_idx] = f'<yorz class="highlight-orange">{new_word}</yorz>'
-                    new_parts[part_idx] = ''.join(words)
-                    break
-        lines[line_num] = ''.join(new_parts)
-    return '\n'.join(lines)
+            exc_patterns = ExceptionMatcher(rest[0].split(')', 1)[0].strip().split(':') if rest else ())
+
+            yo_variants[pattern] = {'replacement': final_repl, 'exceptions': exc_patterns, 'original': original}
+    return OrangeVariants(yo_variants)
+
+def orange_context_parts(paragraph, start, end):
+    """Строка абзаца (в текущем состоянии) вокруг слова [start, end) без тегов: (до слова, слово, после)."""
+    line_start, line_end = paragraph.line_bounds(start)
+    return (re.sub(r'<[^>]*>', '', paragraph.render(start=line_start, end=start)), paragraph.text[start:end],
+            re.sub(r'<[^>]*>', '', paragraph.render(start=end, end=line_end)))
+
+def orange_context(paragraph, start, end):
+    """Строка абзаца (в текущем состоянии) с выделенным словом [start, end) — для вопроса пользователю."""
+    before, word, after = orange_context_parts(paragraph, start, end)
+    return before + Fore.YELLOW + word + Style.RESET_ALL + after
+
+def trim_context(highlighted_line, radius=150):
+    """Обрезает строку контекста до radius символов по обе стороны от выделенного слова."""
+    yellow_idx = highlighted_line.find(Fore.YELLOW)
+    if yellow_idx == -1: return highlighted_line
+    start = max(0, yellow_idx - radius)
+    end = highlighted_line.find(Style.RESET_ALL, yellow_idx)
+    if end != -1:
+        end = min(len(highlighted_line), end + len(Style.RESET_ALL) + radius)
+    else:
+        end = min(len(highlighted_line), yellow_idx + radius)
+
+    prefix = "... " if start > 0 else ""
+    suffix = " ..." if end < len(highlighted_line) else ""
+    return prefix + highlighted_line[start:end] + suffix
+
+def ask_orange_choice(highlighted_line, line_number, base_word, yo_word):
+    """Показывает вхождение омографа и возвращает ответ пользователя (строку, '' — пропустить)."""
+    import builtins
+    is_gui = hasattr(builtins, 'gui_custom_input')
+
+    if is_gui:
+        highlighted_line = trim_context(highlighted_line)
+
+    print(f"\n{Fore.CYAN}Строка {line_number}:{Style.RESET_ALL}")
+    print(highlighted_line)
+    
+    if not is_gui:
+        print(f"{Fore.GREEN}Варианты: 1 или 3 >>> {base_word.lower()} | {yo_word.lower()} <<< 2 или 4")
+
+    try:
+        if is_gui:
+            labels = [f"1 ({base_word.lower()})", f"2 ({yo_word.lower()})", f"3 ({base_word.lower()} везде)", f"4 ({yo_word.lower()} везде)", "Пропустить (Enter)"]
+            choice_input = builtins.gui_custom_input("", labels).strip()
+            if globals().get('SHOULD_STOP', False):
+                raise KeyboardInterrupt()
+        else:
+            choice_input = input("Выберите [1/2/3,4-везде/Enter-пропустить]: ").strip()
+    except KeyboardInterrupt:
+        raise KeyboardInterrupt()
+    return choice_input
+
+def orange_match(pattern, data, word, stats=None):
+    """Совпадение правила оранжевого словаря со словом целиком с учётом исключений (или None)."""
+    if stats is not None:
+        return stats.fullmatch('orange', data.get('original', pattern.pattern), pattern, data['exceptions'], word)
+    match = pattern.fullmatch(word)
+    if not match or data['exceptions'].matches(word): return None
+    return match
+
+def find_orange_candidate(word, yo_variants, candidates=None):
+    """
+    Первое правило оранжевого словаря, требующее решения для слова.
+    Возвращает (pattern, match, base_word, yo_word) или None.
+    """
+    if candidates is None: candidates = orange_candidates(yo_variants, word)
+    stats = rule_stats.ACTIVE
+    for pattern in candidates:
+        data = yo_variants[pattern]
+        match = orange_match(pattern, data, word, stats)
+        if not match: continue
+
+        base_word = match.group()
+        yo_word = match.expand(data['replacement'])
+        if base_word.lower() == yo_word.lower(): return None
+        return pattern, match, base_word, yo_word
+    return None
+
+def process_yo_variants(paragraph, yo_variants, replace_all_choices, global_line_offset=0, collect=None, answers=None, on_decision=None, policy=None):
+    """
+    Оранжевый словарь: для каждого омографа спрашивает пользователя и добавляет замену.
+    Если задан collect, вопросы не задаются: каждое вхождение, требующее решения,
+    передаётся в collect(OrangeCandidate) для группового просмотра.
+    answers — ответы по этому абзацу ({позиция слова: ответ}): уже записанные
+    не спрашиваются повторно (продолжение после сбоя), новые дописываются,
+    после чего вызывается on_decision() (контрольная точка сессии).
+    policy(OrangeCandidate) отвечает вместо пользователя (см. orange_review.OrangePolicy);
+    такие ответы не записываются.
+    """
+    text = paragraph.text
+    stats = rule_stats.ACTIVE
+    needs_e = getattr(yo_variants, 'needs_e', False)
+    if needs_e and not has_e(text): return paragraph
+    # Участки, уже обработанные синим и зелёным словарями, пропускаются
+    for region_start, region_end in paragraph.free_regions():
+        for word_match in WORD_RE.finditer(text, region_start, region_end):
+            word = word_match.group()
+            if needs_e and not has_e(word): continue
+            candidates = orange_candidates(yo_variants, word)
+            if not candidates: continue
+            answer = answers.get(str(word_match.start())) if answers else None
+            replaced = False
+            for pattern in candidates:
+                if answer is None and pattern in replace_all_choices:
+                    match = orange_match(pattern, yo_variants[pattern], word, stats)
+                    if match:
+                        new_word = preserve_case(match, replace_all_choices[pattern])
+                        paragraph.add_span(Span(word_match.start(), word_match.end(), new_word, 'highlight-orange', pattern.pattern))
+                        replaced = True
+                        break
+            if replaced: continue
+
+            candidate = find_orange_candidate(word, yo_variants, candidates)
+            if candidate is None: continue
+            pattern, match, base_word, yo_word = candidate
+
+            if collect is not None:
+                collect(OrangeCandidate(paragraph, word_match.start(), word_match.end(), pattern, match, base_word, yo_word,
+                                        global_line_offset + paragraph.line_index(word_match.start()) + 1))
+                continue
+
+            if answer is not None:
+                choice_input = answer
+            elif policy is not None:
+                choice_input = policy(OrangeCandidate(paragraph, word_match.start(), word_match.end(), pattern, match, base_word, yo_word,
+                                                      global_line_offset + paragraph.line_index(word_match.start()) + 1))
+            else:
+                choice_input = ask_orange_choice(orange_context(paragraph, word_match.start(), word_match.end()),
+                                                 global_line_offset + paragraph.line_index(word_match.start()) + 1, base_word, yo_word)
+
+            new_word = word
+            if choice_input:
+                choice = choice_input[0]
+                if choice == '1': new_word = base_word
+                elif choice == '2': new_word = yo_word
+                elif choice == '3':
+                    replace_all_choices[pattern] = base_word
+                    new_word = base_word
+                elif choice == '4':
+                    replace_all_choices[pattern] = yo_word
+                    new_word = yo_word
+                else:
+                    print(f"{Fore.RED}Неверный ввод. Пропускаем.{Style.RESET_ALL}")
+            new_word = preserve_case(match, new_word)
+            paragraph.add_span(Span(word_match.start(), word_match.end(), new_word, 'highlight-orange', pattern.pattern))
+            if answer is None and answers is not None and policy is None:
+                answers[str(word_match.start())] = choice_input
+                if on_decision: on_decision()
+    return paragraph
+
+@dataclass
+class OrangeCandidate:
+    """Вхождение омографа, ожидающее решения при групповом просмотре."""
+    paragraph: Paragraph
+    start: int
+    end: int
+    pattern: object
+    match: object
+    base_word: str
+    yo_word: str
+    line_number: int
+    index: int = 0
+
+    @property
+    def key(self):
+        """Устойчивый идентификатор вхождения (для сохранения решений в сессии)."""
+        return f"{self.index}:{self.start}"
+
+    @property
+    def rule(self):
+        """Правило оранжевого словаря (ключ группы и решений)."""
+        return self.pattern.pattern
+
+    def context(self):
+        return orange_context(self.paragraph, self.start, self.end)
+
+    def apply(self, choice):
+        """Добавляет замену по ответу '1' (без ё), '2' (с ё) или '' (оставить как есть)."""
+        word = self.paragraph.text[self.start:self.end]
+        new_word = self.base_word if choice == '1' else (self.yo_word if choice == '2' else word)
+        self.paragraph.add_span(Span(self.start, self.end, preserve_case(self.match, new_word), 'highlight-orange', self.pattern.pattern))
+
+# Сколько вхождений группы показывается сразу
+GROUP_PREVIEW = 20
+
+def _parse_group_choice(choice_input, size):
+    """
+    Разбирает ответ для группы: '1'/'2' с необязательными исключениями
+    ('2 -3 5' — ё везде, кроме вхождений 3 и 5, для них — без ё).
+    Возвращает (choice, {номер вхождения: choice}) или None при неверном вводе.
+    """
+    tokens = choice_input.replace(',', ' ').split()
+    choice = tokens[0]
+    if choice not in ('1', '2'): return None
+    other = '2' if choice == '1' else '1'
+    overrides = {}
+    for token in tokens[1:]:
+        token = token.lstrip('-')
+        if not token.isdigit() or not 1 <= int(token) <= size: return None
+        overrides[int(token) - 1] = other
+    return choice, overrides
+
+def review_orange_groups(candidates, decisions, on_decision=None):
+    """
+    Групповой просмотр омографов: вхождения собираются по правилам оранжевого
+    словаря, решение принимается сразу для всей группы (с исключениями для
+    отдельных вхождений) или по одному. Решения пишутся в decisions
+    ({pattern: {'choice': ..., 'overrides': {key: choice}}}) и затем применяются.
+    После каждого решения вызывается on_decision() (контрольная точка сессии).
+    """
+    import builtins
+    is_gui = hasattr(builtins, 'gui_custom_input')
+
+    groups = {}
+    for candidate in candidates:
+        groups.setdefault(candidate.rule, []).append(candidate)
+
+    if groups:
+        print(f"\n{Fore.CYAN}Омографов для проверки: {len(candidates)} в {len(groups)} группах.{Style.RESET_ALL}")
+
+    skip_rest = False
+    for number, (key, group) in enumerate(groups.items(), 1):
+        decision = decisions.setdefault(key, {'overrides': {}})
+        if skip_rest and 'choice' not in decision:
+            decision['choice'] = ''
+        if 'choice' in decision: continue
+
+        first = group[0]
+        print(f"\n{Fore.CYAN}Группа {number} из {len(groups)}: {first.base_word.lower()} | {first.yo_word.lower()} — вхождений: {len(group)}{Style.RESET_ALL}")
+        for k, candidate in enumerate(group[:GROUP_PREVIEW], 1):
+            context = trim_context(candidate.context(), 60)
+            print(f"{Fore.CYAN}{k}. Строка {candidate.line_number}:{Style.RESET_ALL} {context}")
+        if len(group) > GROUP_PREVIEW:
+            print(f"... и ещё {len(group) - GROUP_PREVIEW}")
+
+        while True:
+            if is_gui:
+                labels = [f"1 ({first.base_word.lower()} везде)", f"2 ({first.yo_word.lower()} везде)", "3 (по одному)", "4 (пропустить остальные)", "Пропустить (Enter)"]
+                choice_input = builtins.gui_custom_input("", labels).strip()
+                if globals().get('SHOULD_STOP', False):
+                    raise KeyboardInterrupt()
+            else:
+                print(f"{Fore.GREEN}Варианты: 1 >>> {first.base_word.lower()} | {first.yo_word.lower()} <<< 2")
+                choice_input = input("Выберите [1/2-для всей группы (2 -3 5 - кроме вхождений 3 и 5)/3-по одному/4-пропустить остальные/Enter-пропустить]: ").strip()
+
+            if not choice_input:
+                decision['choice'] = ''
+            elif choice_input[0] == '3':
+                _review_one_by_one(group, decision, on_decision)
+            elif choice_input[0] == '4':
+                decision['choice'] = ''
+                skip_rest = True
+            else:
+                parsed = _parse_group_choice(choice_input, len(group))
+                if parsed is None:
+                    print(f"{Fore.RED}Неверный ввод.{Style.RESET_ALL}")
+                    continue
+                decision['choice'], overrides = parsed
+                decision['overrides'].update({group[i].key: c for i, c in overrides.items()})
+            break
+        if on_decision: on_decision()
+
+    for candidate in candidates:
+        decision = decisions.get(candidate.rule, {})
+        candidate.apply(decision.get('overrides', {}).get(candidate.key, decision.get('choice', '')))
+
+def _review_one_by_one(group, decision, on_decision=None):
+    overrides = decision['overrides']
+    for candidate in group:
+        if candidate.key in overrides: continue
+        choice_input = ask_orange_choice(candidate.context(), candidate.line_number, candidate.base_word, candidate.yo_word)
+        choice = choice_input[:1]
+        if choice in ('3', '4'):
+            # Оставшиеся вхождения группы получают этот же вариант
+            decision['choice'] = '1' if choice == '3' else '2'
+            overrides[candidate.key] = decision['choice']
+            return
+        if choice not in ('', '1', '2'):
+            print(f"{Fore.RED}Неверный ввод. Пропускаем.{Style.RESET_ALL}")
+            choice = ''
+        overrides[candidate.key] = choice
+        if on_decision: on_decision()
+    decision['choice'] = ''
+
+class Rule:
+    """Правило синего или зелёного словаря: готовый шаблон, замена и исключения."""
+    __slots__ = ('original', 'pattern', 'replacement', 'template', 'exceptions')
+
+    def __init__(self, original, pattern, replacement, template, exceptions):
+        self.original = original
+        self.pattern = pattern
+        self.replacement = replacement
+        self.template = template
+        self.exceptions = exceptions
+
+    def expand(self, match):
+        return match.expand(self.replacement) if self.template else self.replacement
+
+def compile_rule(original, replacement, exceptions):
+    """Строит Rule из строки словаря; правило с некорректным шаблоном пропускается (None)."""
+    if r'\w*' in original or r'\w+' in original:
+        pattern_parts = []
+        wildcard_groups = []
+        current_group = 1
+        for segment in re.split(r'(\\w[\*\+])', original):
+            if segment in (r'\w*', r'\w+'):
+                quant = '*' if segment == r'\w*' else '+'
+                pattern_parts.append(f'([\\w\\u0300-\\u036F]{quant})')
+                wildcard_groups.append(current_group)
+                current_group += 1
+            else:
+                pattern_parts.append(re.escape(segment))
+        pattern_str = r'(?<![\w\u0300-\u036F])' + ''.join(pattern_parts) + r'(?![\w\u0300-\u036F])'
+
+        repl_parts = re.split(r'(\\w[\*\+])', replacement)
+        for j in range(1, len(repl_parts), 2):
+            if repl_parts[j] in (r'\w*', r'\w+'):
+                try: repl_parts[j] = f'\\{wildcard_groups.pop(0)}'
+                except IndexError: break
+        replacement = ''.join(repl_parts)
+        template = True
+    else:
+        escaped_original = re.escape(original).replace(r'\ ', r'\s+')
+        pattern_str = r'(?<![\w\u0300-\u036F])' + escaped_original + r'(?![\w\u0300-\u036F])'
+        template = False
+
+    pattern = LazyPattern(pattern_str, re.I)
+    try:
+        pattern.compiled()
+    except re.error:
+        return None
+    return Rule(original, pattern, replacement, template, exceptions)
+
+def rule_literals(original):
+    """
+    Литеральные фрагменты, без которых правило не может совпасть: части ключа
+    между \\w*/\\w+, а в ключах без шаблонов — слова (пробел в них означает \\s+).
+    """
+    if r'\w*' in original or r'\w+' in original:
+        return [seg for seg in re.split(r'\\w[\*\+]', original) if seg]
+    return [seg for seg in original.split(' ') if seg]
+
+class RuleSet:
+    """
+    Синий или зелёный словарь, подготовленный к применению: шаблоны, замены
+    и исключения строятся один раз при загрузке (и хранятся в кэше словарей),
+    а не для каждого абзаца.
+    """
+
+    def __init__(self, replacements_dict=None):
+        self.rules = []
+        for original, data in (replacements_dict or {}).items():
+            rule = compile_rule(original, data['replacement'], data['exceptions'])
+            if rule is not None: self.rules.append(rule)
+
+        # Предфильтр: самый длинный обязательный литеральный фрагмент каждого правила
+        self.automaton = AhoCorasick()
+        self.always = []
+        # Правила, которым не нужна «е» (например, строки-заголовки словаря): только они
+        # могут сработать в тексте без «е», и для него автомат не запускается
+        self.e_free = []
+        for idx, rule in enumerate(self.rules):
+            literals = rule_literals(rule.original)
+            anchor = max(literals, key=len, default='').casefold()
+            if anchor: self.automaton.add(anchor, idx)
+            else: self.always.append(idx)
+            if not literals_need_e(literals): self.e_free.append((anchor, idx))
+        self.automaton.build()
+
+    def candidates(self, text):
+        """Правила, чей опорный фрагмент встречается в тексте, в порядке словаря."""
+        folded = text.casefold()
+        if 'е' not in folded:
+            return [self.rules[idx] for anchor, idx in self.e_free if anchor in folded]
+        found = self.automaton.find_all(folded)
+        found.update(self.always)
+        return [self.rules[idx] for idx in sorted(found)]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
 
 def load_dict_with_exceptions(file_path):
     replacements_dict = {}
@@ -288,83 +839,552 @@ def load_dict_with_exceptions(file_path):
             if len(parts) < 2: continue
             original, replacement = parts[0].strip(), parts[1].strip()
 
-            exc_patterns = []
-            if rest:
-                exc_part = rest[0].split(')', 1)[0].strip()
-                for exc in exc_part.split(':'):
-                    exc = re.sub(r'\\(w[\*\+])', r'\\\1', exc.strip())
-                    try: exc_patterns.append(re.compile(fr'\b{exc}\b', re.I))
-                    except re.error: pass
+            exc_patterns = ExceptionMatcher(rest[0].split(')', 1)[0].strip().split(':') if rest else ())
             replacements_dict[original] = {'replacement': replacement, 'exceptions': exc_patterns}
-    return replacements_dict
+    return RuleSet(replacements_dict)
 
-def apply_replacements(text, replacements_dict, span_class):
-    tag_pattern = re.compile(r'(<yorz[^>]*>.*?</yorz>|<[^>]+>)', re.IGNORECASE | re.DOTALL)
-    for original, data in replacements_dict.items():
-        replacement = data['replacement']
-        exceptions = data['exceptions']
-        
-        regex = None
-        if r'\w*' in original or r'\w+' in original:
-            pattern_parts = []
-            wildcard_groups = []
-            current_group = 1
-            for segment in re.split(r'(\\w[\*\+])', original):
-                if segment in (r'\w*', r'\w+'):
-                    quant = '*' if segment == r'\w*' else '+'
-                    pattern_parts.append(f'([\\w\\u0300-\\u036F]{quant})')
-                    wildcard_groups.append(current_group)
-                    current_group += 1
-                else:
-                    pattern_parts.append(re.escape(segment))
-            pattern_str = r'(?<![\w\u0300-\u036F])' + ''.join(pattern_parts) + r'(?![\w\u0300-\u036F])'
+def apply_replacements(paragraph, replacements_dict, span_class):
+    rules = replacements_dict if isinstance(replacements_dict, RuleSet) else RuleSet(replacements_dict)
+    # Выполняются только правила, опорные фрагменты которых есть в абзаце
+    stats = rule_stats.ACTIVE
+    for rule in rules.candidates(paragraph.text):
+        vetoed = rule.exceptions.matches
+        if stats is not None:
+            counter = stats.counter(span_class.rsplit('-', 1)[-1], rule.original)
+            counter.tried += 1
+            vetoed = counter.veto(rule.exceptions)
+            started = perf_counter()
+        regex = rule.pattern.compiled()
+        # Участки, уже размеченные предыдущими правилами, в поиск не попадают
+        for start, end in paragraph.free_regions():
+            region = paragraph.text[start:end]
+            if not region.strip(): continue
+            for m in regex.finditer(region):
+                if vetoed(m.group()): continue
+                paragraph.add_span(Span(start + m.start(), start + m.end(), preserve_case(m, rule.expand(m)), span_class, rule.original))
+                if stats is not None: counter.matches += 1
+        if stats is not None: counter.seconds += perf_counter() - started
+            
+    return paragraph
 
-            repl_parts = re.split(r'(\\w[\*\+])', replacement)
-            for j in range(1, len(repl_parts), 2):
-                if repl_parts[j] in (r'\w*', r'\w+'):
-                    try: repl_parts[j] = f'\\{wildcard_groups.pop(0)}'
-                    except IndexError: break
-            fixed_replacement = ''.join(repl_parts)
-            try:
-                regex = re.compile(pattern_str, re.I)
-            except re.error as e:
+from . import paths
+from . import dict_cache
+from .session import Session
+SHOULD_STOP = False
+# Режимы оранжевого словаря без вопросов пользователю (см. orange_review.OrangePolicy)
+ORANGE_POLICIES = ('keep', 'yo', 'table', 'defer')
+
+def load_dictionaries(regular_file=None, yo_no_regular_file=None, yo_dict_file=None, yo_variant_file=None, use_cache=True):
+    """Загружает четыре словаря (через кэш в USER_DATA_DIR, если use_cache)."""
+    if regular_file is None: regular_file = paths.get_path("dictionaries/green.dic")
+    if yo_no_regular_file is None: yo_no_regular_file = paths.get_path("dictionaries/blue.dic")
+    if yo_dict_file is None: yo_dict_file = paths.get_path("dictionaries/yellow.dic")
+    if yo_variant_file is None: yo_variant_file = paths.get_path("dictionaries/orange.dic")
+
+    def load(file_path, kind, loader):
+        return dict_cache.load(file_path, kind, loader) if use_cache else loader(file_path)
+
+    yo_dict = load(yo_dict_file, 'yellow', lambda p: YellowMatcher(load_yo_dict(p)))
+    yo_variants = load(yo_variant_file, 'orange', load_yo_variants)
+    yo_no_regular_dict = load(yo_no_regular_file, 'rules', load_dict_with_exceptions) if os.path.exists(yo_no_regular_file) else {}
+    regex_dict = load(regular_file, 'rules', load_dict_with_exceptions) if os.path.exists(regular_file) else {}
+    return yo_dict, yo_variants, yo_no_regular_dict, regex_dict
+
+def apply_blue_green(text, yo_no_regular_dict, regex_dict):
+    """Абзац после синего и зелёного словарей."""
+    paragraph = Paragraph(text)
+    apply_replacements(paragraph, yo_no_regular_dict, "highlight-blue")
+    if SHOULD_STOP: raise KeyboardInterrupt()
+    apply_replacements(paragraph, regex_dict, "highlight-green")
+    return paragraph
+
+def process_paragraph(text, dictionaries, replace_all_choices, global_line_offset=0, answers=None, on_decision=None, policy=None):
+    """
+    Последовательно применяет к тексту все четыре словаря. Абзацы без «е» почти
+    ничего не стоят: синий и зелёный проверяют лишь правила без «е», а оранжевый
+    и жёлтый (если всем их правилам нужна «е») их пропускают.
+    """
+    yo_dict, yo_variants, yo_no_regular_dict, regex_dict = dictionaries
+    if SHOULD_STOP: raise KeyboardInterrupt()
+    paragraph = apply_blue_green(text, yo_no_regular_dict, regex_dict)
+    if SHOULD_STOP: raise KeyboardInterrupt()
+    process_yo_variants(paragraph, yo_variants, replace_all_choices, global_line_offset, answers=answers, on_decision=on_decision, policy=policy)
+    if SHOULD_STOP: raise KeyboardInterrupt()
+    replace_yo_in_text(paragraph, yo_dict)
+    return paragraph
+
+# Размер пакета абзацев, отправляемого рабочему процессу
+BATCH_MAX_ITEMS = 64
+BATCH_MAX_CHARS = 8192
+
+_worker_dictionaries = None
+
+def _init_worker(dict_files, vocabulary):
+    """Инициализация рабочего процесса: словари загружаются один раз (из кэша)."""
+    import signal
+    global _worker_dictionaries
+    # Ctrl+C обрабатывает родительский процесс, который и сохраняет сессию
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_dictionaries = load_dictionaries(*dict_files)
+    if vocabulary is not None:
+        _worker_dictionaries[0].vocabulary = vocabulary
+
+def _worker_blue_green(texts):
+    _, _, yo_no_regular_dict, regex_dict = _worker_dictionaries
+    results = []
+    for text in texts:
+        try:
+            results.append(apply_blue_green(text, yo_no_regular_dict, regex_dict))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def _worker_yellow(paragraphs, render=None):
+    return [finish_paragraph(paragraph, _worker_dictionaries[0], render) for paragraph in paragraphs]
+
+def finish_paragraph(paragraph, yo_dict, render=None):
+    """Жёлтый словарь и (если задан render) сборка результата; ошибка возвращается как исключение."""
+    try:
+        replace_yo_in_text(paragraph, yo_dict)
+        return render(paragraph) if render else paragraph
+    except Exception as e:
+        return e
+
+def _iter_batches(units):
+    batch, chars = [], 0
+    for unit in units:
+        batch.append(unit)
+        chars += len(unit[1] or '')
+        if len(batch) >= BATCH_MAX_ITEMS or chars >= BATCH_MAX_CHARS:
+            yield batch
+            batch, chars = [], 0
+    if batch: yield batch
+
+def _make_pool(jobs, dict_files, yo_dict):
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(dict_files, getattr(yo_dict, 'vocabulary', None)))
+
+def process_paragraphs(units, dictionaries, replace_all_choices, emit, jobs=1, dict_files=(), decisions=None, answers=None, on_decision=None, render=None, lookahead=None, policy=None):
+    """
+    Обрабатывает абзацы книги и передаёт результаты в emit(index, result) строго по порядку.
+    units — последовательность (index, text, global_line_offset); text=None означает,
+    что элемент не обрабатывается (result=None). Если обработка абзаца упала,
+    result — исключение.
+    При jobs > 1 синий, зелёный и жёлтый словари выполняются пакетами в пуле процессов,
+    а интерактивный оранжевый — по порядку в этом процессе. При прерывании все абзацы,
+    по которым уже приняты решения оранжевого словаря, дообрабатываются и передаются в emit.
+    Если задан decisions, омографы решаются группами (см. _process_grouped), иначе
+    ответы по омографам копятся в answers ({str(index): {позиция: ответ}}).
+    on_decision() вызывается после каждого решения по омографу.
+    render(paragraph) (функция уровня модуля) превращает готовый абзац в то, что
+    получает emit; при jobs > 1 она выполняется в рабочих процессах вместе с жёлтым
+    словарём. lookahead — сколько пакетов держать в работе у синего и зелёного
+    словарей впереди оранжевого (по умолчанию jobs * 2). policy(index, candidate)
+    решает омографы без вопросов.
+    """
+    if decisions is not None:
+        return _process_grouped(units, dictionaries, replace_all_choices, emit, jobs, dict_files, decisions, on_decision, render)
+    if answers is None: answers = {}
+
+    def orange_stage(paragraph_fn, index, *args):
+        # Ответы абзаца видны в answers сразу (для контрольных точек), пустые не хранятся
+        unit_answers = answers.setdefault(str(index), {})
+        try:
+            return paragraph_fn(*args, answers=unit_answers, on_decision=on_decision, policy=partial(policy, index) if policy else None)
+        finally:
+            if not unit_answers: answers.pop(str(index), None)
+
+    if jobs <= 1:
+        for index, text, line_offset in units:
+            if SHOULD_STOP: raise KeyboardInterrupt()
+            if text is None:
+                emit(index, None)
                 continue
-            
-            parts = tag_pattern.split(text)
-            for i in range(0, len(parts), 2):
-                if not parts[i].strip(): continue
-                parts[i] = regex.sub(
-                    lambda m: (
-                        m.group() if any(exc.search(remove_diacritics(m.group())) for exc in exceptions)
-                        else f'<yorz class="{span_class}">{preserve_case(m, m.expand(fixed_replacement))}</yorz>'
-                    ), parts[i]
-                )
-            text = ''.join(parts)
-        else:
-            escaped_original = re.escape(original).replace(r'\ ', r'\s+')
-            pattern = r'(?<![\w\u0300-\u036F])' + escaped_original + r'(?![\w\u0300-\u036F])'
             try:
-                regex = re.compile(pattern, re.I)
-            except re.error as e:
-                continue
-            
-            parts = tag_pattern.split(text)
-            for i in range(0, len(parts), 2):
-                if not parts[i].strip(): continue
-                parts[i] = regex.sub(
-                    lambda m: (
-                        m.group() if any(exc.search(remove_diacritics(m.group())) for exc in exceptions)
-                        else f'<yorz class="{span_class}">{preserve_case(m, replacement)}</yorz>'
-                    ), parts[i]
-                )
-            text = ''.join(parts)
-            
+                result = orange_stage(process_paragraph, index, text, dictionaries, replace_all_choices, line_offset)
+                if render: result = render(result)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                result = e
+            emit(index, result)
+        return
+
+    from collections import deque
+    yo_dict, yo_variants = dictionaries[0], dictionaries[1]
+
+    def emit_batch(done, future):
+        # Подставляем абзацы, вернувшиеся из жёлтого словаря, на их места
+        yellow = iter(future.result() if future else ())
+        for index, result in done:
+            emit(index, next(yellow) if isinstance(result, Paragraph) else result)
+
+    pool = _make_pool(jobs, dict_files, yo_dict)
+    batches = _iter_batches(units)
+    ahead = deque()    # пакеты в работе у синего и зелёного словарей
+    pending = deque()  # пакеты после оранжевого словаря, ожидающие жёлтый
+    done = []
+    try:
+        def fill():
+            while len(ahead) < (lookahead or jobs * 2):
+                batch = next(batches, None)
+                if batch is None: return
+                texts = [text for _, text, _ in batch if text is not None]
+                ahead.append((batch, pool.submit(_worker_blue_green, texts) if texts else None))
+
+        fill()
+        while ahead:
+            batch, future = ahead.popleft()
+            fill()
+            paragraphs = iter(future.result() if future else ())
+            for index, text, line_offset in batch:
+                if text is None:
+                    done.append((index, None))
+                    continue
+                paragraph = next(paragraphs)
+                if isinstance(paragraph, Paragraph):
+                    if SHOULD_STOP: raise KeyboardInterrupt()
+                    try:
+                        orange_stage(process_yo_variants, index, paragraph, yo_variants, replace_all_choices, line_offset)
+                    except (KeyboardInterrupt, SystemExit):
+                        raise
+                    except Exception as e:
+                        paragraph = e
+                done.append((index, paragraph))
+            to_yellow = [result for _, result in done if isinstance(result, Paragraph)]
+            pending.append((done, pool.submit(_worker_yellow, to_yellow, render) if to_yellow else None))
+            done = []
+            while pending and (pending[0][1] is None or pending[0][1].done()):
+                emit_batch(*pending.popleft())
+        while pending:
+            emit_batch(*pending.popleft())
+    except (KeyboardInterrupt, SystemExit):
+        while pending:
+            emit_batch(*pending.popleft())
+        for index, result in done:
+            emit(index, finish_paragraph(result, yo_dict, render) if isinstance(result, Paragraph) else result)
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _process_grouped(units, dictionaries, replace_all_choices, emit, jobs, dict_files, decisions, on_decision=None, render=None):
+    """
+    Двухфазная обработка с групповым просмотром омографов: сначала синий и зелёный
+    словари проходят всю книгу и собираются все вхождения оранжевого словаря,
+    затем пользователь решает по группам, и решения вместе с жёлтым словарём
+    применяются одним проходом. Решения копятся в decisions и при прерывании
+    сохраняются в сессии.
+    """
+    yo_dict, yo_variants, yo_no_regular_dict, regex_dict = dictionaries
+    units = list(units)
+    texts = [text for _, text, _ in units if text is not None]
+    pool = _make_pool(jobs, dict_files, yo_dict) if jobs > 1 else None
+    try:
+        # Фаза 1: синий и зелёный словари, сбор омографов
+        if pool:
+            batches = [[text for _, text, _ in batch if text is not None] for batch in _iter_batches(units)]
+            paragraphs = iter([p for results in pool.map(_worker_blue_green, [b for b in batches if b]) for p in results])
+        else:
+            def blue_green(text):
+                if SHOULD_STOP: raise KeyboardInterrupt()
+                try:
+                    return apply_blue_green(text, yo_no_regular_dict, regex_dict)
+                except Exception as e:
+                    return e
+            paragraphs = (blue_green(text) for text in texts)
+
+        results = []
+        candidates = []
+        for index, text, line_offset in units:
+            result = next(paragraphs) if text is not None else None
+            if isinstance(result, Paragraph):
+                first_new = len(candidates)
+                try:
+                    process_yo_variants(result, yo_variants, replace_all_choices, line_offset, collect=candidates.append)
+                except Exception as e:
+                    result = e
+                for candidate in candidates[first_new:]:
+                    candidate.index = index
+            results.append((index, result))
+
+        # Фаза 2: решения по группам
+        review_orange_groups(candidates, decisions, on_decision)
+
+        # Фаза 3: жёлтый словарь и выдача результатов по порядку
+        to_yellow = [result for _, result in results if isinstance(result, Paragraph)]
+        if pool:
+            chunks = [to_yellow[i:i + BATCH_MAX_ITEMS] for i in range(0, len(to_yellow), BATCH_MAX_ITEMS)]
+            yellow = iter([p for chunk in pool.map(_worker_yellow, chunks, [render] * len(chunks)) for p in chunk])
+        else:
+            yellow = (finish_paragraph(p, yo_dict, render) for p in to_yellow)
+        for index, result in results:
+            if SHOULD_STOP: raise KeyboardInterrupt()
+            emit(index, next(yellow) if isinstance(result, Paragraph) else result)
+    finally:
+        if pool: pool.shutdown(wait=True, cancel_futures=True)
+
+def render_epub_document(paragraph):
+    """
+    Готовый документ EPUB: (содержимое <body> с подсветкой для общего HTML,
+    чистый документ в UTF-8 для архива). Выполняется в рабочих процессах.
+    """
+    processed = paragraph.render_html()
+    body_match = re.search(r'<body[^>]*>(.*?)</body>', processed, re.IGNORECASE | re.DOTALL)
+    return body_match.group(1) if body_match else processed, paragraph.render_clean().encode('utf-8')
+
+def render_epub_clean(paragraph):
+    """Как render_epub_document, но без HTML-версии (предпросмотр отключён)."""
+    return None, paragraph.render_clean().encode('utf-8')
+
+def preview_head(base_name):
+    """Начало HTML-файла с подсветкой (до содержимого <body>)."""
+    return f"""<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n<html xmlns="http://www.w3.org/1999/xhtml">\n<head>\n<title>{base_name}</title>\n<style>\nhtml {{color: #000000; background-color: #FFFAFA;}}\nbody {{text-align : justify }}\np {{text-indent: 2em;  margin-bottom: 0em; margin-top: 0em; font-size : 110%; font-style : normal; font-weight : bold;}}\n.highlight-yellow {{ background-color: yellow; }}\n.highlight-green {{ background-color: lightgreen; }}\n.highlight-blue {{ background-color: lightblue; }}\n.highlight-orange {{ background-color: orange; }}\n</style>\n</head>\n<body>\n"""
+
+def count_text_lines(file_path):
+    """
+    Число абзацев txt/md (как у text.split('\\n')) без чтения файла целиком.
+    Заодно проверяет, что файл читается в UTF-8.
+    """
+    count = 1
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(1 << 20), ''):
+            count += chunk.count('\n')
+    return count
+
+class TextOutput:
+    """
+    Потоковая запись результата для txt/md: чистая версия и HTML с подсветкой
+    дописываются по абзацу, поэтому текст книги не копится в памяти, а готовая
+    часть сразу видна на диске. Метка обработки заменяется в первой строке, где
+    она найдена, иначе дописывается в конец; хвостовые пустые строки придерживаются
+    до конца (как при rstrip() всего текста). Без html_file HTML не пишется.
+    state() сохраняется в сессии, и при продолжении файлы обрезаются
+    до записанных в нём размеров.
+    """
+
+    def __init__(self, clean_file, html_file, base_name, is_md, app_version=None, state=None):
+        if is_md:
+            self.meta_re = re.compile(r'<!-- .*?(Текст обработан программой YoRZ 2\.0 \(.*?\)) -->')
+        else:
+            self.meta_re = re.compile(r'.*?(Текст обработан программой YoRZ 2\.0 \(.*?\))')
+        self.is_md = is_md
+        self.app_version = app_version
+        self.lines = state['lines'] if state else 0
+        self.pending = [state['pending']] if state else []
+        self.meta = state['meta'] if state else None
+        if state:
+            for file_path, size in ((clean_file, state['clean_size']), (html_file, state['html_size'])):
+                if not file_path: continue
+                with open(file_path, 'r+b') as f:
+                    f.truncate(size)
+        mode = 'a' if state else 'w'
+        self.clean = open(clean_file, mode, encoding='utf-8')
+        self.html = open(html_file, mode, encoding='utf-8') if html_file else None
+        if self.html and not state: self.html.write(preview_head(base_name))
+
+    @staticmethod
+    def can_resume(clean_file, html_file, state):
+        """Подходят ли файлы на диске для продолжения с сохранённого состояния."""
+        try:
+            if html_file and os.path.getsize(html_file) < state['html_size']: return False
+            return os.path.getsize(clean_file) >= state['clean_size']
+        except (OSError, KeyError, TypeError):
+            return False
+
+    def _entry(self, current_meta):
+        import datetime
+        today_str = datetime.date.today().isoformat()
+        new_meta_str = paths.update_metadata(current_meta, "Ёфикатор", self.app_version)
+        return f'\n\n<!-- {today_str}: {new_meta_str} -->\n' if self.is_md else f'\n\n{today_str}: {new_meta_str}\n'
+
+    def write(self, clean_line, html_line):
+        sep = '\n' if self.lines else ''
+        self.lines += 1
+        if self.html: self.html.write(sep + (f"<p>{html_line}</p>" if html_line.strip() else "<p>&nbsp;</p>"))
+        if self.meta is None:
+            match = self.meta_re.search(clean_line)
+            if match: self.meta = [match.group(0), self._entry(match.group(1)).strip()]
+        if self.meta: clean_line = clean_line.replace(*self.meta)
+        piece = sep + clean_line
+        body = piece.rstrip()
+        if body:
+            self.clean.write(''.join(self.pending) + body)
+            self.pending = [piece[len(body):]]
+        else:
+            self.pending.append(piece)
+
+    def state(self, sync=False):
+        for f in (self.clean, self.html):
+            if not f: continue
+            f.flush()
+            if sync: os.fsync(f.fileno())
+        return {'lines': self.lines, 'pending': ''.join(self.pending), 'meta': self.meta,
+                'clean_size': self.clean.tell(), 'html_size': self.html.tell() if self.html else 0}
+
+    def finish(self):
+        self.clean.write(''.join(self.pending) if self.meta else self._entry(""))
+        if self.html: self.html.write("\n</body>\n</html>")
+        self.close()
+
+    def close(self):
+        self.clean.close()
+        if self.html: self.html.close()
+
+def add_fb2_history(text, app_version=None):
+    """Заменяет метку обработки в <history> FB2 или добавляет новую запись."""
+    import datetime
+    today_str = datetime.date.today().isoformat()
+    # Ищем существующую метку в истории
+    meta_pattern = re.compile(r'<p>.*?(Текст обработан программой YoRZ 2\.0 \(.*?\))</p>')
+    match = meta_pattern.search(text)
+    current_meta = match.group(1) if match else ""
+    new_meta_str = paths.update_metadata(current_meta, "Ёфикатор", app_version)
+
+    history_entry = f'<p>{today_str}: {new_meta_str}</p>'
+    if match:
+        text = text.replace(match.group(0), history_entry)
+    elif '</history>' in text:
+        text = text.replace('</history>', f'\n{history_entry}\n</history>')
+    elif '</document-info>' in text:
+        meta_tag = f'\n<history>\n{history_entry}\n</history>\n'
+        text = text.replace('</document-info>', meta_tag + '</document-info>')
+    elif '</description>' in text:
+        meta_tag = f'\n<document-info>\n<history>\n{history_entry}\n</history>\n</document-info>\n'
+        text = text.replace('</description>', meta_tag + '</description>')
     return text
 
-from . import paths
-SHOULD_STOP = False
+# Обрабатываемый элемент FB2: тег, атрибуты и содержимое
+FB2_ELEMENT_RE = re.compile(r'<(p|v|text-author|subtitle|title)(?=[\s>/])([^>]*)>(.*?)</\1>', re.IGNORECASE | re.DOTALL)
+
+# Предпросмотр FB2: теги заменяются HTML-аналогами, затем из части берутся только p, h3, h4 и br.
+# Правило выполняется, только если в части есть начало его тега
+FB2_PREVIEW_RULES = [
+    # Заголовки глав
+    ('<title', re.compile(r'<title(?=[\s>/])[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL), r'<h3 style="text-align:center; color:#8b0000; margin-top:2em; border-bottom:1px solid #ccc;">\1</h3>'),
+    # Подзаголовки
+    ('<subtitle', re.compile(r'<subtitle(?=[\s>/])[^>]*>(.*?)</subtitle>', re.IGNORECASE | re.DOTALL), r'<h4 style="text-align:center; color:#555;">\1</h4>'),
+    # Абзацы
+    ('<p', re.compile(r'<p(?=[\s>/])[^>]*>(.*?)</p>', re.IGNORECASE | re.DOTALL), r'<p style="text-indent:2em; margin:0.5em 0;">\1</p>'),
+    # Стихи/цитаты
+    ('<v', re.compile(r'<v(?=[\s>/])[^>]*>(.*?)</v>', re.IGNORECASE | re.DOTALL), r'<p style="font-style:italic; text-align:center; margin:0.2em 0;">\1</p>'),
+    # Пустые строки
+    ('<empty-line', re.compile(r'<empty-line(?=[\s>/])[^>]*/>', re.IGNORECASE), r'<br/><br/>'),
+]
+FB2_PREVIEW_PART_RE = re.compile(r'<(p|h3|h4)(?=[\s>/])[^>]*>.*?</\1>|<br\s*/?>', re.IGNORECASE | re.DOTALL)
+
+def fb2_preview_fragments(html):
+    """
+    Фрагменты предпросмотра из одной части FB2 (элемента с подсветкой или промежутка
+    между элементами). Метаданные и прочий «мусор» в предпросмотр не попадают.
+    """
+    if '<' not in html: return []
+    lowered = html.lower()
+    for tag, pattern, replacement in FB2_PREVIEW_RULES:
+        if tag in lowered: html = pattern.sub(replacement, html)
+    return [m.group(0) for m in FB2_PREVIEW_PART_RE.finditer(html)]
+
+class Fb2Output:
+    """
+    Потоковая запись результата для FB2. Начало книги до </description> копится
+    в памяти, чтобы вписать в <history> метку обработки; дальше текст сразу
+    дописывается в файл, а содержимое <binary> копируется из исходного файла
+    байтами, без декодирования. Предпросмотр (html_file) собирается по ходу:
+    каждая часть сразу превращается в свои фрагменты HTML, без проходов по всему
+    документу; без html_file он не строится. state() сохраняется в сессии,
+    и при продолжении файлы обрезаются до записанных в нём размеров.
+    """
+
+    def __init__(self, clean_file, html_file, source, base_name, app_version=None, state=None):
+        self.source = source
+        self.app_version = app_version
+        if state:
+            self.head = None if state['head'] is None else [state['head']]
+            with open(clean_file, 'r+b') as f:
+                f.truncate(state['clean_size'])
+        else:
+            self.head = []
+        self.clean = open(clean_file, 'ab' if state else 'wb')
+        self.html = None
+        self.fragments = 0
+        if html_file:
+            if state and 'html_size' in state:
+                with open(html_file, 'r+b') as f:
+                    f.truncate(state['html_size'])
+                self.html = open(html_file, 'a', encoding='utf-8')
+                self.fragments = state['fragments']
+            else:
+                self.html = open(html_file, 'w', encoding='utf-8')
+                self.html.write(preview_head(base_name))
+
+    @staticmethod
+    def can_resume(clean_file, html_file, state):
+        """Подходят ли файлы на диске для продолжения с сохранённого состояния."""
+        try:
+            if html_file and 'html_size' in state and os.path.getsize(html_file) < state['html_size']:
+                return False
+            return os.path.getsize(clean_file) >= state['clean_size']
+        except (OSError, KeyError, TypeError):
+            return False
+
+    def _put(self, text):
+        # Переводы строк — как при записи в текстовом режиме
+        self.clean.write(text.replace('\n', os.linesep).encode('utf-8'))
+
+    def write(self, text):
+        if self.head is None:
+            self._put(text)
+            return
+        self.head.append(text)
+        if '</description>' in text: self._flush_head()
+
+    def copy(self, start, end):
+        """Дописывает байты [start, end) исходного файла (содержимое <binary>)."""
+        if self.head is None: self.source.copy_to(self.clean, start, end, os.linesep)
+        else: self.head.append(self.source.text(start, end))
+
+    def preview(self, html):
+        """Дописывает в предпросмотр часть книги с подсветкой."""
+        if self.html is None: return
+        for fragment in fb2_preview_fragments(html):
+            self.html.write(('\n' if self.fragments else '') + fragment)
+            self.fragments += 1
+
+    def _flush_head(self):
+        self._put(add_fb2_history(''.join(self.head), self.app_version))
+        self.head = None
 
-def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_file=None, output_file=None, yo_dict_file=None, yo_variant_file=None, app_version=None):
+    def state(self, sync=False):
+        files = [self.clean] if self.html is None else [self.clean, self.html]
+        for f in files:
+            f.flush()
+            if sync: os.fsync(f.fileno())
+        if self.head is not None: self.head = [''.join(self.head)]
+        state = {'head': None if self.head is None else self.head[0], 'clean_size': self.clean.tell()}
+        if self.html is not None:
+            state.update(html_size=self.html.tell(), fragments=self.fragments)
+        return state
+
+    def finish(self):
+        if self.head is not None: self._flush_head()
+        if self.html is not None:
+            if not self.fragments: self.html.write("Ошибка генерации предпросмотра.")
+            self.html.write("\n</body>\n</html>")
+        self.close()
+
+    def close(self):
+        self.clean.close()
+        if self.html is not None: self.html.close()
+
+def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_file=None, output_file=None, yo_dict_file=None, yo_variant_file=None, app_version=None, jobs=1, orange_mode="interactive", preview=True, resume=None, dictionaries=None, orange_table=None):
+    """
+    Ёфикация файла. Возвращает True, если результат записан. resume решает судьбу
+    незаконченной обработки без вопроса (True — продолжить, False — начать заново).
+    dictionaries — уже загруженные словари (load_dictionaries), чтобы при обработке
+    нескольких книг не загружать их для каждой.
+    orange_mode — как решаются омографы: interactive (по ходу текста), grouped
+    (группами), без вопросов — keep, yo, table (по таблице orange_table) и defer
+    (см. orange_review.OrangePolicy), review — проверка отложенных в прошлый раз.
+    """
     if regular_file is None: regular_file = paths.get_path("dictionaries/green.dic")
     if yo_no_regular_file is None: yo_no_regular_file = paths.get_path("dictionaries/blue.dic")
     if yo_dict_file is None: yo_dict_file = paths.get_path("dictionaries/yellow.dic")
@@ -373,40 +1393,48 @@ def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_
     global SHOULD_STOP
     SHOULD_STOP = False
     import builtins
-    import json
     import os
+    import re
     
     # Сохраняем сессию в ту же папку, где находится исходный файл
-    session_file = os.path.join(os.path.dirname(os.path.abspath(input_file)), f".{os.path.basename(input_file)}.yorz_session")
-    session_data = {'processed_index': 0, 'replace_all_choices': {}, 'html_contents': []}
+    session = Session(input_file)
+    session_data = session.data
     
-    if os.path.exists(session_file):
+    if session.exists():
         print(f"\n{Fore.YELLOW}Найден незаконченный процесс для этого файла.{Style.RESET_ALL}")
-        if hasattr(builtins, 'gui_custom_input'):
+        if resume is not None:
+            ans = '1' if resume else '2'
+        elif hasattr(builtins, 'gui_custom_input'):
             ans = builtins.gui_custom_input("Продолжить с места остановки? ", ["1 (Да, продолжить)", "2 (Нет, начать заново)"])
         else:
             ans = input("Продолжить с места остановки? [1 - Да / 2 - Нет]: ")
         
         if ans and str(ans)[0] == '1':
             try:
-                with open(session_file, 'r', encoding='utf-8') as sf:
-                    session_data = json.load(sf)
+                session.load()
             except Exception as e:
                 print(f"{Fore.RED}Не удалось загрузить сессию: {e}{Style.RESET_ALL}")
+            session_data = session.data
         else:
-            os.remove(session_file)
+            session.discard()
             if input_file.lower().endswith('.epub'):
                 base_dir = os.path.dirname(os.path.abspath(input_file))
                 base_name = os.path.splitext(os.path.basename(input_file))[0]
                 tmp_epub = os.path.join(base_dir, base_name + '_yo.epub.tmp')
                 if os.path.exists(tmp_epub): os.remove(tmp_epub)
+    else:
+        # Журнал без заголовка мог остаться от обработки, завершившейся ошибкой
+        session.reset_journal()
+    # HTML с подсветкой (preview=False — только чистая версия); продолженная обработка
+    # строит его так же, как начатая
+    preview = session_data.setdefault('preview', preview)
 
-    yo_dict = load_yo_dict(yo_dict_file)
-    yo_variants = load_yo_variants(yo_variant_file)
-
-    yo_no_regular_dict = load_dict_with_exceptions(yo_no_regular_file) if os.path.exists(yo_no_regular_file) else {}
-
-    regex_dict = load_dict_with_exceptions(regular_file) if os.path.exists(regular_file) else {}
+    if dictionaries is None:
+        dictionaries = load_dictionaries(regular_file, yo_no_regular_file, yo_dict_file, yo_variant_file)
+    yo_dict, yo_variants, yo_no_regular_dict, regex_dict = dictionaries
+    # Таблица решений жёлтого словаря ведётся по одной книге: словари, загруженные один раз
+    # на процесс (пакетный режим, сервер), иначе копили бы слова всех обработанных книг
+    yo_dict.reset_vocabulary()
 
     replace_all_choices_str = session_data.get('replace_all_choices', {})
     replace_all_choices = {}
@@ -416,21 +1444,74 @@ def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_
                 replace_all_choices[p] = rep
                 break
 
-    def save_session():
+    dict_files = (regular_file, yo_no_regular_file, yo_dict_file, yo_variant_file)
+    if not jobs: jobs = os.cpu_count() or 1
+    if rule_stats.ACTIVE is not None:
+        # Счётчики правил ведутся в этом процессе, поэтому при учёте пул не используется
+        rule_stats.ACTIVE.register(dictionaries)
+        jobs = 1
+    # Решения по омографам хранятся в сессии: групповые — по группам, обычные — ответами
+    # по ещё не выданным абзацам, которые после сбоя не спрашиваются повторно
+    orange_decisions = session_data.setdefault('orange_decisions', {}) if orange_mode == 'grouped' else None
+    orange_answers = session_data.setdefault('orange_answers', {}) if orange_mode != 'grouped' else None
+    # Омографы без вопросов (keep, yo, table, defer) или проверка отложенных ранее (review):
+    # решения из файла проверки становятся ответами, остальные омографы решаются по той же
+    # таблице, что и в прошлый раз, а новые вхождения (после правки словаря) снова откладываются
+    policy = review_file = None
+    if orange_mode == 'review' or orange_mode in ORANGE_POLICIES:
+        from . import orange_review
+        review_file = orange_review.review_file_path(input_file)
+    if orange_mode == 'review':
+        if not os.path.exists(review_file):
+            print(f"{Fore.RED}Нет отложенных омографов: {review_file} не найден.{Style.RESET_ALL}")
+            return
+        reviewed = orange_review.review_deferred(review_file, input_file)
+        if reviewed is None: return
+        review_answers, table = reviewed
+        done = session_data.get('processed_index', 0)
+        for index, unit_answers in review_answers.items():
+            if int(index) >= done: orange_answers.setdefault(index, {}).update(unit_answers)
+        policy = orange_review.OrangePolicy('table', yo_variants, table, session_data.setdefault('orange_deferred', {}))
+    elif orange_mode in ORANGE_POLICIES:
+        table = None
+        if orange_mode == 'table':
+            try:
+                table = orange_review.load_orange_table(orange_table)
+            except (OSError, TypeError) as e:
+                print(f"{Fore.RED}Не удалось прочитать таблицу омографов {orange_table}: {e}{Style.RESET_ALL}")
+                return
+        policy = orange_review.OrangePolicy(orange_mode, yo_variants, table, session_data.setdefault('orange_deferred', {}))
+
+    def finish_orange():
+        """После обработки без вопросов в файле проверки — отложенные вхождения; после проверки он удаляется."""
+        if review_file is None: return
+        deferred = session_data.get('orange_deferred')
+        if deferred:
+            orange_review.write_review(review_file, input_file, deferred, policy.table)
+            print(f"{Fore.YELLOW}Отложено омографов: {len(deferred)}. Для проверки: {review_file}{Style.RESET_ALL}")
+        elif os.path.exists(review_file):
+            os.remove(review_file)
+
+    # Фиксирует состояние выходных файлов перед сохранением (задаётся веткой формата)
+    capture_state = None
+
+    def save_session(sync=False):
         session_data['replace_all_choices'] = {getattr(p, 'pattern', str(p)): r for p, r in replace_all_choices.items()}
-        with open(session_file, 'w', encoding='utf-8') as sf:
-            json.dump(session_data, sf, ensure_ascii=False, indent=2)
-
-    def process_text_chunk(text_chunk, global_line_offset=0):
-        if SHOULD_STOP: raise KeyboardInterrupt()
-        text_chunk = apply_replacements(text_chunk, yo_no_regular_dict, "highlight-blue")
-        if SHOULD_STOP: raise KeyboardInterrupt()
-        text_chunk = apply_replacements(text_chunk, regex_dict, "highlight-green")
-        if SHOULD_STOP: raise KeyboardInterrupt()
-        text_chunk = process_yo_variants(text_chunk, yo_variants, replace_all_choices, global_line_offset)
-        if SHOULD_STOP: raise KeyboardInterrupt()
-        text_chunk = replace_yo_in_text(text_chunk, yo_dict)
-        return text_chunk
+        if orange_answers:
+            done = session_data['processed_index']
+            for key in [k for k in orange_answers if int(k) < done]: del orange_answers[key]
+        session.save(sync)
+
+    def checkpoint(force=False, sync=True):
+        """Контрольная точка: по таймеру из emit (со сбросом на диск) и после решений по омографам."""
+        if not force and not session.due(): return
+        if capture_state: capture_state(sync)
+        save_session(sync)
+
+    def on_decision():
+        # Каждое решение сразу записывается в заголовок сессии (до следующего вопроса),
+        # но без сброса на диск: os.fsync остаётся за контрольными точками по таймеру и прерыванием
+        checkpoint(force=True, sync=False)
 
     is_epub = input_file.lower().endswith('.epub')
     is_fb2 = input_file.lower().endswith('.fb2')
@@ -443,44 +1524,75 @@ def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_
         output_html = os.path.join(base_dir, base_name + '_yo.html')
         tmp_epub = output_epub + '.tmp'
         
+        import base64
+        from modules.epub_utils import zip_directory_state, restore_zip_directory, EpubWriter
+
+        def epub_state(sync=False):
+            offset, tail = zip_directory_state(tmp_epub, sync)
+            return [offset, base64.b64encode(tail).decode('ascii')]
+
         start_idx = session_data.get('processed_index', 0)
-        html_contents = session_data.get('html_contents', [])
+        epub_dir = session_data.get('epub_dir')
+        if start_idx and not (os.path.exists(tmp_epub) and os.path.getsize(tmp_epub) >= (epub_dir[0] if epub_dir else 0)):
+            print(f"{Fore.YELLOW}Промежуточный результат не найден, обработка начнётся заново.{Style.RESET_ALL}")
+            start_idx = session_data['processed_index'] = 0
+            session.reset_journal()
+        elif start_idx and epub_dir:
+            # Архив возвращается к последней контрольной точке (после сбоя его оглавление могло не записаться)
+            restore_zip_directory(tmp_epub, epub_dir[0], base64.b64decode(epub_dir[1]))
         mode = 'w' if start_idx == 0 else 'a'
         
         print(f"{Fore.CYAN}Чтение и обработка EPUB архива...{Style.RESET_ALL}")
         try:
             with zipfile.ZipFile(input_file, 'r') as zin:
-                with zipfile.ZipFile(tmp_epub, mode, compression=zipfile.ZIP_DEFLATED) as zout:
+                zout = EpubWriter(tmp_epub, zin, mode)
+
+                def capture_epub(sync):
+                    # Архив закрывается (пишется оглавление) и открывается на дозапись
+                    nonlocal zout
+                    zout.close()
+                    session_data['epub_dir'] = epub_state(sync)
+                    zout = EpubWriter(tmp_epub, zin, 'a')
+
+                capture_state = capture_epub
+                try:
                     from modules.epub_utils import get_ordered_infolist
                     infolist = get_ordered_infolist(zin)
+                    # Словарь книги для жёлтого словаря — по ещё не обработанным документам
+                    # (в пуле процессов его заполняют сами рабочие процессы, параллельно)
+                    if jobs <= 1:
+                        yo_dict.prepare(zin.read(it.filename).decode('utf-8', errors='ignore') for it in infolist[start_idx:] if it.filename.lower().endswith(('.html', '.xhtml', '.htm')))
                     if hasattr(builtins, 'gui_update_progress') and len(infolist) > 0:
                         builtins.gui_update_progress(start_idx / len(infolist))
-                    for i in range(start_idx, len(infolist)):
-                        item = infolist[i]
-                        if SHOULD_STOP: raise KeyboardInterrupt()
-                        content = zin.read(item.filename)
-                        if item.filename.lower().endswith(('.html', '.xhtml', '.htm')):
+                    html_exts = ('.html', '.xhtml', '.htm')
+                    decode_errors = {}
+
+                    def epub_units():
+                        for i in range(start_idx, len(infolist)):
+                            item = infolist[i]
+                            if not item.filename.lower().endswith(html_exts):
+                                yield i, None, 0
+                                continue
                             try:
-                                text_content = content.decode('utf-8')
-                                processed = process_text_chunk(text_content)
-                                
-                                # For HTML version: extract body
-                                import re
-                                body_match = re.search(r'<body[^>]*>(.*?)</body>', processed, re.IGNORECASE | re.DOTALL)
-                                if body_match:
-                                    html_contents.append(body_match.group(1))
-                                else:
-                                    html_contents.append(processed)
-                                
-                                # For EPUB version: clean up yorz tags
-                                clean_epub_text = re.sub(r'</?yorz[^>]*>', '', processed)
-                                zout.writestr(item, clean_epub_text.encode('utf-8'))
-                            except (KeyboardInterrupt, SystemExit):
-                                raise
+                                yield i, zin.read(item.filename).decode('utf-8'), 0
                             except Exception as e:
-                                print(f"{Fore.RED}Ошибка обработки файла {item.filename} внутри epub: {e}{Style.RESET_ALL}")
-                                zout.writestr(item, content)
+                                decode_errors[i] = e
+                                yield i, None, 0
+
+                    def emit_document(i, result):
+                        item = infolist[i]
+                        if i in decode_errors: result = decode_errors.pop(i)
+                        if isinstance(result, tuple):
+                            # Тело документа для HTML-версии копится в журнале сессии,
+                            # в EPUB идёт текст без подсветки
+                            body, clean = result
+                            if body is not None: session.append(body)
+                            zout.write(item, clean)
+                        elif isinstance(result, Exception):
+                            print(f"{Fore.RED}Ошибка обработки файла {item.filename} внутри epub: {result}{Style.RESET_ALL}")
+                            zout.copy(item)
                         elif item.filename.lower().endswith('.opf'):
+                            content = zin.read(item.filename)
                             try:
                                 text_content = content.decode('utf-8')
                                 import datetime
@@ -498,43 +1610,57 @@ def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_
                                     meta_tag = f'\n    <meta name="{today_str}:" content="{new_meta_str}"/>\n'
                                     text_content = text_content.replace('</metadata>', meta_tag + '</metadata>')
                                 
-                                zout.writestr(item, text_content.encode('utf-8'))
+                                zout.write(item, text_content.encode('utf-8'))
                             except Exception as e:
                                 print(f"{Fore.RED}Ошибка обработки файла {item.filename} внутри epub: {e}{Style.RESET_ALL}")
-                                zout.writestr(item, content)
+                                zout.copy(item)
                         else:
-                            zout.writestr(item, content)
+                            # Картинки, шрифты и прочее копируются без перепаковки
+                            zout.copy(item)
                         session_data['processed_index'] = i + 1
                         if hasattr(builtins, 'gui_update_progress'):
                             builtins.gui_update_progress((i + 1) / len(infolist))
+                        checkpoint()
+
+                    # Документы книги обрабатываются в пуле все сразу, не дожидаясь оранжевого словаря
+                    process_paragraphs(epub_units(), dictionaries, replace_all_choices, emit_document, jobs, dict_files, orange_decisions, orange_answers, on_decision,
+                                       render=render_epub_document if preview else render_epub_clean, lookahead=len(infolist), policy=policy)
+                finally:
+                    zout.close()
             
             # Если дошли сюда без прерываний
             if os.path.exists(output_epub):
                 os.remove(output_epub)
             os.rename(tmp_epub, output_epub)
 
-            full_html_body = "\n".join(html_contents)
-            import re
-            full_html_body = re.sub(r'<(/?)yorz', r'<\1span', full_html_body)
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            with open(output_html, 'w', encoding='utf-8') as f:
-                f.write(f"""<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n<html xmlns="http://www.w3.org/1999/xhtml">\n<head>\n<title>{base_name}</title>\n<style>\nhtml {{color: #000000; background-color: #FFFAFA;}}\nbody {{text-align : justify }}\np {{text-indent: 2em;  margin-bottom: 0em; margin-top: 0em; font-size : 110%; font-style : normal; font-weight : bold;}}\n.highlight-yellow {{ background-color: yellow; }}\n.highlight-green {{ background-color: lightgreen; }}\n.highlight-blue {{ background-color: lightblue; }}\n.highlight-orange {{ background-color: orange; }}\n</style>\n</head>\n<body>\n""")
-                f.write(full_html_body)
-                f.write("\n</body>\n</html>")
+            if preview:
+                base_name = os.path.splitext(os.path.basename(input_file))[0]
+                with open(output_html, 'w', encoding='utf-8') as f:
+                    f.write(preview_head(base_name))
+                    for n, (body, _) in enumerate(session.records()):
+                        if n: f.write("\n")
+                        f.write(body)
+                    f.write("\n</body>\n</html>")
 
-            if os.path.exists(session_file):
-                os.remove(session_file)
+            finish_orange()
+            session.discard()
 
-            print(f"{Fore.GREEN}EPUB успешно обработан. Версия со структурой: {output_epub}. HTML с подсветкой: {output_html}{Style.RESET_ALL}")
+            if preview:
+                print(f"{Fore.GREEN}EPUB успешно обработан. Версия со структурой: {output_epub}. HTML с подсветкой: {output_html}{Style.RESET_ALL}")
+            else:
+                print(f"{Fore.GREEN}EPUB успешно обработан. Версия со структурой: {output_epub}{Style.RESET_ALL}")
+            return True
         except (KeyboardInterrupt, SystemExit):
-            session_data['html_contents'] = html_contents
-            save_session()
+            if os.path.exists(tmp_epub): session_data['epub_dir'] = epub_state(True)
+            save_session(sync=True)
             print(f"\n{Fore.YELLOW}Сохранение прогресса...{Style.RESET_ALL}")
             raise
         except Exception as e:
             if os.path.exists(tmp_epub):
                 os.remove(tmp_epub)
             print(f"{Fore.RED}Ошибка при работе с EPUB архивом: {e}{Style.RESET_ALL}")
+        finally:
+            session.close()
         return
 
     # Если это обычный текст, fb2 или md
@@ -542,176 +1668,196 @@ def replace_expressions(input_file="book.txt", regular_file=None, yo_no_regular_
     base_name = os.path.splitext(os.path.basename(input_file))[0]
     output_html = os.path.join(base_dir, base_name + '_yo.html')
     output_clean = os.path.join(base_dir, base_name + ('_yo.fb2' if is_fb2 else ('_yo.md' if is_md else '_yo.txt')))
+    start_idx = session_data.get('processed_index', 0)
 
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            text_content = f.read()
-    except Exception as e:
-        print(f"{Fore.RED}Не удалось прочитать {input_file}: {e}{Style.RESET_ALL}")
-        return
+    if not is_fb2:
+        print(f"{Fore.CYAN}Чтение и обработка текста...{Style.RESET_ALL}")
+        try:
+            total = count_text_lines(input_file)
+            # Словарь книги для жёлтого словаря — по ещё не обработанным абзацам, как для EPUB и FB2
+            # (в пуле процессов его заполняют сами рабочие процессы, параллельно)
+            if jobs <= 1:
+                with open(input_file, 'r', encoding='utf-8') as f:
+                    yo_dict.prepare(line for i, line in enumerate(f) if i >= start_idx)
+        except Exception as e:
+            print(f"{Fore.RED}Не удалось прочитать {input_file}: {e}{Style.RESET_ALL}")
+            return
 
-    start_idx = session_data.get('processed_index', 0)
-    html_contents = session_data.get('html_contents', [])
-
-    if is_fb2:
-        print(f"{Fore.CYAN}Извлечение текста из FB2 и обработка...{Style.RESET_ALL}")
-        import re
-        # Разделяем на части, захватывая нужные теги целиком. Указываем точные закрывающие теги для каждого, 
-        # чтобы <title> не обрывался на первом встретившемся </p> внутри него. И используем (?=[\s>/]) вместо \b
-        parts = re.split(r'(<p(?=[\s>/])[^>]*>.*?</p>|<v(?=[\s>/])[^>]*>.*?</v>|<text-author(?=[\s>/])[^>]*>.*?</text-author>|<subtitle(?=[\s>/])[^>]*>.*?</subtitle>|<title(?=[\s>/])[^>]*>.*?</title>|<empty-line(?=[\s>/])[^>]*>.*?</empty-line>|<empty-line(?=[\s>/])[^>]*/>)', text_content, flags=re.IGNORECASE | re.DOTALL)
-        
+        # Абзацы читаются из файла по одному, результат сразу дописывается в выходные файлы
+        state = session_data.get('text_output')
+        if state and not TextOutput.can_resume(output_clean, output_html if preview else None, state):
+            print(f"{Fore.YELLOW}Промежуточный результат не найден, обработка начнётся заново.{Style.RESET_ALL}")
+            state, start_idx = None, 0
+            session_data['processed_index'] = 0
+        output = TextOutput(output_clean, output_html if preview else None, base_name, is_md, app_version, state)
         try:
-            if hasattr(builtins, 'gui_update_progress') and len(parts) > 0:
-                builtins.gui_update_progress(start_idx / len(parts))
-            for i in range(start_idx, len(parts)):
-                if SHOULD_STOP: raise KeyboardInterrupt()
-                part = parts[i]
-                # Ищем теги, контент которых нужно обработать (включая вложенные <p> внутри <title>)
-                match = re.match(r'<(p|v|text-author|subtitle|title)(?=[\s>/])([^>]*)>(.*?)</\1>', part, re.IGNORECASE | re.DOTALL)
-                if match:
-                    tag_name, tag_attrs, content = match.groups()
-                    if not content.strip():
-                        html_contents.append(part)
-                    else:
-                        # Обрабатываем содержимое. Если внутри есть еще теги (как <p> в <title>), 
-                        # process_text_chunk их проигнорирует благодаря tag_pattern
-                        processed_content = process_text_chunk(content, global_line_offset=i)
-                        html_contents.append(f"<{tag_name}{tag_attrs}>{processed_content}</{tag_name}>")
-                else:
-                    html_contents.append(part)
-                
+            if not state:
+                # Сессия прежнего формата: обработанные абзацы перенесены в журнал
+                for html, clean in session.records():
+                    output.write(clean, html)
+            session.reset_journal()
+
+            def line_units():
+                with open(input_file, 'r', encoding='utf-8') as f:
+                    lines = (line[:-1] if line.endswith('\n') else line for line in f)
+                    for i in range(total):
+                        line = next(lines, '')
+                        if i >= start_idx: yield i, line if line.strip() else None, i
+
+            def emit_line(i, result):
+                if isinstance(result, Exception): raise result
+                output.write("" if result is None else result.render_clean(), "" if result is None or not preview else result.render_html())
                 session_data['processed_index'] = i + 1
                 if hasattr(builtins, 'gui_update_progress'):
-                    builtins.gui_update_progress((i + 1) / len(parts))
+                    builtins.gui_update_progress((i + 1) / total)
+                checkpoint()
+
+            def capture_text(sync):
+                session_data['text_output'] = output.state(sync)
+
+            capture_state = capture_text
+
+            if hasattr(builtins, 'gui_update_progress'):
+                builtins.gui_update_progress(start_idx / total)
+            process_paragraphs(line_units(), dictionaries, replace_all_choices, emit_line, jobs, dict_files, orange_decisions, orange_answers, on_decision, policy=policy)
+            output.finish()
         except (KeyboardInterrupt, SystemExit):
-            session_data['html_contents'] = html_contents
-            save_session()
+            session_data['text_output'] = output.state(True)
+            save_session(sync=True)
             print(f"\n{Fore.YELLOW}Сохранение прогресса...{Style.RESET_ALL}")
             raise
+        finally:
+            output.close()
+
+        finish_orange()
+        session.discard()
+        print(f"{Fore.GREEN}Обработка завершена.{Style.RESET_ALL}")
+        print(f"{Fore.GREEN}Чистая версия: {output_clean}{Style.RESET_ALL}")
+        if preview: print(f"{Fore.GREEN}HTML с подсветкой: {output_html}{Style.RESET_ALL}")
+        return True
+
+    from modules.fb2_utils import Fb2Source
+    print(f"{Fore.CYAN}Извлечение текста из FB2 и обработка...{Style.RESET_ALL}")
+    try:
+        source = Fb2Source(input_file)
+    except Exception as e:
+        print(f"{Fore.RED}Не удалось прочитать {input_file}: {e}{Style.RESET_ALL}")
+        return
+
+    try:
+        state = session_data.get('fb2_output')
+        if state and not Fb2Output.can_resume(output_clean, output_html if preview else None, state):
+            print(f"{Fore.YELLOW}Промежуточный результат не найден, обработка начнётся заново.{Style.RESET_ALL}")
+            state, start_idx = None, 0
+            session_data['processed_index'] = 0
+            session.reset_journal()
+
+        # Предварительный проход по тегам: число частей, проверка кодировки и словарь книги
+        # по ещё не обработанным элементам (они стоят на нечётных местах)
+        total = 0
+
+        def elements():
+            nonlocal total
+            for i, part in enumerate(source.parts()):
+                total = i + 1
+                if i >= start_idx and i % 2: yield part
 
-    else:
-        print(f"{Fore.CYAN}Чтение и обработка текста...{Style.RESET_ALL}")
-        paragraphs = text_content.split('\n')
         try:
-            if hasattr(builtins, 'gui_update_progress') and len(paragraphs) > 0:
-                builtins.gui_update_progress(start_idx / len(paragraphs))
-            for i in range(start_idx, len(paragraphs)):
-                if SHOULD_STOP: raise KeyboardInterrupt()
-                p_text = paragraphs[i]
-                if not p_text.strip():
-                    html_contents.append("")
+            yo_dict.prepare(elements())
+        except Exception as e:
+            print(f"{Fore.RED}Не удалось прочитать {input_file}: {e}{Style.RESET_ALL}")
+            return
+
+        # Чистая версия и предпросмотр сразу дописываются в файлы
+        output = Fb2Output(output_clean, output_html if preview else None, source, base_name, app_version, state)
+        try:
+            if not state or 'html_size' not in state:
+                # Сессия прежнего формата: обработанные части лежат в журнале
+                for html, clean in session.records():
+                    if not state: output.write(clean)
+                    output.preview(html)
+            session.reset_journal()
+            if hasattr(builtins, 'gui_update_progress'):
+                builtins.gui_update_progress(start_idx / total)
+            wrappers = {}
+            unchanged = {}
+
+            def fb2_units():
+                for i, part in enumerate(source.parts()):
+                    if i < start_idx: continue
+                    # Ищем теги, контент которых нужно обработать (включая вложенные <p> внутри <title>)
+                    match = FB2_ELEMENT_RE.match(part) if i % 2 else None
+                    if match and match.group(3).strip():
+                        # Обрабатываем содержимое. Если внутри есть еще теги (как <p> в <title>), 
+                        # словари их пропускают
+                        wrappers[i] = match.group(1, 2)
+                        yield i, match.group(3), i
+                    else:
+                        unchanged[i] = part
+                        yield i, None, i
+
+            def emit_part(i, result):
+                if isinstance(result, Exception): raise result
+                if result is None:
+                    part = unchanged.pop(i)
+                    if isinstance(part, str):
+                        html = part
+                        output.write(part)
+                    else:
+                        # Промежуток между элементами; содержимое <binary> в предпросмотр не попадает
+                        html = ''.join(piece for piece in part if isinstance(piece, str))
+                        for piece in part:
+                            if isinstance(piece, str): output.write(piece)
+                            else: output.copy(*piece)
                 else:
-                    processed_p = process_text_chunk(p_text, global_line_offset=i)
-                    html_contents.append(processed_p)
+                    tag_name, tag_attrs = wrappers.pop(i)
+                    html = f"<{tag_name}{tag_attrs}>{result.render_html()}</{tag_name}>" if preview else ''
+                    output.write(f"<{tag_name}{tag_attrs}>{result.render_clean()}</{tag_name}>")
+                output.preview(html)
                 session_data['processed_index'] = i + 1
                 if hasattr(builtins, 'gui_update_progress'):
-                    builtins.gui_update_progress((i + 1) / len(paragraphs))
-        except (KeyboardInterrupt, SystemExit):
-            session_data['html_contents'] = html_contents
-            save_session()
-            print(f"\n{Fore.YELLOW}Сохранение прогресса...{Style.RESET_ALL}")
-            raise
+                    builtins.gui_update_progress((i + 1) / total)
+                checkpoint()
 
-    full_processed_text = ('' if is_fb2 else '\n').join(html_contents)
-    import re
-    import datetime
+            def capture_fb2(sync):
+                session_data['fb2_output'] = output.state(sync)
 
-    # Сохраняем чистую версию (убираем временные теги yorz)
-    clean_text = re.sub(r'</?yorz[^>]*>', '', full_processed_text)
-    
-    today_str = datetime.date.today().isoformat()
-    if is_fb2:
-        # Ищем существующую метку в истории
-        meta_pattern = re.compile(r'<p>.*?(Текст обработан программой YoRZ 2\.0 \(.*?\))</p>')
-        match = meta_pattern.search(clean_text)
-        current_meta = match.group(1) if match else ""
-        new_meta_str = paths.update_metadata(current_meta, "Ёфикатор", app_version)
-        
-        history_entry = f'<p>{today_str}: {new_meta_str}</p>'
-        if match:
-            clean_text = clean_text.replace(match.group(0), history_entry)
-        elif '</history>' in clean_text:
-            clean_text = clean_text.replace('</history>', f'\n{history_entry}\n</history>')
-        elif '</document-info>' in clean_text:
-            meta_tag = f'\n<history>\n{history_entry}\n</history>\n'
-            clean_text = clean_text.replace('</document-info>', meta_tag + '</document-info>')
-        elif '</description>' in clean_text:
-            meta_tag = f'\n<document-info>\n<history>\n{history_entry}\n</history>\n</document-info>\n'
-            clean_text = clean_text.replace('</description>', meta_tag + '</description>')
-    else:
-        # Ищем существующую метку в MD или TXT
-        if is_md:
-            meta_pattern = re.compile(r'<!-- .*?(Текст обработан программой YoRZ 2\.0 \(.*?\)) -->')
-        else:
-            meta_pattern = re.compile(r'.*?(Текст обработан программой YoRZ 2\.0 \(.*?\))')
-            
-        match = meta_pattern.search(clean_text)
-        current_meta = match.group(1) if match else ""
-        new_meta_str = paths.update_metadata(current_meta, "Ёфикатор", app_version)
-        
-        if is_md:
-            new_entry = f'\n\n<!-- {today_str}: {new_meta_str} -->\n'
-        else:
-            new_entry = f'\n\n{today_str}: {new_meta_str}\n'
-            
-        if match:
-            clean_text = clean_text.replace(match.group(0), new_entry.strip())
-        else:
-            clean_text = clean_text.rstrip() + new_entry
+            capture_state = capture_fb2
 
-    with open(output_clean, 'w', encoding='utf-8') as f:
-        f.write(clean_text)
-
-    # Сохраняем HTML версию с подсветкой
-    highlighted_text = re.sub(r'<(/?)yorz', r'<\1span', full_processed_text)
-    
-    if is_fb2:
-        # Для предпросмотра FB2 делаем простую замену тегов на HTML аналоги
-        preview_html = highlighted_text
-        # Заголовки глав
-        preview_html = re.sub(r'<title(?=[\s>/])[^>]*>(.*?)</title>', r'<h3 style="text-align:center; color:#8b0000; margin-top:2em; border-bottom:1px solid #ccc;">\1</h3>', preview_html, flags=re.IGNORECASE | re.DOTALL)
-        # Подзаголовки
-        preview_html = re.sub(r'<subtitle(?=[\s>/])[^>]*>(.*?)</subtitle>', r'<h4 style="text-align:center; color:#555;">\1</h4>', preview_html, flags=re.IGNORECASE | re.DOTALL)
-        # Абзацы
-        preview_html = re.sub(r'<p(?=[\s>/])[^>]*>(.*?)</p>', r'<p style="text-indent:2em; margin:0.5em 0;">\1</p>', preview_html, flags=re.IGNORECASE | re.DOTALL)
-        # Стихи/цитаты
-        preview_html = re.sub(r'<v(?=[\s>/])[^>]*>(.*?)</v>', r'<p style="font-style:italic; text-align:center; margin:0.2em 0;">\1</p>', preview_html, flags=re.IGNORECASE | re.DOTALL)
-        # Пустые строки
-        preview_html = re.sub(r'<empty-line(?=[\s>/])[^>]*/>', r'<br/><br/>', preview_html, flags=re.IGNORECASE)
-        
-        # Пересоберем body только из нужных нам элементов, чтобы не было мусора от метаданных и бинарных данных
-        # Извлекаем все наши h3, h4, p и br
-        final_parts = []
-        for m in re.finditer(r'<(p|h3|h4)(?=[\s>/])[^>]*>.*?</\1>|<br\s*/?>', preview_html, flags=re.IGNORECASE | re.DOTALL):
-            final_parts.append(m.group(0))
-            
-        preview_html = '\n'.join(final_parts) if final_parts else "Ошибка генерации предпросмотра."
-    else:
-        html_body = []
-        for line in highlighted_text.split('\n'):
-            if line.strip(): html_body.append(f"<p>{line}</p>")
-            else: html_body.append("<p>&nbsp;</p>")
-        preview_html = '\n'.join(html_body)
-
-    base_name = os.path.splitext(os.path.basename(input_file))[0]
+            process_paragraphs(fb2_units(), dictionaries, replace_all_choices, emit_part, jobs, dict_files, orange_decisions, orange_answers, on_decision, policy=policy)
+            output.finish()
+        except (KeyboardInterrupt, SystemExit):
+            session_data['fb2_output'] = output.state(True)
+            save_session(sync=True)
+            print(f"\n{Fore.YELLOW}Сохранение прогресса...{Style.RESET_ALL}")
+            raise
+        finally:
+            output.close()
+            session.close()
+    finally:
+        source.close()
 
-    with open(output_html, 'w', encoding='utf-8') as f:
-        f.write(f"""<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n<html xmlns="http://www.w3.org/1999/xhtml">\n<head>\n<title>{base_name}</title>\n<style>\nhtml {{color: #000000; background-color: #FFFAFA;}}\nbody {{text-align : justify }}\np {{text-indent: 2em;  margin-bottom: 0em; margin-top: 0em; font-size : 110%; font-style : normal; font-weight : bold;}}\n.highlight-yellow {{ background-color: yellow; }}\n.highlight-green {{ background-color: lightgreen; }}\n.highlight-blue {{ background-color: lightblue; }}\n.highlight-orange {{ background-color: orange; }}\n</style>\n</head>\n<body>\n""")
-        f.write(preview_html)
-        f.write("\n</body>\n</html>")
-        
-    if os.path.exists(session_file):
-        os.remove(session_file)
+    finish_orange()
+    session.discard()
         
     print(f"{Fore.GREEN}Обработка завершена.{Style.RESET_ALL}")
     print(f"{Fore.GREEN}Чистая версия: {output_clean}{Style.RESET_ALL}")
-    print(f"{Fore.GREEN}HTML с подсветкой: {output_html}{Style.RESET_ALL}")
+    if preview: print(f"{Fore.GREEN}HTML с подсветкой: {output_html}{Style.RESET_ALL}")
+    return True
 
-def run(input_file="book.txt", app_version=None):
+def run(input_file="book.txt", app_version=None, jobs=1, orange_mode="interactive", preview=True, rule_report=None, resume=None, dictionaries=None, orange_table=None):
+    """
+    rule_report — файл, куда по окончании записывается учёт правил словарей (см. rule_stats).
+    Возвращает True, если файл обработан.
+    """
+    from contextlib import nullcontext
     try:
-        replace_expressions(input_file=input_file, app_version=app_version)
+        with rule_stats.collect(rule_report) if rule_report else nullcontext():
+            return bool(replace_expressions(input_file=input_file, app_version=app_version, jobs=jobs, orange_mode=orange_mode, preview=preview,
+                                            resume=resume, dictionaries=dictionaries, orange_table=orange_table))
     except Exception as e:
         print(f"{Fore.RED}Ошибка при ёфикации: {str(e)}{Style.RESET_ALL}")
+        return False
 
 if __name__ == "__main__":
     run()
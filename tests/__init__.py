@@ -0,0 +1,14 @@
+"""
+Тесты запускаются из корня репозитория: python -m pytest (или python -m unittest).
+Данные пользователя (словари, кэш, сессии) на время тестов переносятся во
+временный каталог: modules.paths вычисляет USER_DATA_DIR при импорте, поэтому
+окружение подменяется здесь, до импорта модулей программы.
+"""
+import os
+import atexit
+import shutil
+import tempfile
+
+_HOME = tempfile.mkdtemp(prefix='yorz_home_')
+os.environ['HOME'] = os.environ['USERPROFILE'] = os.environ['APPDATA'] = _HOME
+atexit.register(shutil.rmtree, _HOME, ignore_errors=True)
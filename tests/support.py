@@ -0,0 +1,51 @@
+import os
+import io
+import shutil
+import zipfile
+import datetime
+import tempfile
+import contextlib
+from modules import paths
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+EXPECTED_DIR = os.path.join(DATA_DIR, 'expected')
+BOOKS = ('book.txt', 'book.fb2', 'book.epub')
+# Дата в метке обработки в ожидаемых файлах
+DATE_PLACEHOLDER = '0000-00-00'
+
+paths.ensure_user_data_exists()
+
+def work_dir(test, names=BOOKS):
+    """Временный каталог с копиями книг из tests/data; удаляется после теста."""
+    path = tempfile.mkdtemp(prefix='yorz_test_')
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    for name in names:
+        shutil.copy(os.path.join(DATA_DIR, name), path)
+    return path
+
+def yofy(path, **kwargs):
+    """Ёфикация без вопросов и без вывода в консоль; возвращает результат replace_expressions."""
+    from modules import yorz
+    kwargs.setdefault('orange_mode', 'keep')
+    kwargs.setdefault('resume', False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return yorz.replace_expressions(input_file=path, app_version='2.1.2', **kwargs)
+
+def output_path(path):
+    name, ext = os.path.splitext(path)
+    return f"{name}_yo{ext}"
+
+def read_output(path):
+    """
+    Содержимое книги для сравнения: текст для txt/fb2, словарь {имя: данные}
+    для EPUB. Сегодняшняя дата в метке обработки заменяется на DATE_PLACEHOLDER.
+    """
+    today = datetime.date.today().isoformat()
+    if path.endswith('.epub'):
+        with zipfile.ZipFile(path) as zf:
+            return {item.filename: zf.read(item).replace(today.encode(), DATE_PLACEHOLDER.encode()) for item in zf.infolist()}
+    with open(path, encoding='utf-8', newline='') as f:
+        return f.read().replace(today, DATE_PLACEHOLDER)
+
+def expected(mode, name):
+    return read_output(os.path.join(EXPECTED_DIR, mode, output_path(name)))
@@ -0,0 +1,41 @@
+import unittest
+from modules.aho_corasick import AhoCorasick
+
+class AhoCorasickTest(unittest.TestCase):
+    def automaton(self, needles):
+        automaton = AhoCorasick()
+        for i, needle in enumerate(needles):
+            automaton.add(needle, i)
+        return automaton
+
+    def test_overlapping_needles(self):
+        automaton = self.automaton(['he', 'she', 'his', 'hers'])
+        self.assertEqual(automaton.find_all('ushers'), {0, 1, 3})
+        self.assertEqual(automaton.find_all('ahishe'), {0, 1, 2})
+        self.assertEqual(automaton.find_all('xyz'), set())
+
+    def test_matches_naive_search(self):
+        needles = ['еще', 'ещ', 'щен', 'черн', 'ерн', 'н', 'черный']
+        automaton = self.automaton(needles)
+        for text in ('', 'еще черный щенок', 'ерн', 'чернее', 'нечерн'):
+            with self.subTest(text=text):
+                self.assertEqual(automaton.find_all(text), {i for i, needle in enumerate(needles) if needle in text})
+
+    def test_same_needle_keeps_all_values(self):
+        automaton = AhoCorasick()
+        automaton.add('ел', 'a')
+        automaton.add('ел', 'b')
+        self.assertEqual(automaton.find_all('ёлка ель'), {'a', 'b'})
+
+    def test_add_after_search_rebuilds(self):
+        automaton = self.automaton(['ab'])
+        self.assertEqual(automaton.find_all('abc'), {0})
+        automaton.add('bc', 1)
+        self.assertEqual(automaton.find_all('abc'), {0, 1})
+
+    def test_empty(self):
+        self.assertFalse(AhoCorasick())
+        self.assertTrue(self.automaton(['a']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+from tests.support import BOOKS, work_dir, yofy, output_path, read_output, expected
+
+class BaselineEquivalenceTest(unittest.TestCase):
+    """
+    Результат совпадает с исходной версией программы (до ускорений): ожидаемые
+    файлы в tests/data/expected получены ею с ответами «1» (keep) и «2» (yo)
+    на все вопросы об омографах.
+    """
+
+    def check(self, mode, **kwargs):
+        work = work_dir(self)
+        for name in BOOKS:
+            with self.subTest(book=name, orange=mode):
+                path = os.path.join(work, name)
+                self.assertTrue(yofy(path, orange_mode=mode, **kwargs))
+                self.assertEqual(read_output(output_path(path)), expected(mode, name))
+
+    def test_keep(self):
+        self.check('keep')
+
+    def test_yo(self):
+        self.check('yo')
+
+    def test_without_preview(self):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        self.assertTrue(yofy(path, preview=False))
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.txt'))
+        self.assertFalse(os.path.exists(os.path.join(work, 'book_yo.html')))
+
+    def test_dictionary_cache(self):
+        # Второй запуск берёт словари из кэша и даёт тот же результат
+        for _ in range(2):
+            work = work_dir(self, ('book.fb2',))
+            path = os.path.join(work, 'book.fb2')
+            self.assertTrue(yofy(path))
+            self.assertEqual(read_output(output_path(path)), expected('keep', 'book.fb2'))
+
+class TextFormatsTest(unittest.TestCase):
+    """Потоковая запись txt и Markdown совпадает с исходной версией и в пограничных случаях."""
+
+    def test_text_formats(self):
+        # book.md — разметка Markdown, crlf.txt — концы строк CRLF, пробелы по краям и строка
+        # без перевода в конце, marked.* — прежняя метка обработки посреди текста и пустые строки в конце
+        names = ('book.md', 'crlf.txt', 'marked.txt', 'marked.md')
+        work = work_dir(self, names)
+        for name in names:
+            with self.subTest(book=name):
+                path = os.path.join(work, name)
+                self.assertTrue(yofy(path))
+                self.assertEqual(read_output(output_path(path)), expected('keep', name))
+
+if __name__ == '__main__':
+    unittest.main()
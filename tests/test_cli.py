@@ -0,0 +1,83 @@
+import io
+import os
+import shutil
+import tempfile
+import contextlib
+import unittest
+from modules import cli
+from modules.orange_review import review_file_path
+from tests.support import BOOKS, DATA_DIR, output_path, read_output, expected
+
+class CollectFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        for name in ('a.txt', 'a_yo.txt', 'b.fb2', 'c.pdf', '.hidden.txt', 'for_blacklist.txt', 'sub/d.epub', 'sub/deeper/e.md', 'sub/e_fixed.md'):
+            path = os.path.join(self.dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+    def path(self, *names):
+        return [os.path.normpath(os.path.join(self.dir, name)) for name in names]
+
+    def test_directory_is_walked_recursively(self):
+        files, missing = cli.collect_files([self.dir], 'yorz')
+        self.assertEqual(files, self.path('a.txt', 'b.fb2', 'sub/d.epub', 'sub/e_fixed.md', 'sub/deeper/e.md'))
+        self.assertEqual(missing, [])
+
+    def test_outputs_of_the_command_are_skipped(self):
+        files, _ = cli.collect_files([self.dir], 'typographer')
+        self.assertIn(os.path.join(self.dir, 'a_yo.txt'), files)
+        self.assertNotIn(os.path.join(self.dir, 'sub', 'e_fixed.md'), files)
+
+    def test_globs_explicit_files_and_duplicates(self):
+        inputs = [os.path.join(self.dir, '*.txt'), os.path.join(self.dir, 'a_yo.txt'), os.path.join(self.dir, 'a.txt'),
+                  os.path.join(self.dir, '**', '*.md'), os.path.join(self.dir, 'nothing*'), os.path.join(self.dir, 'missing.txt')]
+        files, missing = cli.collect_files(inputs, 'yorz')
+        self.assertEqual(files, self.path('a.txt', 'a_yo.txt', 'sub/deeper/e.md', 'sub/e_fixed.md'))
+        self.assertEqual(missing, inputs[-2:])
+
+class YorzCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        for name in BOOKS:
+            shutil.copy(os.path.join(DATA_DIR, name), self.dir)
+
+    def main(self, *argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = cli.main(list(argv))
+        return code, out.getvalue()
+
+    def outputs(self):
+        return {name: read_output(output_path(os.path.join(self.dir, name))) for name in BOOKS}
+
+    def test_batch_matches_baseline(self):
+        for jobs in ('1', '2'):
+            with self.subTest(jobs=jobs):
+                code, out = self.main('yorz', self.dir, '--orange', 'keep', '-j', jobs, '--no-preview')
+                self.assertEqual(code, 0, out)
+                self.assertIn('Обработано файлов: 3 из 3', out)
+                self.assertEqual(self.outputs(), {name: expected('keep', name) for name in BOOKS})
+                self.assertFalse(os.path.exists(os.path.join(self.dir, 'book_yo.html')))
+
+    def test_defer_writes_review_files(self):
+        code, out = self.main('yorz', self.dir)
+        self.assertEqual(code, 0, out)
+        self.assertEqual(self.outputs(), {name: expected('keep', name) for name in BOOKS})
+        for name in BOOKS:
+            review_file = review_file_path(os.path.join(self.dir, name))
+            self.assertTrue(os.path.exists(review_file))
+            self.assertIn(os.path.basename(review_file), out)
+
+    def test_errors_give_nonzero_code(self):
+        code, out = self.main('yorz', os.path.join(self.dir, 'missing*.txt'))
+        self.assertEqual(code, 1)
+        self.assertIn('Не найдено файлов', out)
+        code, out = self.main('yorz', self.dir, '--orange', 'table')
+        self.assertEqual(code, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'book_yo.txt')))
+
+if __name__ == '__main__':
+    unittest.main()
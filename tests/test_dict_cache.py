@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from modules import dict_cache
+
+class DictCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        patcher = mock.patch.object(dict_cache, 'CACHE_DIR', os.path.join(self.dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = os.path.join(self.dir, 'test.dic')
+        self.write('еж|ёж\n')
+        self.calls = 0
+
+    def write(self, text, mtime_ns=None):
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write(text)
+        if mtime_ns is not None: os.utime(self.source, ns=(mtime_ns, mtime_ns))
+
+    def loader(self, path):
+        self.calls += 1
+        with open(path, 'r', encoding='utf-8') as f:
+            return dict(line.split('|') for line in f.read().split())
+
+    def load(self):
+        return dict_cache.load(self.source, 'test', self.loader)
+
+    def test_second_load_comes_from_the_cache(self):
+        self.assertEqual(self.load(), {'еж': 'ёж'})
+        self.assertTrue(os.path.exists(dict_cache._cache_file(self.source, 'test')))
+        self.assertEqual(self.load(), {'еж': 'ёж'})
+        self.assertEqual(self.calls, 1)
+
+    def test_changed_file_is_parsed_again(self):
+        self.write('еж|ёж\n', 10 ** 18)
+        self.load()
+        # Размер тот же, время изменения другое: содержимое сверяется по SHA-1
+        self.write('ед|ёд\n', 2 * 10 ** 18)
+        self.assertEqual(self.load(), {'ед': 'ёд'})
+        self.assertEqual(self.calls, 2)
+
+    def test_touched_file_keeps_the_cache(self):
+        self.write('еж|ёж\n', 10 ** 18)
+        self.load()
+        self.write('еж|ёж\n', 2 * 10 ** 18)
+        self.assertEqual(self.load(), {'еж': 'ёж'})
+        self.assertEqual(self.calls, 1)
+        # Новое время изменения записано в заголовок: дальше хэш не считается
+        header = dict_cache._read_header(dict_cache._cache_file(self.source, 'test'))
+        self.assertEqual(header['mtime_ns'], 2 * 10 ** 18)
+
+    def test_old_version_and_broken_cache_are_ignored(self):
+        self.load()
+        with mock.patch.object(dict_cache, 'CACHE_VERSION', dict_cache.CACHE_VERSION + 1):
+            self.assertEqual(self.load(), {'еж': 'ёж'})
+        self.assertEqual(self.calls, 2)
+        with open(dict_cache._cache_file(self.source, 'test'), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertEqual(self.load(), {'еж': 'ёж'})
+        self.assertEqual(self.calls, 3)
+
+    def test_invalidate(self):
+        self.load()
+        dict_cache.invalidate()
+        self.assertEqual(os.listdir(dict_cache.CACHE_DIR), [])
+        self.load()
+        self.assertEqual(self.calls, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import zlib
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+from modules.epub_utils import EpubWriter, raw_copy_supported
+
+def make_source(path):
+    """Небольшой EPUB: несжатый mimetype, сжатые XHTML и CSS, «картинка» без сжатия, запись с extra-полем."""
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        zf.writestr('OEBPS/text.xhtml', '<html><body>' + '<p>Еще елка.</p>' * 200 + '</body></html>', compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('OEBPS/style.css', 'p { margin: 0; }\n' * 50, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+        zf.writestr('OEBPS/cover.png', bytes(range(256)) * 40, compress_type=zipfile.ZIP_STORED)
+        info = zipfile.ZipInfo('OEBPS/extra.txt')
+        info.extra = b'\x99\x99\x04\x00abcd'
+        zf.writestr(info, 'с extra-полем', compress_type=zipfile.ZIP_DEFLATED)
+
+class EpubWriterCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.source = os.path.join(self.dir, 'book.epub')
+        self.output = os.path.join(self.dir, 'book_yo.epub')
+        make_source(self.source)
+
+    def copy_all(self, **attrs):
+        with zipfile.ZipFile(self.source) as zin:
+            with EpubWriter(self.output, zin) as writer:
+                for name, value in attrs.items(): setattr(writer, name, value)
+                for item in zin.infolist():
+                    writer.copy(item)
+
+    def assert_identical(self, raw=True):
+        with zipfile.ZipFile(self.source) as zin, zipfile.ZipFile(self.output) as zout:
+            self.assertIsNone(zout.testzip())
+            self.assertEqual(zin.namelist(), zout.namelist())
+            for item in zin.infolist():
+                copied = zout.getinfo(item.filename)
+                self.assertEqual(zin.read(item), zout.read(copied))
+                self.assertEqual(item.CRC, copied.CRC)
+                self.assertEqual(item.compress_type, copied.compress_type)
+                if raw: self.assertEqual(item.compress_size, copied.compress_size)
+
+    def test_raw_copy_keeps_entries_byte_identical(self):
+        with zipfile.ZipFile(self.source) as zin, zipfile.ZipFile(os.path.join(self.dir, 'probe.zip'), 'w') as probe:
+            self.assertTrue(raw_copy_supported(zin, probe))
+        self.copy_all()
+        self.assert_identical()
+
+    def test_regular_copy_without_raw_support(self):
+        self.copy_all(raw_copy=False)
+        self.assert_identical(raw=False)
+
+    def test_failed_raw_write_falls_back(self):
+        with mock.patch.object(EpubWriter, '_write_raw', side_effect=AttributeError('no internals')):
+            self.copy_all()
+        self.assert_identical(raw=False)
+
+    def test_missing_internals_disable_raw_copy(self):
+        with mock.patch.object(zipfile, '_strip_extra', None, create=True):
+            del zipfile._strip_extra
+            with zipfile.ZipFile(self.source) as zin:
+                with EpubWriter(self.output, zin) as writer:
+                    self.assertFalse(writer.raw_copy)
+                    for item in zin.infolist(): writer.copy(item)
+        self.assert_identical(raw=False)
+
+    def test_write_of_unchanged_content_is_copied(self):
+        with zipfile.ZipFile(self.source) as zin:
+            with EpubWriter(self.output, zin) as writer:
+                for item in zin.infolist():
+                    data = zin.read(item)
+                    if item.filename.endswith('.xhtml'): data = data.decode('utf-8').replace('Еще', 'Ещё')
+                    writer.write(item, data)
+        with zipfile.ZipFile(self.output) as zout:
+            self.assertIsNone(zout.testzip())
+            self.assertIn('Ещё елка', zout.read('OEBPS/text.xhtml').decode('utf-8'))
+            self.assertEqual(zlib.crc32(bytes(range(256)) * 40), zout.getinfo('OEBPS/cover.png').CRC)
+
+if __name__ == '__main__':
+    unittest.main()
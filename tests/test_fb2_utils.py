@@ -0,0 +1,82 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from modules import fb2_utils
+from modules.fb2_utils import Fb2Source
+from tests.support import DATA_DIR
+
+# Разбиение всего текста книги в исходной версии программы
+OLD_SPLIT_RE = re.compile(r'(<p(?=[\s>/])[^>]*>.*?</p>|<v(?=[\s>/])[^>]*>.*?</v>|<text-author(?=[\s>/])[^>]*>.*?</text-author>|<subtitle(?=[\s>/])[^>]*>.*?</subtitle>|<title(?=[\s>/])[^>]*>.*?</title>|<empty-line(?=[\s>/])[^>]*>.*?</empty-line>|<empty-line(?=[\s>/])[^>]*/>)', re.IGNORECASE | re.DOTALL)
+
+class Fb2SourceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def source(self, data):
+        path = os.path.join(self.dir, 'book.fb2')
+        with open(path, 'wb') as f:
+            f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+        source = Fb2Source(path)
+        self.addCleanup(source.close)
+        return source
+
+    def split(self, source):
+        """Части parts() с содержимым <binary>, прочитанным из файла."""
+        parts = []
+        for i, part in enumerate(source.parts()):
+            if i % 2: parts.append(part)
+            else: parts.append(''.join(p if isinstance(p, str) else source.text(*p) for p in part))
+        return parts
+
+    def check_split(self, data):
+        text = data.decode('utf-8') if isinstance(data, bytes) else data
+        # Текстовый режим open() приводит переводы строк к \n
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        self.assertEqual(self.split(self.source(data)), OLD_SPLIT_RE.split(text))
+
+    def test_split_matches_old_regex(self):
+        with open(os.path.join(DATA_DIR, 'book.fb2'), 'rb') as f:
+            book = f.read()
+        cases = {
+            'book': book,
+            'crlf': book.replace(b'\n', b'\r\n'),
+            'empty': b'',
+            'no elements': '<FictionBook><body></body></FictionBook>',
+            'nested title': '<title><p>Глава</p><p>первая</p></title><p>текст</p>',
+            'empty lines': '<p>а</p><empty-line/><empty-line /><empty-line></empty-line><p>б</p>',
+            'case and prefixes': '<P class="x">а</P><pre>б</pre><poem><v>в</v></poem><text-author>г</text-author>',
+            'unclosed': '<p>а</p><p>без конца <subtitle>б</subtitle>',
+            'no tag end': '<p>а</p><p',
+            'binary': '<p>а</p><binary id="c" content-type="image/png">iVBORw0KGgo=\n<p>не текст</p></binary><p>б</p>',
+            'binary without close': '<p>а</p><binary id="c">iVBORw0KGgo=<p>б</p>',
+        }
+        for name, data in cases.items():
+            with self.subTest(case=name):
+                self.check_split(data)
+
+    def test_binary_is_not_decoded(self):
+        payload = b'\xff\xfe' + b'A' * 100
+        source = self.source(b'<p>a</p><binary id="c">' + payload + b'</binary><p>b</p>')
+        parts = list(source.parts())
+        self.assertEqual(parts[1], '<p>a</p>')
+        start, end = parts[2][1]
+        self.assertEqual(source.data[start:end], payload)
+
+    def test_copy_to_across_chunks(self):
+        data = b'ab\r\ncd\re\nf' * 5
+        source = self.source(data)
+        for chunk in (1, 2, 3, 7):
+            for linesep in ('\n', '\r\n'):
+                with self.subTest(chunk=chunk, linesep=linesep), mock.patch.object(fb2_utils, 'COPY_CHUNK', chunk):
+                    out = io.BytesIO()
+                    source.copy_to(out, 1, len(data) - 1, linesep)
+                    expected = data[1:-1].replace(b'\r\n', b'\n').replace(b'\r', b'\n').replace(b'\n', linesep.encode())
+                    self.assertEqual(out.getvalue(), expected)
+
+if __name__ == '__main__':
+    unittest.main()
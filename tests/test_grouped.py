@@ -0,0 +1,74 @@
+import os
+import unittest
+from unittest import mock
+from modules.session import Session
+from tests.support import BOOKS, work_dir, yofy, output_path, read_output, expected
+
+def answering(*answers):
+    """Подставляет ответы по порядку (последний — для всех остальных вопросов); возвращает список заданных вопросов."""
+    prompts = []
+    def answer(prompt=''):
+        prompts.append(prompt)
+        reply = answers[min(len(prompts), len(answers)) - 1]
+        if isinstance(reply, BaseException): raise reply
+        return reply
+    return prompts, mock.patch('builtins.input', answer)
+
+class GroupedReviewTest(unittest.TestCase):
+    """В книге четыре вопроса по омографам в трёх группах: далеко (дважды), звезды, весла."""
+
+    def book(self):
+        return os.path.join(work_dir(self, ('book.txt',)), 'book.txt')
+
+    def test_one_answer_per_group(self):
+        for answer, mode in (('1', 'keep'), ('2', 'yo')):
+            work = work_dir(self)
+            for name in BOOKS:
+                with self.subTest(book=name, answer=answer):
+                    path = os.path.join(work, name)
+                    prompts, patch = answering(answer)
+                    with patch:
+                        self.assertTrue(yofy(path, orange_mode='grouped'))
+                    self.assertEqual(read_output(output_path(path)), expected(mode, name))
+                    if name == 'book.txt': self.assertEqual(len(prompts), 3)
+
+    def test_group_with_exceptions(self):
+        path = self.book()
+        prompts, patch = answering('2 -2', '1')
+        with patch:
+            self.assertTrue(yofy(path, orange_mode='grouped'))
+        self.assertEqual(len(prompts), 3)
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.txt').replace('далеко', 'далёко', 1))
+
+    def test_invalid_answer_is_asked_again(self):
+        path = self.book()
+        prompts, patch = answering('5', '2 -7', '2')
+        with patch:
+            self.assertTrue(yofy(path, orange_mode='grouped'))
+        self.assertEqual(len(prompts), 5)
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+
+    def test_one_by_one_and_skip_the_rest(self):
+        # Первая группа — по одному (ё, затем без ё), на второй остальные группы пропускаются
+        path = self.book()
+        prompts, patch = answering('3', '2', '1', '4')
+        with patch:
+            self.assertTrue(yofy(path, orange_mode='grouped'))
+        self.assertEqual(len(prompts), 4)
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.txt').replace('далеко', 'далёко', 1))
+
+    def test_interrupted_review_is_not_asked_again(self):
+        path = self.book()
+        prompts, patch = answering('2', KeyboardInterrupt())
+        with patch, self.assertRaises(KeyboardInterrupt):
+            yofy(path, orange_mode='grouped')
+        self.assertEqual(len(prompts), 2)
+        self.assertTrue(Session(path).exists())
+        prompts, patch = answering('1')
+        with patch:
+            self.assertTrue(yofy(path, orange_mode='grouped', resume=True))
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.txt').replace('далеко', 'далёко'))
+
+if __name__ == '__main__':
+    unittest.main()
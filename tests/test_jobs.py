@@ -0,0 +1,58 @@
+import os
+import unittest
+from unittest import mock
+from modules import yorz
+from tests.support import BOOKS, work_dir, yofy, output_path, read_output, expected
+
+class JobsEquivalenceTest(unittest.TestCase):
+    """Пул процессов (jobs > 1) даёт тот же результат, что и обработка в одном процессе."""
+
+    def run_books(self, jobs, mode):
+        work = work_dir(self)
+        results = {}
+        # Маленькие пакеты, чтобы книга делилась между процессами на много частей
+        with mock.patch.object(yorz, 'BATCH_MAX_ITEMS', 2):
+            for name in BOOKS:
+                path = os.path.join(work, name)
+                self.assertTrue(yofy(path, jobs=jobs, orange_mode=mode))
+                review = os.path.splitext(output_path(path))[0] + '_review.json'
+                results[name] = (read_output(output_path(path)), os.path.exists(review) and read_output(review).replace(work, ''))
+        return results
+
+    def test_jobs_match_single_process(self):
+        for mode in ('keep', 'yo', 'defer'):
+            single, pooled = self.run_books(1, mode), self.run_books(3, mode)
+            for name in BOOKS:
+                with self.subTest(book=name, orange=mode):
+                    self.assertEqual(pooled[name], single[name])
+                    if mode != 'defer': self.assertEqual(pooled[name][0], expected(mode, name))
+                    else: self.assertTrue(pooled[name][1])
+
+class EpubLookaheadTest(unittest.TestCase):
+    """С пулом все документы EPUB уходят в работу сразу, не дожидаясь вопросов по омографам в предыдущих."""
+
+    def test_documents_are_submitted_before_the_first_question(self):
+        path = os.path.join(work_dir(self, ('book.epub',)), 'book.epub')
+        pulled, asked = [], []
+        process_paragraphs = yorz.process_paragraphs
+
+        def counting(units, *args, **kwargs):
+            def count():
+                for unit in units:
+                    pulled.append(unit[0])
+                    yield unit
+            return process_paragraphs(count(), *args, **kwargs)
+
+        def answer(prompt=''):
+            asked.append(len(pulled))
+            return '2'
+
+        with mock.patch.object(yorz, 'BATCH_MAX_ITEMS', 1), mock.patch.object(yorz, 'process_paragraphs', counting), \
+                mock.patch('builtins.input', answer):
+            self.assertTrue(yofy(path, jobs=2, orange_mode='interactive'))
+        self.assertTrue(asked)
+        self.assertEqual(asked[0], len(pulled))
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.epub'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import json
+import unittest
+from unittest import mock
+from modules.orange_review import review_file_path, load_orange_table
+from tests.support import BOOKS, work_dir, yofy, output_path, read_output, expected
+
+def answering(*answers):
+    """Подставляет ответы на вопросы группового просмотра по кругу; возвращает список заданных вопросов."""
+    prompts = []
+    def answer(prompt=''):
+        prompts.append(prompt)
+        return answers[(len(prompts) - 1) % len(answers)]
+    return prompts, mock.patch('builtins.input', answer)
+
+class DeferReviewTest(unittest.TestCase):
+    """Омографы, отложенные при обработке без вопросов, проверяются потом группами, и книга обрабатывается с этими ответами."""
+
+    def test_review_answers_reach_the_output(self):
+        for answer, mode in (('2', 'yo'), ('1', 'keep')):
+            work = work_dir(self)
+            for name in BOOKS:
+                with self.subTest(book=name, answer=answer):
+                    path = os.path.join(work, name)
+                    self.assertTrue(yofy(path, orange_mode='defer'))
+                    self.assertEqual(read_output(output_path(path)), expected('keep', name))
+                    self.assertTrue(os.path.exists(review_file_path(path)))
+                    prompts, patch = answering(answer)
+                    with patch:
+                        self.assertTrue(yofy(path, orange_mode='review'))
+                    self.assertTrue(prompts)
+                    self.assertEqual(read_output(output_path(path)), expected(mode, name))
+                    self.assertFalse(os.path.exists(review_file_path(path)))
+
+    def test_review_matches_grouped_mode(self):
+        for name in BOOKS:
+            with self.subTest(book=name):
+                deferred, grouped = os.path.join(work_dir(self, (name,)), name), os.path.join(work_dir(self, (name,)), name)
+                yofy(deferred, orange_mode='defer')
+                review_prompts, patch = answering('2', '1', '2 -1')
+                with patch:
+                    self.assertTrue(yofy(deferred, orange_mode='review'))
+                grouped_prompts, patch = answering('2', '1', '2 -1')
+                with patch:
+                    self.assertTrue(yofy(grouped, orange_mode='grouped'))
+                self.assertEqual(len(review_prompts), len(grouped_prompts))
+                self.assertEqual(read_output(output_path(deferred)), read_output(output_path(grouped)))
+
+    def test_table_decides_listed_rules(self):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        table_file = os.path.join(work, 'table.txt')
+        with open(table_file, 'w', encoding='utf-8') as f:
+            f.write("# ответы по правилам\nдалеко|е\nзвезды|ё\n\nвсе|?\n")
+        self.assertEqual(load_orange_table(table_file), {'далеко': '1', 'звезды': '2'})
+        self.assertTrue(yofy(path, orange_mode='table', orange_table=table_file))
+        keep = expected('keep', 'book.txt')
+        self.assertEqual(read_output(output_path(path)), keep.replace('звезды', 'звёзды'))
+        with open(review_file_path(path), encoding='utf-8') as f:
+            review = json.load(f)
+        self.assertEqual({record['original'] for record in review['occurrences']}, {'весла'})
+        # При проверке спрашиваются только отложенные правила, остальные решаются по той же таблице
+        prompts, patch = answering('2')
+        with patch:
+            self.assertTrue(yofy(path, orange_mode='review'))
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(read_output(output_path(path)), keep.replace('звезды', 'звёзды').replace('Весла', 'Вёсла'))
+
+    def test_review_of_changed_book_is_refused(self):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        yofy(path, orange_mode='defer')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\nЕще одна строка.\n')
+        prompts, patch = answering('2')
+        with patch:
+            self.assertFalse(yofy(path, orange_mode='review'))
+        self.assertEqual(prompts, [])
+        self.assertTrue(os.path.exists(review_file_path(path)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from modules.paragraph import Paragraph, Span
+
+class ParagraphTest(unittest.TestCase):
+    def paragraph(self):
+        # «все еще шел» заменено зелёным правилом, в тексте замены жёлтый поменял «шел»
+        paragraph = Paragraph('Все <b>еще</b> шел, и ель')
+        green = paragraph.add_span(Span(0, 18, 'Всё <b>ещё</b> шел', 'highlight-green', 'все еще \\w+ел'))
+        green.inner.add_span(Span(15, 18, 'шёл', 'highlight-yellow'))
+        paragraph.add_span(Span(22, 25, 'ёль', 'highlight-yellow'))
+        return paragraph, green
+
+    def test_render(self):
+        paragraph, _ = self.paragraph()
+        self.assertEqual(paragraph.render_clean(), 'Всё <b>ещё</b> шёл, и ёль')
+        self.assertEqual(paragraph.render_html(), '<span class="highlight-green">Всё <b>ещё</b> <span class="highlight-yellow">шёл</span></span>, '
+                                                  'и <span class="highlight-yellow">ёль</span>')
+
+    def test_free_regions_skip_tags_and_spans(self):
+        paragraph = Paragraph('а <i>б</i> в г')
+        self.assertEqual(paragraph.free_regions(), [(0, 2), (5, 6), (10, 14)])
+        paragraph.add_span(Span(11, 12, 'В', 'highlight-blue'))
+        self.assertEqual(paragraph.free_regions(), [(0, 2), (5, 6), (10, 11), (12, 14)])
+
+    def test_spans_are_kept_in_order(self):
+        paragraph = Paragraph('абвгд')
+        for start in (3, 0, 1):
+            paragraph.add_span(Span(start, start + 1, str(start), 'highlight-yellow'))
+        self.assertEqual([span.start for span in paragraph.spans], [0, 1, 3])
+        self.assertEqual(paragraph.render(), '01в3д')
+
+    def test_nodes_and_stage(self):
+        paragraph, green = self.paragraph()
+        self.assertEqual([node.text for node in paragraph.iter_nodes()], [paragraph.text, green.inner.text, 'шёл', 'ёль'])
+        self.assertEqual(green.stage, 'green')
+        self.assertEqual(Span(0, 1, 'x', 'custom').stage, 'custom')
+
+    def test_line_bounds(self):
+        paragraph = Paragraph('раз\nдва\n\nтри')
+        self.assertEqual([paragraph.line_index(pos) for pos in (0, 3, 4, 8, 9)], [0, 0, 1, 2, 3])
+        self.assertEqual(paragraph.line_bounds(5), (4, 7))
+        self.assertEqual(paragraph.line_bounds(10), (9, 12))
+
+if __name__ == '__main__':
+    unittest.main()
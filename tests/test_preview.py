@@ -0,0 +1,56 @@
+import os
+import unittest
+from unittest import mock
+from modules import session
+from tests.support import EXPECTED_DIR, BOOKS, work_dir, yofy, output_path, read_output, expected
+from tests.test_resume import interrupt_after
+
+def expected_preview(mode):
+    """HTML с подсветкой для book.fb2, полученный исходной версией программы."""
+    return read_output(os.path.join(EXPECTED_DIR, mode, 'preview', 'book_yo.html'))
+
+def preview_path(path):
+    return os.path.splitext(path)[0] + '_yo.html'
+
+class Fb2PreviewTest(unittest.TestCase):
+    """Предпросмотр FB2 собирается по частям во время обработки и совпадает с исходной версией."""
+
+    def book(self):
+        return os.path.join(work_dir(self, ('book.fb2',)), 'book.fb2')
+
+    def test_preview_matches_baseline(self):
+        for mode in ('keep', 'yo'):
+            with self.subTest(orange=mode):
+                path = self.book()
+                self.assertTrue(yofy(path, orange_mode=mode))
+                self.assertEqual(read_output(preview_path(path)), expected_preview(mode))
+
+    def test_interrupted_preview_is_resumed(self):
+        for stop in (1, 7, 15):
+            with self.subTest(stop=stop):
+                path = self.book()
+                with interrupt_after(stop), mock.patch.object(session, 'CHECKPOINT_INTERVAL', 0):
+                    with self.assertRaises(KeyboardInterrupt):
+                        yofy(path, orange_mode='yo')
+                self.assertTrue(yofy(path, orange_mode='yo', resume=True))
+                self.assertEqual(read_output(preview_path(path)), expected_preview('yo'))
+                self.assertEqual(read_output(output_path(path)), expected('yo', 'book.fb2'))
+
+    def test_preview_off_for_every_format(self):
+        work = work_dir(self)
+        for name in BOOKS:
+            with self.subTest(book=name):
+                path = os.path.join(work, name)
+                self.assertTrue(yofy(path, preview=False))
+                self.assertEqual(read_output(output_path(path)), expected('keep', name))
+                self.assertFalse(os.path.exists(preview_path(path)))
+        # Продолжение сессии сохраняет настройку, с которой обработка начиналась
+        path = self.book()
+        with interrupt_after(7), self.assertRaises(KeyboardInterrupt):
+            yofy(path, preview=False)
+        self.assertTrue(yofy(path, resume=True))
+        self.assertFalse(os.path.exists(preview_path(path)))
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.fb2'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import subprocess
+import unittest
+from unittest import mock
+from modules import yorz, session
+from modules.session import Session
+from tests.support import BOOKS, work_dir, yofy, output_path, read_output, expected
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Процесс, который после stop вызовов apply_blue_green падает без сохранения
+# (как при снятии задачи): на диске остаётся только последняя контрольная точка
+CRASH_SCRIPT = '''
+import os, sys, io, contextlib
+from modules import paths, session, yorz
+paths.ensure_user_data_exists()
+session.CHECKPOINT_INTERVAL = 0
+apply_blue_green, stop, calls = yorz.apply_blue_green, int(sys.argv[2]), []
+def crash(*args):
+    calls.append(1)
+    if len(calls) == stop: os._exit(3)
+    return apply_blue_green(*args)
+yorz.apply_blue_green = crash
+with contextlib.redirect_stdout(io.StringIO()):
+    yorz.replace_expressions(input_file=sys.argv[1], app_version='2.1.2', orange_mode='yo', resume=False)
+'''
+
+# Номера абзацев (для EPUB — документов), на которых прерывается обработка;
+# последний — последний в книге
+STOPS = {'book.txt': (1, 4, 9), 'book.fb2': (1, 7, 15), 'book.epub': (1, 2, 3)}
+
+def interrupt_after(stop):
+    """Подменяет синий и зелёный этапы так, что вызов номер stop прерывается, как по Ctrl+C."""
+    apply_blue_green, calls = yorz.apply_blue_green, []
+    def interrupted(*args):
+        calls.append(1)
+        if len(calls) == stop: raise KeyboardInterrupt()
+        return apply_blue_green(*args)
+    return mock.patch.object(yorz, 'apply_blue_green', interrupted)
+
+class InterruptResumeTest(unittest.TestCase):
+    """Обработка, прерванная на любом абзаце и продолженная, даёт тот же результат, что и без перерыва."""
+
+    def check(self, step, checkpoint_interval=session.CHECKPOINT_INTERVAL):
+        work = work_dir(self)
+        for name in BOOKS:
+            stop = STOPS[name][step]
+            with self.subTest(book=name, stop=stop, checkpoint_interval=checkpoint_interval):
+                path = os.path.join(work, name)
+                with interrupt_after(stop), mock.patch.object(session, 'CHECKPOINT_INTERVAL', checkpoint_interval):
+                    with self.assertRaises(KeyboardInterrupt):
+                        yofy(path, orange_mode='yo')
+                self.assertTrue(Session(path).exists())
+                self.assertTrue(yofy(path, orange_mode='yo', resume=True))
+                self.assertFalse(Session(path).exists())
+                self.assertEqual(read_output(output_path(path)), expected('yo', name))
+
+    def test_interrupt_and_resume(self):
+        for step in range(3):
+            self.check(step)
+
+    def test_interrupt_after_checkpoints(self):
+        self.check(1, checkpoint_interval=0)
+
+    def test_answers_are_not_asked_again(self):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        prompts = []
+        def answer(prompt=''):
+            prompts.append(prompt)
+            return '2'
+        with mock.patch('builtins.input', answer):
+            with interrupt_after(6), self.assertRaises(KeyboardInterrupt):
+                yofy(path, orange_mode='interactive')
+            asked = len(prompts)
+            self.assertTrue(yofy(path, orange_mode='interactive', resume=True))
+        # В книге четыре вопроса об омографах: два заданы до перерыва, остальные после
+        self.assertEqual(asked, 2)
+        self.assertEqual(len(prompts), 4)
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+
+    def test_restart_discards_session(self):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        with interrupt_after(5), self.assertRaises(KeyboardInterrupt):
+            yofy(path, orange_mode='yo')
+        self.assertTrue(yofy(path, orange_mode='yo', resume=False))
+        self.assertFalse(Session(path).exists())
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+
+    def test_resume_after_crash(self):
+        work = work_dir(self)
+        for name in BOOKS:
+            with self.subTest(book=name):
+                path = os.path.join(work, name)
+                crashed = subprocess.run([sys.executable, '-c', CRASH_SCRIPT, path, str(STOPS[name][1] + 1)], cwd=ROOT, capture_output=True, text=True)
+                self.assertEqual(crashed.returncode, 3, crashed.stderr)
+                self.assertTrue(Session(path).exists())
+                self.assertTrue(yofy(path, orange_mode='yo', resume=True))
+                self.assertEqual(read_output(output_path(path)), expected('yo', name))
+
+if __name__ == '__main__':
+    unittest.main()
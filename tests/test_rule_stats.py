@@ -0,0 +1,55 @@
+import os
+import re
+import unittest
+from modules import rule_stats
+from modules.yorz import load_dictionaries
+from tests.support import work_dir, yofy, output_path, read_output, expected
+from tests.test_resume import interrupt_after
+
+class RuleStatsTest(unittest.TestCase):
+    def run_book(self, **kwargs):
+        work = work_dir(self, ('book.txt',))
+        path = os.path.join(work, 'book.txt')
+        report = os.path.join(work, 'rules.txt')
+        with rule_stats.collect(report) as stats:
+            self.assertIs(rule_stats.ACTIVE, stats)
+            self.assertTrue(yofy(path, orange_mode='yo', **kwargs))
+        self.assertIsNone(rule_stats.ACTIVE)
+        return path, report, stats
+
+    def test_counts_match_the_output(self):
+        # С пулом процессов учёт тоже полный: пока он включён, пул не используется
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                path, report, stats = self.run_book(jobs=jobs)
+                self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+                with open(os.path.splitext(output_path(path))[0] + '.html', encoding='utf-8') as f:
+                    html = f.read()
+                for stage in ('blue', 'green', 'orange'):
+                    matches = sum(c.matches for key, c in stats.rules.items() if key[0] == stage)
+                    self.assertEqual(matches, len(re.findall(f'<span class="highlight-{stage}">', html)), stage)
+                # Жёлтые правила-слова считаются по формам слов, а не по вхождениям
+                self.assertTrue(stats.counter('yellow', '\\w*вес\\w*').vetoes)
+                self.assertEqual(stats.counter('green', 'все равно').matches, 1)
+
+    def test_every_rule_is_reported(self):
+        _, report, stats = self.run_book()
+        yo_dict, yo_variants, blue, green = load_dictionaries()
+        self.assertEqual(len(stats.rules), len(yo_dict.rules) + len(yo_variants) + len(blue) + len(green))
+        with open(report, encoding='utf-8') as f:
+            text = f.read()
+        self.assertIn('Самые затратные правила', text)
+        self.assertIn('Правила без замен', text)
+        self.assertRegex(text, fr'\ngreen +{len(green)} ')
+
+    def test_report_is_written_on_interrupt(self):
+        work = work_dir(self, ('book.txt',))
+        report = os.path.join(work, 'rules.txt')
+        with interrupt_after(4), self.assertRaises(KeyboardInterrupt):
+            with rule_stats.collect(report):
+                yofy(os.path.join(work, 'book.txt'))
+        self.assertIsNone(rule_stats.ACTIVE)
+        self.assertTrue(os.path.exists(report))
+
+if __name__ == '__main__':
+    unittest.main()
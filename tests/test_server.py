@@ -0,0 +1,118 @@
+import os
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from modules import yorz, client
+from modules.server import HOST, YofyService, RequestHandler, yofy_text
+from tests.support import DATA_DIR, work_dir, output_path, read_output, expected
+
+def rebuild(text, changes):
+    """Чистый текст из исходного и списка изменений."""
+    parts, pos = [], 0
+    for change in changes:
+        parts.append(text[pos:change['start']])
+        parts.append(change['replacement'])
+        pos = change['end']
+    return ''.join(parts) + text[pos:]
+
+class YofyTextTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dictionaries = yorz.load_dictionaries()
+        with open(os.path.join(DATA_DIR, 'book.txt'), encoding='utf-8') as f:
+            cls.book = f.read()
+
+    def stages(self, result):
+        return [(c['original'], c['replacement'], c['stage'], [o['stage'] for o in c.get('outer', [])]) for c in result['spans']]
+
+    def test_nested_replacement_is_attributed_to_its_rule(self):
+        # «шёл» меняет жёлтый словарь внутри замены зелёного правила «все еще \w+ел»
+        result = yofy_text("Все еще шел снег", self.dictionaries, 'keep')
+        self.assertEqual(result['text'], "Всё ещё шёл снег")
+        self.assertEqual(self.stages(result), [("Все еще ", "Всё ещё ", 'green', []), ("шел", "шёл", 'yellow', [])])
+        self.assertEqual(result['spans'][0]['rule'], r'все еще \w+ел')
+
+    def test_change_made_by_outer_and_nested_rules(self):
+        result = yofy_text("зелено-желтые листья", self.dictionaries, 'keep')
+        self.assertEqual(self.stages(result), [("зелено", "зёлёно", 'yellow', ['green']), ("желтые", "жёлтые", 'yellow', [])])
+
+    def test_changes_are_consistent_with_both_texts(self):
+        for orange in ('keep', 'yo', 'defer'):
+            with self.subTest(orange=orange):
+                result = yofy_text(self.book, self.dictionaries, orange)
+                out = result['text']
+                for change in result['spans']:
+                    self.assertEqual(self.book[change['start']:change['end']], change['original'])
+                    self.assertEqual(out[change['out_start']:change['out_end']], change['replacement'])
+                    self.assertIn(change['stage'], ('blue', 'green', 'orange', 'yellow'))
+                self.assertEqual(rebuild(self.book, result['spans']), out)
+
+    def test_text_matches_file_output(self):
+        for orange in ('keep', 'yo'):
+            with self.subTest(orange=orange):
+                result = yofy_text(self.book, self.dictionaries, orange)
+                # В файле к тексту добавлена метка обработки
+                self.assertEqual(result['text'].rstrip('\n'), expected(orange, 'book.txt').rsplit('\n\n', 1)[0])
+
+    def test_deferred_homographs(self):
+        result = yofy_text(self.book, self.dictionaries, 'defer')
+        self.assertEqual(result['text'], yofy_text(self.book, self.dictionaries, 'keep')['text'])
+        self.assertEqual(sorted(r['rule'] for r in result['deferred']), ['весла', 'далеко', 'далеко', 'звезды'])
+        for record in result['deferred']:
+            self.assertEqual(self.book[record['start']:record['end']], record['base_word'])
+
+    def test_html(self):
+        result = yofy_text("Все еще шел снег", self.dictionaries, 'keep', html=True)
+        self.assertIn('highlight-green', result['html'])
+        self.assertIn('highlight-yellow', result['html'])
+
+class ServerTest(unittest.TestCase):
+    """Сервер на свободном порту с одним рабочим процессом."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = YofyService(jobs=1)
+        cls.httpd = ThreadingHTTPServer((HOST, 0), RequestHandler)
+        cls.httpd.daemon_threads = True
+        cls.httpd.service = cls.service
+        cls.httpd.verbose = False
+        cls.port = cls.httpd.server_address[1]
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.service.close()
+
+    def call(self, path, data=None):
+        return client.call(path, data, self.port, timeout=60)
+
+    def test_text_request(self):
+        result = client.yofy("Все еще шел снег", orange='keep', port=self.port)
+        self.assertEqual(result['text'], "Всё ещё шёл снег")
+        self.assertEqual([c['stage'] for c in result['spans']], ['green', 'yellow'])
+
+    def test_file_request(self):
+        path = os.path.join(work_dir(self, ('book.fb2',)), 'book.fb2')
+        result = client.yofy(file=path, orange='keep', preview=False, port=self.port)
+        self.assertTrue(result['ok'], result['log'])
+        self.assertEqual(result['output'], output_path(path))
+        self.assertIsNone(result['html'])
+        self.assertEqual(read_output(output_path(path)), expected('keep', 'book.fb2'))
+
+    def test_bad_requests(self):
+        for data, message in (({'text': 'еще', 'orange': 'maybe'}, 'orange'), ({'orange': 'keep'}, 'text'),
+                              ({'file': 'нет такой книги.txt'}, 'не найден'), ({'text': 1}, 'строкой')):
+            with self.subTest(data=data), self.assertRaisesRegex(RuntimeError, message):
+                self.call('/yofy', data)
+        with self.assertRaisesRegex(RuntimeError, 'неизвестный адрес'):
+            self.call('/nothing')
+
+    def test_status_and_reload(self):
+        generation = self.call('/status')['generation']
+        self.assertEqual(self.call('/reload', {})['generation'], generation + 1)
+        self.assertEqual(client.yofy("еще", orange='keep', port=self.port)['text'], "ещё")
+
+if __name__ == '__main__':
+    unittest.main()
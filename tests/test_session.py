@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+from modules import session
+from modules.session import Session
+from tests.support import work_dir, yofy, output_path, read_output, expected
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.book = os.path.join(self.dir, 'book.txt')
+
+    def session(self):
+        s = Session(self.book)
+        self.addCleanup(s.close)
+        return s
+
+    def test_journal_is_cut_to_the_last_checkpoint(self):
+        s = self.session()
+        s.append('<p>а</p>', 'а')
+        s.data['processed_index'] = 1
+        s.save()
+        # Фрагмент после контрольной точки (записан до сбоя) при продолжении отбрасывается
+        s.append('<p>б</p>', 'б')
+        s.close()
+        resumed = self.session()
+        self.assertEqual(resumed.load()['processed_index'], 1)
+        self.assertEqual(list(resumed.records()), [('<p>а</p>', 'а')])
+
+    def test_damaged_journal_is_rejected(self):
+        s = self.session()
+        s.append('<p>а</p>', 'а')
+        s.save()
+        s.close()
+        with open(s.journal_file, 'r+b') as f:
+            f.truncate(3)
+        resumed = self.session()
+        with self.assertRaises(ValueError):
+            resumed.load()
+        self.assertEqual(resumed.data['processed_index'], 0)
+        self.assertFalse(os.path.exists(s.journal_file))
+
+    def test_old_format_is_moved_to_the_journal(self):
+        with open(Session(self.book).file, 'w', encoding='utf-8') as f:
+            json.dump({'processed_index': 2, 'replace_all_choices': {}, 'html_contents': ['<yorz class="x">ёж</yorz>', 'еж']}, f)
+        s = self.session()
+        self.assertEqual(s.load()['processed_index'], 2)
+        self.assertEqual(list(s.records()), [('<span class="x">ёж</span>', 'ёж'), ('еж', 'еж')])
+
+    def test_sync_only_when_asked(self):
+        s = self.session()
+        s.append('<p>а</p>', 'а')
+        with mock.patch('os.fsync') as fsync:
+            s.save()
+            self.assertEqual(fsync.call_count, 0)
+            self.assertFalse(s.due())
+            s.save(sync=True)
+            self.assertEqual(fsync.call_count, 2)
+        s.discard()
+        self.assertFalse(s.exists())
+        self.assertFalse(os.path.exists(s.journal_file))
+
+# Процесс отвечает «2» на первые вопросы об омографах и на вопросе номер stop
+# падает без сохранения (как при снятии задачи или отключении питания)
+KILL_SCRIPT = '''
+import os, sys, io, builtins, contextlib
+from modules import paths, yorz
+paths.ensure_user_data_exists()
+stop, asked = int(sys.argv[2]), []
+def answer(prompt=''):
+    asked.append(prompt)
+    if len(asked) == stop: os._exit(9)
+    return '2'
+builtins.input = answer
+with contextlib.redirect_stdout(io.StringIO()):
+    yorz.replace_expressions(input_file=sys.argv[1], app_version='2.1.2', orange_mode='interactive', resume=False)
+'''
+
+class DecisionCheckpointTest(unittest.TestCase):
+    def test_answers_do_not_sync_to_disk(self):
+        # Решения по омографам записываются без os.fsync: на диск сбрасывают только
+        # контрольные точки по таймеру и при прерывании
+        path = os.path.join(work_dir(self, ('book.txt',)), 'book.txt')
+        with mock.patch('builtins.input', return_value='2'), \
+                mock.patch('os.fsync') as fsync, mock.patch('os.replace', wraps=os.replace) as replace:
+            self.assertTrue(yofy(path, orange_mode='interactive'))
+        self.assertEqual(fsync.call_count, 0)
+        # Заголовок сессии переписывался после каждого из четырёх решений
+        self.assertTrue(replace.call_count >= 4)
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+
+    def test_answers_survive_a_crash_at_the_next_question(self):
+        # Два быстрых ответа, затем сбой на третьем вопросе: после продолжения
+        # спрашиваются только третий и четвёртый омографы книги
+        path = os.path.join(work_dir(self, ('book.txt',)), 'book.txt')
+        killed = subprocess.run([sys.executable, '-c', KILL_SCRIPT, path, '3'], cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(killed.returncode, 9, killed.stderr)
+        self.assertTrue(Session(path).exists())
+        prompts = []
+        def answer(prompt=''):
+            prompts.append(prompt)
+            return '2'
+        with mock.patch('builtins.input', answer):
+            self.assertTrue(yofy(path, orange_mode='interactive', resume=True))
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(read_output(output_path(path)), expected('yo', 'book.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
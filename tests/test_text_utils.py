@@ -0,0 +1,26 @@
+import unicodedata
+import unittest
+from modules import text_utils
+from modules.text_utils import remove_diacritics
+
+class MarkRangesTest(unittest.TestCase):
+    def test_shipped_ranges_match_unicodedata(self):
+        if unicodedata.unidata_version != text_utils._MN_UNIDATA_VERSION:
+            self.skipTest(f"Unicode {unicodedata.unidata_version}: таблица не используется")
+        self.assertEqual(text_utils._mark_ranges(), text_utils._scan_mark_ranges())
+
+class RemoveDiacriticsTest(unittest.TestCase):
+    def test_keeps_yo_and_short_i(self):
+        self.assertEqual(remove_diacritics('Ёлка́ и йо́гурт'), 'Ёлка и йогурт')
+        self.assertEqual(remove_diacritics('ё́ж'), 'ё́ж')
+
+    def test_strips_other_marks(self):
+        self.assertEqual(remove_diacritics('заме́на ка́фе café'), 'замена кафе cafe')
+        self.assertEqual(remove_diacritics('a\U0001D167b'), 'ab')
+
+    def test_ascii_is_returned_as_is(self):
+        text = 'plain text'
+        self.assertIs(remove_diacritics(text), text)
+
+if __name__ == '__main__':
+    unittest.main()
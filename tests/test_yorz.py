@@ -0,0 +1,245 @@
+import os
+import re
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from modules import paths
+from modules.paragraph import Paragraph, WORD_RE
+from modules.yorz import ExceptionMatcher, remove_diacritics, preserve_case, transfer_case, load_yo_variants, \
+    load_dict_with_exceptions, apply_replacements, RuleSet, load_dictionaries, has_e, literals_need_e, rule_literals, \
+    apply_blue_green, replace_yo_in_text, process_yo_variants
+from tests.support import DATA_DIR
+
+class ExceptionMatcherTest(unittest.TestCase):
+    EXCEPTIONS = ['все', 'все же', 'ещ\\w*', 'на\\w+ся', 'ёлк']
+
+    def test_literals_go_to_the_set(self):
+        matcher = ExceptionMatcher(self.EXCEPTIONS)
+        self.assertEqual(matcher.literals, frozenset({'все', 'все же', 'ёлк'}))
+        self.assertEqual(len(matcher.patterns), 2)
+        self.assertEqual(matcher.max_words, 2)
+        self.assertFalse(ExceptionMatcher(()))
+        self.assertFalse(ExceptionMatcher(()).matches('все'))
+
+    def test_whole_words_only(self):
+        matcher = ExceptionMatcher(self.EXCEPTIONS)
+        self.assertTrue(matcher.matches('Все'))
+        self.assertTrue(matcher.matches('вот все же так'))
+        self.assertTrue(matcher.matches('вс́е'))
+        self.assertTrue(matcher.matches('ещё'))
+        self.assertTrue(matcher.matches('научился'))
+        self.assertFalse(matcher.matches('всем'))
+        self.assertFalse(matcher.matches('всеже'))
+        self.assertFalse(matcher.matches('ёлка'))
+
+    def test_same_as_regex_exceptions(self):
+        # Прежний способ: каждое исключение — \b...\b по тексту без ударений
+        exceptions = self.EXCEPTIONS + ['же все', 'се', 'ёж ']
+        texts = ['все', 'Все же', 'всё же', 'же все же', 'всем', 'весь', 'ещё бы', 'напился', 'наш ся',
+                 'ёлк-палк', 'ЁЛК', 'се', 'сев', 'ёж', 'еж', 'же  все', 'же\nвсе', 'вс́е же']
+        matcher = ExceptionMatcher(exceptions)
+        compiled = []
+        for exc in exceptions:
+            exc = re.sub(r'\\(w[\*\+])', r'\\\1', exc.strip())
+            compiled.append(re.compile(fr'\b{exc}\b', re.I))
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(matcher.matches(text), any(exc.search(remove_diacritics(text)) for exc in compiled))
+
+def reference_case(original_text, replacement):
+    """Перенос регистра до запоминания результатов (для сравнения)."""
+    original_words = re.findall(r'\w+|\W+', original_text)
+    replacement_words = re.findall(r'\w+|\W+', replacement)
+    if len(original_words) == len(replacement_words):
+        result = []
+        for orig_word, repl_word in zip(original_words, replacement_words):
+            if not any(c.isalpha() for c in orig_word) or not any(c.isalpha() for c in repl_word): result.append(repl_word)
+            elif orig_word.isupper(): result.append(repl_word.upper())
+            elif orig_word.istitle(): result.append(repl_word.title())
+            else: result.append(repl_word.lower())
+        return ''.join(result)
+    alpha_orig = [w for w in original_words if any(c.isalpha() for c in w)]
+    if not alpha_orig: return replacement
+    if original_text.isupper(): return replacement.upper()
+    if alpha_orig[0].istitle() or alpha_orig[0].isupper():
+        if not replacement: return replacement
+        match_alpha = re.search(r'[a-zA-Zа-яА-ЯёЁ]', replacement)
+        idx = match_alpha.start() if match_alpha else 0
+        return replacement[:idx] + replacement[idx].upper() + replacement[idx+1:].lower()
+    return replacement.lower()
+
+class PreserveCaseTest(unittest.TestCase):
+    def test_examples(self):
+        match = re.fullmatch(r'\w+', 'Еж')
+        self.assertEqual(preserve_case(match, 'ёж'), 'Ёж')
+        self.assertEqual(transfer_case('ЕЖ', 'ёж'), 'ЁЖ')
+        self.assertEqual(transfer_case('все же', 'всё же'), 'всё же')
+        self.assertEqual(transfer_case('Все ЖЕ', 'всё же'), 'Всё ЖЕ')
+        self.assertEqual(transfer_case('Яркозеленой', 'ярко-зелёной'), 'Ярко-зелёной')
+        self.assertEqual(transfer_case('ЯРКОЗЕЛЕНОЙ', 'ярко-зелёной'), 'ЯРКО-ЗЕЛЁНОЙ')
+        self.assertEqual(transfer_case('яркозеленой', 'Ярко-Зелёной'), 'ярко-зелёной')
+        self.assertEqual(transfer_case('12', 'ab'), 'ab')
+
+    def test_same_as_without_memoization(self):
+        rnd = random.Random(1)
+        letters = 'еЕёЁжЖaAßǅﬁ-  1'
+        mismatches = []
+        for _ in range(3000):
+            original = ''.join(rnd.choice(letters) for _ in range(rnd.randint(0, 6)))
+            replacement = ''.join(rnd.choice(letters) for _ in range(rnd.randint(0, 6)))
+            if transfer_case(original, replacement) != reference_case(original, replacement):
+                mismatches.append((original, replacement))
+        self.assertEqual(mismatches, [])
+
+class OrangeIndexTest(unittest.TestCase):
+    def check(self, variants, words):
+        """Кандидаты из индекса дают те же совпадения и в том же порядке, что и перебор всех правил."""
+        mismatches = []
+        for word in words:
+            found = [pattern.pattern for pattern in variants.candidates(word) if pattern.fullmatch(word)]
+            if found != [pattern.pattern for pattern in variants if pattern.fullmatch(word)]: mismatches.append(word)
+        self.assertEqual(mismatches, [])
+
+    def test_literal_prefix_and_suffix_rules(self):
+        work = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, work, ignore_errors=True)
+        dic = os.path.join(work, 'orange.dic')
+        with open(dic, 'w', encoding='utf-8') as f:
+            f.write('# омографы\nвсе|всё\nберезовск\\w*|берёзовск\\w*\n\\w*ведра|\\w*вёдра\n\\w+ё\\w*|\\w+е\\w*\nвесла|вёсла\n')
+        variants = load_yo_variants(dic)
+        originals = lambda rules: [variants[pattern]['original'] for pattern in rules]
+        self.assertEqual(originals(variants), ['все', 'березовск\\w*', '\\w*ведра', '\\w+ё\\w*', 'весла'])
+        # Правило без литерального начала и конца проверяется для любого слова
+        self.assertEqual(originals(variants.candidates('Всем')), ['\\w+ё\\w*'])
+        self.assertEqual(originals(variants.candidates('ВСЕ')), ['все', '\\w+ё\\w*'])
+        self.assertEqual(originals(variants.candidates('березовская')), ['березовск\\w*', '\\w+ё\\w*'])
+        self.assertEqual(originals(variants.candidates('Доведра')), ['\\w*ведра', '\\w+ё\\w*'])
+        self.check(variants, ['Все', 'всем', 'Березовская', 'березовск', 'ведра', 'Доведра', 'весла', 'ёлка', 'İ'])
+
+    def test_shipped_dictionary(self):
+        variants = load_yo_variants(paths.get_path("dictionaries/orange.dic"))
+        words = set()
+        with open(os.path.join(DATA_DIR, 'book.txt'), encoding='utf-8') as f:
+            words.update(WORD_RE.findall(f.read()))
+        for data in variants.values():
+            for literal in re.split(r'\\w[\*\+]', data['original']):
+                if literal: words.update((literal, literal.upper(), literal.title(), 'по' + literal, literal + 'ми'))
+        self.check(variants, sorted(words))
+
+GREEN_DIC = """# зелёный словарь
+еще|ещё
+черн\\w*|чёрн\\w* (черника:черн\\w*ка)
+\\w*зелен\\w*|\\w*зелён\\w*
+все равно|всё равно
+"""
+
+class RuleSetTest(unittest.TestCase):
+    TEXT = 'Еще черные ели, ЧЕРНИКА и черничка; ярко-зеленый — все  равно еще.'
+    RESULT = 'Ещё чёрные ели, ЧЕРНИКА и черничка; ярко-зелёный — всё равно ещё.'
+
+    def load(self):
+        work = tempfile.mkdtemp(prefix='yorz_test_')
+        self.addCleanup(shutil.rmtree, work, ignore_errors=True)
+        dic = os.path.join(work, 'green.dic')
+        with open(dic, 'w', encoding='utf-8') as f:
+            f.write(GREEN_DIC)
+        return load_dict_with_exceptions(dic)
+
+    def test_rules_are_built_at_load(self):
+        rules = self.load()
+        self.assertIsInstance(rules, RuleSet)
+        self.assertEqual([(rule.original, rule.replacement, rule.template) for rule in rules], [
+            ('еще', 'ещё', False), ('черн\\w*', 'чёрн\\1', True), ('\\w*зелен\\w*', '\\1зелён\\2', True), ('все равно', 'всё равно', False)])
+
+    def test_apply(self):
+        rules = self.load()
+        paragraph = apply_replacements(Paragraph(self.TEXT), rules, 'highlight-green')
+        self.assertEqual(paragraph.render_clean(), self.RESULT)
+        self.assertEqual([span.rule for span in paragraph.spans], ['еще', 'черн\\w*', '\\w*зелен\\w*', 'все равно', 'еще'])
+        # Словарь из кэша и словарь в прежнем виде {ключ: данные} дают то же самое
+        cached = pickle.loads(pickle.dumps(rules))
+        self.assertEqual(apply_replacements(Paragraph(self.TEXT), cached, 'highlight-green').render_html(), paragraph.render_html())
+        plain = {rule.original: {'replacement': replacement, 'exceptions': rule.exceptions}
+                 for rule, replacement in zip(rules, ('ещё', 'чёрн\\w*', '\\w*зелён\\w*', 'всё равно'))}
+        self.assertEqual(apply_replacements(Paragraph(self.TEXT), plain, 'highlight-green').render_html(), paragraph.render_html())
+
+class AnchorPrefilterTest(unittest.TestCase):
+    def paragraphs(self, rules):
+        """Абзацы книги и абзацы из ключей словарей в разном регистре (с «е» и без неё)."""
+        with open(os.path.join(DATA_DIR, 'book.txt'), encoding='utf-8') as f:
+            result = [line for line in f.read().split('\n') if line.strip()]
+        rnd = random.Random(1)
+        keys = [re.sub(r'\\w[\*\+]', 'ов', rule.original) for rule in rules]
+        for _ in range(200):
+            words = [rnd.choice(keys) for _ in range(rnd.randint(1, 8))]
+            words = [w.upper() if rnd.random() < 0.2 else (w.title() if rnd.random() < 0.3 else w) for w in words]
+            result.append(' '.join(words) + '.')
+        result.append('Дом, где нет такой буквы.')
+        return result
+
+    def test_same_as_running_every_rule(self):
+        _, _, blue, green = load_dictionaries()
+        for name, rules in (('blue', blue), ('green', green)):
+            mismatches = []
+            for text in self.paragraphs(rules):
+                filtered = apply_replacements(Paragraph(text), rules, 'highlight-' + name).render_html()
+                with mock.patch.object(RuleSet, 'candidates', lambda self, text: self.rules):
+                    full = apply_replacements(Paragraph(text), rules, 'highlight-' + name).render_html()
+                if filtered != full: mismatches.append(text)
+            with self.subTest(dictionary=name):
+                self.assertEqual(mismatches, [])
+
+    def test_candidates_keep_dictionary_order(self):
+        rules = RuleSet({'все\\w*': {'replacement': 'всё\\w*', 'exceptions': ExceptionMatcher(())},
+                         'еще': {'replacement': 'ещё', 'exceptions': ExceptionMatcher(())},
+                         '\\w+': {'replacement': '\\w+', 'exceptions': ExceptionMatcher(())},
+                         'черн\\w*': {'replacement': 'чёрн\\w*', 'exceptions': ExceptionMatcher(())}})
+        self.assertEqual([rule.original for rule in rules.candidates('ЕЩЕ черные, ВСЕ')], ['все\\w*', 'еще', '\\w+', 'черн\\w*'])
+        self.assertEqual([rule.original for rule in rules.candidates('еще')], ['еще', '\\w+'])
+
+class SkipWithoutETest(unittest.TestCase):
+    TEXTS = ['Дом был далёк, и мы шли молча.', 'ЁЛКИ И ЗВЁЗДЫ НАД РЕКОЙ', 'ЕЩЕ ЧЕРНЫЕ ЕЛИ', 'Мы шли: Все равно!',
+             '#### А|а ###', 'Ёж, ёлка, мёд; а весла — у лодки.']
+
+    def test_predicates(self):
+        self.assertTrue(has_e('ЕЖ'))
+        self.assertTrue(has_e('где'))
+        self.assertFalse(has_e('ёлка и мёд'))
+        self.assertTrue(literals_need_e(['черн', 'ЕЖ']))
+        self.assertFalse(literals_need_e(['#### А']))
+        self.assertFalse(literals_need_e([]))
+
+    def test_shipped_dictionaries(self):
+        yo_dict, yo_variants, blue, green = load_dictionaries()
+        self.assertTrue(yo_dict.needs_e)
+        self.assertTrue(yo_variants.needs_e)
+        for rules in (blue, green):
+            self.assertEqual([rules.rules[idx].original for _, idx in rules.e_free],
+                             [rule.original for rule in rules if not literals_need_e(rule_literals(rule.original))])
+
+    def run_stages(self, text, dictionaries):
+        yo_dict, yo_variants, blue, green = dictionaries
+        paragraph = apply_blue_green(text, blue, green)
+        found = []
+        process_yo_variants(paragraph, yo_variants, {}, collect=found.append)
+        yo_dict.reset_vocabulary()
+        replace_yo_in_text(paragraph, yo_dict)
+        return paragraph.render_html(), [(c.start, c.end, c.rule) for c in found]
+
+    def test_same_as_checking_every_word(self):
+        dictionaries = load_dictionaries()
+        yo_dict, yo_variants, _, _ = dictionaries
+        with open(os.path.join(DATA_DIR, 'book.txt'), encoding='utf-8') as f:
+            texts = self.TEXTS + [line for line in f.read().split('\n') if line.strip()]
+        for text in texts:
+            with self.subTest(text=text):
+                skipped = self.run_stages(text, dictionaries)
+                with mock.patch.object(yo_dict, 'needs_e', False), mock.patch.object(yo_variants, 'needs_e', False), \
+                        mock.patch.object(RuleSet, 'candidates', lambda self, text: self.rules):
+                    self.assertEqual(skipped, self.run_stages(text, dictionaries))
+
+if __name__ == '__main__':
+    unittest.main()